@@ -0,0 +1,418 @@
+import os
+import time
+import math
+import datetime
+import calendar
+import sqlite3
+import argparse
+from exchange_connection import MockExchangeConnection
+from debug_recorder import DebugRecorder
+
+"""
+	Backtest of the strategy logics on the recorded MtGox trades.
+	The trades are streamed from the sqlite database in time order,
+	in batches, so replaying a month of data runs in constant memory.
+	The strategy logic trades against a MockExchangeConnection.
+	If the columnar cache of the database was built with trade_cache.py
+	and is up to date, the trades are read from it instead of sqlite.
+
+	Several strategy logics, or variants of one with other constants, can
+	be backtested at once: the trades are read once and every trade is fed
+	to all of them, each trading against its own MockExchangeConnection.
+
+	The results are kept in a cache next to the database (result_cache.py),
+	a backtest run again on the same trades returns at once.
+
+	With --bar seconds, the trades are compressed into bars before they are
+	fed to the strategy logics: one price (the last one) and one volume (the
+	sum) per bar. This is much faster and approximate, bar_replay.py reports
+	how far it is from the replay of every trade.
+
+	With --features, the moving averages of the price are read from the
+	feature store built by feature_store.py instead of being computed.
+
+	Usage:
+		python backtest.py simple_trend_follower --from "2013 Nov 1 00:00" --to "2013 Nov 30 00:00"
+		python backtest.py simple_mean_reversion -p MinimumSpreadBuy=0.04 -p Price_Fast_EMA_Time=300
+		python backtest.py trailing_stoploss simple_trend_follower simple_mean_reversion:MinimumSpreadBuy=0.04,MinimumSpreadSell=0.01
+"""
+
+# Strategy name: (module, class)
+STRATEGIES = {
+	"simple_trend_follower": ("strategy_logic_simple_trend_follower", "StrategyLogicSimpleTrendFollower"),
+	"simple_mean_reversion": ("strategy_logic_simple_mean_reversion", "StrategyLogicSimpleMeanReversion"),
+	"volume_trend_follower": ("strategy_logic_volume_trend_follower", "StrategyLogicVolumeTrendFollower"),
+	"trailing_stoploss": ("strategy_logic_trailing_stoploss", "StrategyLogicTrailingStoploss"),
+}
+
+DATE_FORMAT = "%Y %b %d %H:%M"
+
+# Rows fetched from sqlite at once
+BATCH_SIZE = 10000
+
+# The warm-up of the indicators starts and ends at multiples of this many seconds (UTC midnight)
+WARMUP_INTERVAL = 86400
+
+def loadStrategy(name):
+	if (name not in STRATEGIES):
+		raise ValueError("Unknown strategy " + name + ", known strategies: " + ", ".join(sorted(STRATEGIES.keys())))
+	(module_name, class_name) = STRATEGIES[name]
+	module = __import__(module_name)
+	return getattr(module, class_name)
+
+# Create a strategy logic for backtesting, with params (name: value) overriding
+# its constants. The indicators are recreated, so the time windows can be changed too.
+# Unless keep_debug_data is set, only the last value of every debug series is kept,
+# otherwise every decimation-th one.
+def createStrategy(name, xcon, params = None, keep_debug_data = False, decimation = 1):
+	cls = loadStrategy(name)
+	score = cls(xcon, debug = True)
+	if (params):
+		for (param, value) in params.items():
+			if (not hasattr(score, param)):
+				raise ValueError(cls.__name__ + " has no parameter " + param)
+			setattr(score, param, value)
+		score.CreateIndicators()
+	if (keep_debug_data):
+		score._debugData = DebugRecorder(decimation)
+	else:
+		score._debugData = DebugRecorder(maxlen = 1)
+	return score
+
+# Yields (date, price, volume) of the trades from date_from up to date_to, ordered by date.
+# The range includes date_from but not date_to, so that consecutive ranges get every trade once.
+def streamTrades(sqliteDataFile, date_from, date_to, currency = "USD", batch_size = BATCH_SIZE):
+	db = sqlite3.connect(sqliteDataFile)
+	try:
+		cursor = db.cursor()
+		cursor.execute("select date,price,amount from trades where date>=? and date<? and currency=? order by date,tid", (date_from, date_to, currency))
+		while True:
+			rows = cursor.fetchmany(batch_size)
+			if (not rows):
+				break
+			for row in rows:
+				yield (float(row[0]), float(row[1]), float(row[2]))
+		cursor.close()
+	finally:
+		db.close()
+
+# Yields (date, close price, summed volume) of bars of seconds: the trades are
+# grouped by multiples of seconds (UTC), the date and the price of a bar are
+# the ones of its last trade, the volume the sum of the volumes of its trades
+def compressTrades(trades, seconds):
+	bar = None
+	for (date, price, volume) in trades:
+		current = math.floor(date / seconds)
+		if (current != bar):
+			if (bar != None):
+				yield (last_date, close, total)
+			bar = current
+			total = 0.0
+		last_date = date
+		close = price
+		total += volume
+	if (bar != None):
+		yield (last_date, close, total)
+
+# Yields (date, price, volume) of the trades between date_from and date_to,
+# from the columnar cache when it is up to date, from sqlite otherwise.
+# With bar seconds, yields bars of the trades instead, see compressTrades().
+def loadTrades(sqliteDataFile, date_from, date_to, currency = "USD", use_cache = True, bar = 0):
+	if (use_cache):
+		try:
+			import trade_cache
+			cache = trade_cache.openCache(sqliteDataFile, currency)
+		except ImportError:
+			# The cache needs NumPy
+			cache = None
+		if (cache != None):
+			if (bar > 0):
+				(dates, closes, volumes) = cache.Bars(date_from, date_to, bar)
+				return iter(zip(dates.tolist(), closes.tolist(), volumes.tolist()))
+			return cache.Trades(date_from, date_to)
+	if (bar > 0):
+		return compressTrades(streamTrades(sqliteDataFile, date_from, date_to, currency), bar)
+	return streamTrades(sqliteDataFile, date_from, date_to, currency)
+
+# Feed the trades to the strategy logic, returns (number of trades, first date, last date)
+def replayTrades(score, trades):
+	count = 0
+	date_from = 9999999999999
+	date_to = 0
+	xcon = score.xcon
+	updateVolume = getattr(score, "UpdateVolume", None)
+
+	for (date, price, volume) in trades:
+		if (count == 0):
+			date_from = date
+		count += 1
+		xcon.SetBTCPrice(price, date)
+		score.UpdatePrice({"now":date, "value":price})
+		if (updateVolume != None):
+			updateVolume({"now":date, "value":volume, "price":price})
+		score.Act()
+		date_to = date
+
+	return (count, date_from, date_to)
+
+# Feed every trade to all the strategy logics, each one trading against its own exchange connection.
+# Returns (number of trades, first date, last date)
+def replayTradesMany(scores, trades):
+	count = 0
+	date_from = 9999999999999
+	date_to = 0
+	fanout = [(score.xcon, score, getattr(score, "UpdateVolume", None)) for score in scores]
+
+	for (date, price, volume) in trades:
+		if (count == 0):
+			date_from = date
+		count += 1
+		price_data = {"now":date, "value":price}
+		volume_data = {"now":date, "value":volume, "price":price}
+		for (xcon, score, updateVolume) in fanout:
+			xcon.SetBTCPrice(price, date)
+			score.UpdatePrice(price_data)
+			if (updateVolume != None):
+				updateVolume(volume_data)
+			score.Act()
+		date_to = date
+
+	return (count, date_from, date_to)
+
+# Feed the trades to the indicators of the strategy logic, without acting
+def feedIndicators(score, trades):
+	updateVolume = getattr(score, "UpdateVolume", None)
+	for (date, price, volume) in trades:
+		score.UpdatePrice({"now":date, "value":price})
+		if (updateVolume != None):
+			updateVolume({"now":date, "value":volume, "price":price})
+
+# Warm up the indicators of the strategy logic before date_from, so that it can act from the first trade.
+# The trades from warmup seconds before the last interval boundary up to that boundary
+# are replayed, then the ones from the boundary to date_from. Like every range of trades,
+# both include their start and not their end: the trades at the boundary are fed once,
+# and the ones at date_from are left to the backtest.
+# With checkpoints (a checkpoint.IndicatorCheckpoints), the state of the indicators
+# at the boundary is restored if a backtest with the same indicators saved it, and saved otherwise.
+def warmUp(score, sqliteDataFile, date_from, warmup, currency = "USD", use_cache = True, checkpoints = None, interval = WARMUP_INTERVAL):
+	boundary = math.floor(date_from / interval) * interval
+	warm_from = boundary - warmup
+	key = None
+	if (checkpoints != None):
+		key = checkpoints.Key(score, sqliteDataFile, currency, warm_from, boundary)
+	if (key == None or not checkpoints.Restore(score, key)):
+		feedIndicators(score, loadTrades(sqliteDataFile, warm_from, boundary, currency, use_cache))
+		if (key != None):
+			checkpoints.Save(score, key)
+	feedIndicators(score, loadTrades(sqliteDataFile, boundary, date_from, currency, use_cache))
+
+# Feed the recorded trades to the strategy logic, returns the dates of the first and the last trade
+def feedRecordedData(score, sqliteDataFile, date_from, date_to, currency = "USD"):
+	(count, actual_date_from, actual_date_to) = replayTrades(score, loadTrades(sqliteDataFile, date_from, date_to, currency))
+	return (actual_date_from, actual_date_to)
+
+# Replay the recorded trades and measure the throughput and the outcome.
+# With warmup seconds, the indicators are warmed up first, see warmUp().
+# With results (a result_cache.ResultCache), a backtest already run on the same
+# trades is read from it instead, and a new one is saved into it.
+# With bar seconds, bars of the trades are replayed instead of the trades (not during the warm-up).
+# With features (a feature_store.FeatureStore), the stored indicators of the strategy
+# logic read their values from it after the warm-up.
+def runBacktest(score, sqliteDataFile, date_from, date_to, currency = "USD", use_cache = True, warmup = 0, checkpoints = None, results = None, bar = 0, features = None):
+	return runBacktests([score], sqliteDataFile, date_from, date_to, currency, use_cache, warmup, checkpoints, results, bar, features)[0]
+
+# Replay the recorded trades once for all the strategy logics, returns the list of their results.
+# The time is the one of the whole replay. The strategy logics found in results are not replayed.
+def runBacktests(scores, sqliteDataFile, date_from, date_to, currency = "USD", use_cache = True, warmup = 0, checkpoints = None, results = None, bar = 0, features = None):
+	if (features != None and bar > 0):
+		raise ValueError("the stored features are computed over every trade, not over bars")
+	cached = [None] * len(scores)
+	keys = [None] * len(scores)
+	if (results != None):
+		# The key depends on the constants, it is computed before the warm-up updates the strategy logic
+		keys = resultKeys(results, scores, sqliteDataFile, date_from, date_to, currency, warmup, bar, features != None)
+		cached = [results.Load(score, key) for (score, key) in zip(scores, keys)]
+	replayed = [score for (score, result) in zip(scores, cached) if result == None]
+	if (len(replayed) == 0):
+		return cached
+
+	started = time.time()
+	if (warmup > 0):
+		for score in replayed:
+			warmUp(score, sqliteDataFile, date_from, warmup, currency, use_cache, checkpoints)
+	if (features != None):
+		for score in replayed:
+			features.Attach(score)
+	trades = loadTrades(sqliteDataFile, date_from, date_to, currency, use_cache, bar)
+	if (len(replayed) == 1):
+		(count, actual_date_from, actual_date_to) = replayTrades(replayed[0], trades)
+	else:
+		(count, actual_date_from, actual_date_to) = replayTradesMany(replayed, trades)
+	elapsed = time.time() - started
+	for i in range(len(scores)):
+		if (cached[i] == None):
+			cached[i] = backtestResult(scores[i], count, actual_date_from, actual_date_to, elapsed)
+			cached[i]["bar"] = bar
+			if (results != None):
+				results.Save(scores[i], keys[i], cached[i])
+	return cached
+
+# Keys of the backtests of the strategy logics in the result cache,
+# given the trades of the range and of the warm-up before it
+def resultKeys(results, scores, sqliteDataFile, date_from, date_to, currency = "USD", warmup = 0, bar = 0, features = False):
+	from result_cache import dataFingerprint
+	data_from = date_from
+	if (warmup > 0):
+		data_from = math.floor(date_from / WARMUP_INTERVAL) * WARMUP_INTERVAL - warmup
+	fingerprint = dataFingerprint(sqliteDataFile, data_from, date_to, currency)
+	return [results.Key(score, fingerprint, date_from, date_to, currency, warmup, bar, features) for score in scores]
+
+def backtestResult(score, count, date_from, date_to, elapsed):
+	xcon = score.xcon
+	result = {}
+	result["trades"] = count
+	result["seconds"] = elapsed
+	result["trades_per_second"] = count / elapsed if elapsed > 0 else 0.0
+	result["date_from"] = date_from
+	result["date_to"] = date_to
+	result["btc"] = xcon.AvailableBTC()
+	result["usd"] = xcon.AvailableUSD()
+	result["equity"] = xcon.Equity()
+	result["orders"] = xcon.orders
+	result["max_drawdown"] = xcon.maxDrawdown
+	return result
+
+def parseDate(text):
+	tmp = datetime.datetime.strptime(text, DATE_FORMAT)
+	return float(calendar.timegm(tmp.utctimetuple()))
+
+# "Name=value" to (name, value), the value is a number if possible
+def parseParam(text):
+	if ("=" not in text):
+		raise argparse.ArgumentTypeError("expected Name=value, got " + text)
+	(name, value) = text.split("=", 1)
+	for convert in (int, float):
+		try:
+			return (name, convert(value))
+		except ValueError:
+			pass
+	return (name, value)
+
+# "name" or "name:Name=value,Name=value" to (name, {name: value})
+def parseStrategy(text):
+	(name, params) = (text.split(":", 1) + [""])[:2]
+	if (name not in STRATEGIES):
+		raise argparse.ArgumentTypeError("unknown strategy " + name + ", known strategies: " + ", ".join(sorted(STRATEGIES.keys())))
+	return (name, dict([parseParam(param) for param in params.split(",") if param != ""]))
+
+# The result cache of a database, in directory or next to the database, None if not enabled
+def createResultCache(sqliteDataFile, directory = None, enabled = True):
+	if (not enabled):
+		return None
+	import result_cache
+	if (directory == None):
+		directory = result_cache.resultDirectory(sqliteDataFile)
+	return result_cache.ResultCache(directory)
+
+# The warm-up checkpoints of a database, in directory or next to the database, None if not enabled
+def createCheckpoints(sqliteDataFile, directory = None, enabled = True):
+	if (not enabled):
+		return None
+	import checkpoint
+	if (directory == None):
+		directory = checkpoint.checkpointDirectory(sqliteDataFile)
+	return checkpoint.IndicatorCheckpoints(directory)
+
+# What a result counts in "trades": trades, or bars of trades
+def replayedUnit(result):
+	if (result.get("bar", 0) > 0):
+		return "bars of " + ("%g" % result["bar"]) + "s"
+	return "trades"
+
+def printResult(result):
+	print "Simulation from: " + str(datetime.datetime.fromtimestamp(result["date_from"])) + " to " + str(datetime.datetime.fromtimestamp(result["date_to"]))
+	print "Replayed " + str(result["trades"]) + " " + replayedUnit(result) + " in " + ("%.1f" % result["seconds"]) + "s, " + ("%.0f" % result["trades_per_second"]) + " " + replayedUnit(result).split()[0] + "/s" + (" (cached)" if result.get("cached") else "")
+	print "Orders: " + str(result["orders"]) + " max drawdown: " + ("%.2f" % (result["max_drawdown"] * 100)) + "%"
+	print "Total funds. BTC: " + str(result["btc"]) + " USD: " + str(result["usd"]) + " Convert to USD: " + str(result["equity"])
+
+# Results of several strategy logics side by side, a row per strategy logic
+def printResults(names, results):
+	width = max([len(name) for name in names] + [len("Strategy")])
+	print "Simulation from: " + str(datetime.datetime.fromtimestamp(results[0]["date_from"])) + " to " + str(datetime.datetime.fromtimestamp(results[0]["date_to"]))
+	replayed = [result for result in results if not result.get("cached")]
+	if (len(replayed) > 0):
+		print "Replayed " + str(replayed[0]["trades"]) + " " + replayedUnit(replayed[0]) + " for " + str(len(replayed)) + " strategies in " + ("%.1f" % replayed[0]["seconds"]) + "s, " + ("%.0f" % replayed[0]["trades_per_second"]) + " " + replayedUnit(replayed[0]).split()[0] + "/s"
+	print "%-*s %8s %13s %14s %14s %14s" % (width, "Strategy", "Orders", "Max drawdown", "BTC", "USD", "Equity USD")
+	for (name, result) in zip(names, results):
+		print "%-*s %8d %12.2f%% %14.8f %14.5f %14.5f" % (width, name, result["orders"], result["max_drawdown"] * 100, result["btc"], result["usd"], result["equity"])
+
+def main():
+	parser = argparse.ArgumentParser(description = "Backtest strategy logics on the recorded MtGox trades")
+	parser.add_argument('strategies', nargs = "+", type = parseStrategy, metavar = "strategy", help = "one of " + ", ".join(sorted(STRATEGIES.keys())) + ", optionally followed by :Name=value,Name=value")
+	parser.add_argument('-f', '--from', dest = "date_from", default = "2013 Nov 1 00:00", help = "start date, e.g. \"2013 Nov 1 00:00\" (UTC)")
+	parser.add_argument('-t', '--to', dest = "date_to", default = "2013 Nov 30 00:00", help = "end date (UTC)")
+	parser.add_argument('-p', '--param', action = "append", type = parseParam, default = [], help = "override a constant of the strategy logics, Name=value")
+	parser.add_argument('-d', '--database', default = "mtgoxdata/mtgox.sqlite3")
+	parser.add_argument('-c', '--currency', default = "USD")
+	parser.add_argument('--no-cache', dest = "use_cache", action = "store_false", help = "read the trades from sqlite even if the cache is up to date")
+	parser.add_argument('--plot', action = "store_true", help = "keep the debug data and plot it after the replay")
+	parser.add_argument('--debug-output', default = None, help = "keep the debug data and save it into this directory, one per strategy if there are several")
+	parser.add_argument('--decimation', type = int, default = 1, help = "keep only every n-th datapoint of the debug series")
+	parser.add_argument('-w', '--warmup', type = float, default = 0, help = "hours of trades before the start date to warm up the indicators with")
+	parser.add_argument('--checkpoints', default = None, help = "directory of the warm-up checkpoints, next to the database by default")
+	parser.add_argument('--no-checkpoints', dest = "use_checkpoints", action = "store_false", help = "always replay the warm-up")
+	parser.add_argument('-b', '--bar', type = float, default = 0, help = "replay bars of this many seconds instead of every trade")
+	parser.add_argument('--features', action = "store_true", help = "read the moving averages of the price from the feature store (feature_store.py)")
+	parser.add_argument('--results', default = None, help = "directory of the result cache, next to the database by default")
+	parser.add_argument('--no-results', dest = "use_results", action = "store_false", help = "always run the backtests, without reading or saving results")
+	parser.add_argument('-m', '--metrics', action = "store_true", help = "print the return, Sharpe ratio, drawdown and exposure of the equity curves (needs NumPy)")
+	args = parser.parse_args()
+
+	checkpoints = createCheckpoints(args.database, args.checkpoints, args.use_checkpoints and args.warmup > 0)
+	results = createResultCache(args.database, args.results, args.use_results)
+	features = None
+	if (args.features):
+		if (args.bar > 0):
+			parser.error("the stored features can not be replayed in bars")
+		import feature_store
+		features = feature_store.openFeatures(args.database, args.currency)
+		if (features == None):
+			parser.error("the feature store is missing or out of date, run: python feature_store.py " + args.database)
+	names = []
+	scores = []
+	for (name, params) in args.strategies:
+		params = dict(args.param, **params)
+		names.append(name + "".join([" " + param + "=" + str(params[param]) for param in sorted(params.keys())]))
+		scores.append(createStrategy(name, MockExchangeConnection(), params, args.plot or args.debug_output != None, args.decimation))
+
+	date_from = parseDate(args.date_from)
+	date_to = parseDate(args.date_to)
+	if (len(scores) == 1):
+		printResult(runBacktest(scores[0], args.database, date_from, date_to, args.currency, args.use_cache, args.warmup * 3600, checkpoints, results, args.bar, features))
+	else:
+		printResults(names, runBacktests(scores, args.database, date_from, date_to, args.currency, args.use_cache, args.warmup * 3600, checkpoints, results, args.bar, features))
+	if (checkpoints != None):
+		print "Warm-up checkpoints restored: " + str(checkpoints.Restored) + " saved: " + str(checkpoints.Saved)
+	if (results != None and results.Hits > 0):
+		print "Results read from " + results.Directory + ": " + str(results.Hits) + ", add --no-results to run the backtests again"
+
+	if (args.metrics):
+		import metrics
+		from vectorized_backtest import loadPrices
+		(dates, prices) = loadPrices(args.database, date_from, date_to, args.currency)
+		metrics.printMetrics(names, [metrics.backtestMetrics(score.xcon, dates, prices) for score in scores])
+
+	if (args.debug_output != None):
+		for (i, score) in enumerate(scores):
+			directory = args.debug_output
+			if (len(scores) > 1):
+				directory = os.path.join(directory, str(i) + "_" + args.strategies[i][0] + ".debug")
+			score._debugData.Save(directory)
+
+	if (args.plot):
+		for ((name, params), score) in zip(args.strategies, scores):
+			module = __import__(STRATEGIES[name][0])
+			module.plotStrategyCorePerformance(score._debugData)
+
+if __name__ == "__main__":
+	main()
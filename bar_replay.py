@@ -0,0 +1,104 @@
+import argparse
+import numpy as np
+import backtest
+import metrics
+from vectorized_backtest import loadPrices
+from exchange_connection import MockExchangeConnection
+
+"""
+	Divergence of the bar-compressed replay from the replay of every trade.
+	A strategy logic is backtested once on every trade, and once on bars of
+	each given size (backtest.py --bar): a bar is fed to the strategy logic
+	as one trade, at the date and the price of its last trade, with the sum
+	of the volumes. The funds, orders, drawdown and metrics of the bar
+	replays are compared with the ones of the full replay, and every order
+	of the full replay is matched with the nearest one of the bar replay
+	to measure how late or early they are.
+
+	The results are read from and saved into the result cache, so the full
+	replay is only run once for a strategy logic and its constants.
+
+	Usage:
+		python bar_replay.py simple_trend_follower -b 1 -b 10 -b 60
+"""
+
+# Delay of the orders of the full replay to the nearest order on the same side
+# (a buy gives BTC, a sell takes them) of the bar replay, in seconds:
+# (median, largest), None if the bar replay made no order of a side the full replay made
+def orderDelays(fills, expected_fills):
+	(dates, btc, usd) = metrics.fillArrays(fills)
+	(expected_dates, expected_btc, expected_usd) = metrics.fillArrays(expected_fills)
+	delays = []
+	for buy in (True, False):
+		side = dates[1:][(np.diff(btc) > 0.0) == buy]
+		expected_side = expected_dates[1:][(np.diff(expected_btc) > 0.0) == buy]
+		if (len(expected_side) == 0):
+			continue
+		if (len(side) == 0):
+			return (None, None)
+		after = np.minimum(np.searchsorted(side, expected_side), len(side) - 1)
+		before = np.maximum(after - 1, 0)
+		delays.append(np.minimum(np.abs(side[after] - expected_side), np.abs(side[before] - expected_side)))
+	if (len(delays) == 0):
+		return (None, None)
+	delays = np.concatenate(delays)
+	return (float(np.median(delays)), float(delays.max()))
+
+# Differences of the bar replay result from the full replay one
+def divergence(result, expected, fills, expected_fills):
+	report = {}
+	report["equity_error"] = (result["equity"] - expected["equity"]) / expected["equity"] if expected["equity"] > 0.0 else 0.0
+	report["orders_difference"] = result["orders"] - expected["orders"]
+	report["drawdown_difference"] = result["max_drawdown"] - expected["max_drawdown"]
+	report["sharpe_difference"] = result["sharpe"] - expected["sharpe"]
+	(report["median_delay"], report["max_delay"]) = orderDelays(fills, expected_fills)
+	report["speedup"] = expected["seconds"] / result["seconds"] if result["seconds"] > 0 else 0.0
+	return report
+
+# Backtest the strategy logic on every trade and on bars of each of the sizes (seconds).
+# Returns the full replay result and a list of (bar size, result, divergence).
+def compareBars(strategy, params, database, date_from, date_to, bars, currency = "USD", warmup = 0, checkpoints = None, results = None):
+	(dates, prices) = loadPrices(database, date_from, date_to, currency)
+	runs = []
+	for bar in [0] + list(bars):
+		xcon = MockExchangeConnection()
+		score = backtest.createStrategy(strategy, xcon, params)
+		result = backtest.runBacktest(score, database, date_from, date_to, currency, warmup = warmup, checkpoints = checkpoints, results = results, bar = bar)
+		# The equity is measured on every trade for the bar replays too
+		result.update(metrics.backtestMetrics(xcon, dates, prices))
+		runs.append((bar, result, xcon.fills))
+	(bar, expected, expected_fills) = runs[0]
+	return (expected, [(bar, result, divergence(result, expected, fills, expected_fills)) for (bar, result, fills) in runs[1:]])
+
+def _formatDelay(delay):
+	if (delay == None):
+		return "-"
+	return "%.0fs" % delay
+
+def printComparison(expected, comparisons):
+	print "%8s %10s %9s %8s %14s %10s %13s %9s %9s %11s %10s" % ("Bar", "Replayed", "Seconds", "Speedup", "Equity", "Error", "Max drawdown", "Sharpe", "Orders", "Med. delay", "Max delay")
+	print "%8s %10d %9.1f %8s %14.5f %10s %12.2f%% %9.2f %9d %11s %10s" % ("trades", expected["trades"], expected["seconds"], "1x", expected["equity"], "-", expected["max_drawdown"] * 100, expected["sharpe"], expected["orders"], "-", "-")
+	for (bar, result, report) in comparisons:
+		print "%8s %10d %9.1f %7.0fx %14.5f %9.2f%% %12.2f%% %9.2f %9d %11s %10s" % (("%gs" % bar), result["trades"], result["seconds"], report["speedup"], result["equity"], report["equity_error"] * 100, result["max_drawdown"] * 100, result["sharpe"], result["orders"], _formatDelay(report["median_delay"]), _formatDelay(report["max_delay"]))
+
+def main():
+	parser = argparse.ArgumentParser(description = "Compare the bar-compressed replays of a strategy logic with the replay of every trade")
+	parser.add_argument('strategy', choices = sorted(backtest.STRATEGIES.keys()))
+	parser.add_argument('-b', '--bar', action = "append", type = float, default = [], help = "size of the bars in seconds, 1, 10 and 60 by default")
+	parser.add_argument('-f', '--from', dest = "date_from", default = "2013 Nov 1 00:00", help = "start date, e.g. \"2013 Nov 1 00:00\" (UTC)")
+	parser.add_argument('-t', '--to', dest = "date_to", default = "2013 Nov 30 00:00", help = "end date (UTC)")
+	parser.add_argument('-p', '--param', action = "append", type = backtest.parseParam, default = [], help = "override a constant of the strategy logic, Name=value")
+	parser.add_argument('-d', '--database', default = "mtgoxdata/mtgox.sqlite3")
+	parser.add_argument('-c', '--currency', default = "USD")
+	parser.add_argument('-w', '--warmup', type = float, default = 0, help = "hours of trades before the start date to warm up the indicators with")
+	parser.add_argument('--no-results', dest = "use_results", action = "store_false", help = "run all the backtests, without reading or saving results")
+	args = parser.parse_args()
+
+	bars = args.bar or [1, 10, 60]
+	checkpoints = backtest.createCheckpoints(args.database, None, args.warmup > 0)
+	results = backtest.createResultCache(args.database, None, args.use_results)
+	(expected, comparisons) = compareBars(args.strategy, dict(args.param), args.database, backtest.parseDate(args.date_from), backtest.parseDate(args.date_to), bars, args.currency, args.warmup * 3600, checkpoints, results)
+	printComparison(expected, comparisons)
+
+if __name__ == "__main__":
+	main()
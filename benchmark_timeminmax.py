@@ -0,0 +1,150 @@
+import time
+import datetime
+import random
+import argparse
+from indicator.base import Indicator
+from indicator.timeminmax import TimeMax, TimeMin
+
+"""
+	Benchmark of the TimeMin/TimeMax indicators.
+	Compares the monotonic deque implementation from indicator.timeminmax
+	with the original list based one, that evicted datapoints with
+	list.pop(0) and did a full linear search for the extreme value every
+	time the extreme datapoint left the window.
+"""
+
+# The original list based window storage, kept here only for comparison
+class ListMovingAverage(Indicator):
+
+	def __init__(self, time_window):
+		self.TimeWindow = abs(time_window)
+		self._data = []
+		self._current_timestamp = datetime.datetime.fromtimestamp(time.time())
+		self._window_start_timestamp = datetime.datetime.fromtimestamp(time.time())
+		self._oldest_datapoint_timestamp = datetime.datetime.fromtimestamp(time.time())
+		self._isAccurate = False
+
+	def ActualDataTimeWindow(self):
+		if (len(self._data)<=1):
+			return datetime.timedelta(0)
+		oldest = datetime.datetime.fromtimestamp(self._data[0]["now"])
+		newest = datetime.datetime.fromtimestamp(self._data[len(self._data)-1]["now"])
+		return newest - oldest
+
+	def IsAccurate(self):
+		return self._isAccurate
+
+	def _updateTimestamps(self, data):
+		self._current_timestamp = datetime.datetime.fromtimestamp(data["now"])
+		self._window_start_timestamp = self._current_timestamp - self.TimeWindow
+		if (len(self._data)==0):
+			self._oldest_datapoint_timestamp = self._current_timestamp
+		else:
+			self._oldest_datapoint_timestamp = datetime.datetime.fromtimestamp(self._data[0]["now"])
+		if ( self.TimeWindow < self.ActualDataTimeWindow() ):
+			self._isAccurate = True
+
+# The original list based implementation, kept here only for comparison
+class ListTimeMax(ListMovingAverage):
+
+	def __init__(self, time_window):
+		ListMovingAverage.__init__(self, time_window)
+		self.Max = None
+
+	def Update(self, d):
+
+		if (not self._checkData(d)):
+			return
+
+		data = {"now":d["now"], "value":d["value"]}
+
+		self._updateTimestamps(data)
+
+		self._data.append(data)
+
+		if (self.Max == None):
+			self.Max = d["value"]
+
+		if (d["value"] > self.Max):
+			self.Max = d["value"]
+
+		if ( self._oldest_datapoint_timestamp < self._window_start_timestamp ):
+			oldest_value = self._data.pop(0)
+			if (self.Max == oldest_value["value"]):
+				maxvalue = max(self._data, key=lambda x:x["value"])
+				self.Max = maxvalue["value"]
+
+# The original list based implementation, kept here only for comparison
+class ListTimeMin(ListMovingAverage):
+
+	def __init__(self, time_window):
+		ListMovingAverage.__init__(self, time_window)
+		self.Min = None
+
+	def Update(self, d):
+
+		if (not self._checkData(d)):
+			return
+
+		data = {"now":d["now"], "value":d["value"]}
+
+		self._updateTimestamps(data)
+
+		self._data.append(data)
+
+		if (self.Min == None):
+			self.Min = d["value"]
+
+		if (d["value"] < self.Min):
+			self.Min = d["value"]
+
+		if ( self._oldest_datapoint_timestamp < self._window_start_timestamp ):
+			oldest_value = self._data.pop(0)
+			if (self.Min == oldest_value["value"]):
+				minvalue = min(self._data, key=lambda x:x["value"])
+				self.Min = minvalue["value"]
+
+def generateTicks(count, seed, drift):
+	# Random walk of the price with trades arriving every 0..2 seconds
+	rnd = random.Random(seed)
+	now = 1380000000.0
+	price = 100.0
+	ticks = []
+	for i in xrange(count):
+		now += rnd.random() * 2.0
+		price += rnd.gauss(drift, 0.05)
+		ticks.append({"now":now, "value":price})
+	return ticks
+
+def runIndicator(indicator, ticks, attribute):
+	result = []
+	started = time.time()
+	for tick in ticks:
+		indicator.Update(tick)
+		result.append(getattr(indicator, attribute))
+	return (time.time() - started, result)
+
+def compare(name, old, new, ticks, attribute):
+	(old_time, old_result) = runIndicator(old, ticks, attribute)
+	(new_time, new_result) = runIndicator(new, ticks, attribute)
+	if (old_result != new_result):
+		print name + ": results differ!"
+	print name + ": list " + ("%.2f" % old_time) + "s, deque " + ("%.2f" % new_time) + "s, speedup " + ("%.1f" % (old_time / new_time)) + "x"
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-n', '--ticks', type=int, default=1000000)
+	parser.add_argument('-w', '--window_minutes', type=float, default=90)
+	parser.add_argument('-d', '--drift', type=float, default=-0.001, help="price drift per tick, negative drift makes the maximum leave the window often")
+	parser.add_argument('-s', '--seed', type=int, default=1)
+	args = parser.parse_args()
+
+	ticks = generateTicks(args.ticks, args.seed, args.drift)
+	timedelta = datetime.timedelta(minutes = args.window_minutes)
+	print "Ticks: " + str(len(ticks)) + " window: " + str(timedelta)
+
+	compare("TimeMax", ListTimeMax(timedelta), TimeMax(timedelta), ticks, "Max")
+	compare("TimeMin", ListTimeMin(timedelta), TimeMin(timedelta), ticks, "Min")
+
+if __name__ == "__main__":
+	main()
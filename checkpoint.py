@@ -0,0 +1,118 @@
+import os
+import pickle
+import hashlib
+import datetime
+import trade_cache
+from indicator.base import Indicator
+
+"""
+	Checkpoints of the warmed up indicators of a strategy logic.
+	Before a backtest acts, its indicators are fed the trades of a warm-up
+	period, so that they are accurate from the first trade of the evaluation
+	period. The warm-up starts and ends at time boundaries (midnight UTC by
+	default, see backtest.warmUp()), and the state of the indicators at the
+	end of it is saved in the checkpoint directory. Later backtests with the
+	same indicators, on the same data and warm-up range, restore it instead of
+	replaying the warm-up, whatever the trading thresholds are.
+
+	The key of a checkpoint is a hash of the type and the settings (windows)
+	of every indicator, of the source code that feeds them (the strategy
+	logic, the indicator package, the replay and this module), of the
+	database fingerprint, of the currency and of the warm-up range.
+"""
+
+# Indicators of a strategy logic, and the other attributes updated by the trades: {name: value}
+# A strategy logic lists in _warmAttributes the attributes that are not
+# indicators but change during the warm-up, and in _warmConstants the
+# constants those attributes depend on.
+def warmState(score):
+	state = {}
+	for (name, value) in score.__dict__.items():
+		if (isinstance(value, Indicator)):
+			state[name] = value
+	for name in getattr(score, "_warmAttributes", []):
+		state[name] = getattr(score, name)
+	return state
+
+# Attributes of the indicators set from their constructor arguments
+INDICATOR_SETTINGS = ["TimeWindow", "Width", "Resolutions", "_tau", "_length"]
+
+# Type and settings of an indicator. Unlike its state, which starts from the
+# wall clock, they are the same for all the indicators created alike.
+def indicatorSettings(indicator):
+	settings = [indicator.__class__.__module__ + "." + indicator.__class__.__name__]
+	for name in INDICATOR_SETTINGS:
+		if (hasattr(indicator, name)):
+			settings.append(name + "=" + repr(getattr(indicator, name)))
+	if (getattr(indicator, "_buckets", None) != None):
+		settings.append("bucket=" + repr(indicator._buckets.Granularity))
+	return settings
+
+def restoreWarmState(score, state):
+	score.__dict__.update(state)
+	# Subscriptions to the indicators are not saved with them
+	restored = getattr(score, "IndicatorsRestored", None)
+	if (restored != None):
+		restored()
+
+class IndicatorCheckpoints:
+
+	def __init__(self, directory):
+		self.Directory = directory
+		self.Restored = 0
+		self.Saved = 0
+
+	# Key of the state of the indicators of score after the trades between warm_from and boundary,
+	# starting from freshly created indicators
+	def Key(self, score, sqliteDataFile, currency, warm_from, boundary):
+		# result_cache imports this module
+		import result_cache
+		digest = hashlib.sha1()
+		digest.update(result_cache.strategySourceHash(score))
+		for (name, value) in sorted(warmState(score).items()):
+			if (isinstance(value, Indicator)):
+				digest.update(name + ":" + ",".join(indicatorSettings(value)) + ";")
+		for name in getattr(score, "_warmConstants", []):
+			digest.update(name + "=" + repr(getattr(score, name)))
+		digest.update(repr((trade_cache.sourceFingerprint(sqliteDataFile), currency, warm_from, boundary)))
+		return datetime.datetime.utcfromtimestamp(boundary).strftime("%Y%m%d%H%M") + "_" + digest.hexdigest()
+
+	def Filename(self, key):
+		return os.path.join(self.Directory, key + ".pickle")
+
+	# Restore the indicators of score from the checkpoint, returns False if there is none
+	def Restore(self, score, key):
+		try:
+			f = open(self.Filename(key), "rb")
+		except IOError:
+			return False
+		try:
+			state = pickle.load(f)
+		finally:
+			f.close()
+		restoreWarmState(score, state)
+		self.Restored += 1
+		return True
+
+	def Save(self, score, key):
+		if (not os.path.isdir(self.Directory)):
+			try:
+				os.makedirs(self.Directory)
+			except OSError:
+				# Created by another process of a sweep
+				if (not os.path.isdir(self.Directory)):
+					raise
+		# Write to a temporary file first, a reader never sees half a checkpoint
+		filename = self.Filename(key)
+		temporary = filename + "." + str(os.getpid()) + ".tmp"
+		f = open(temporary, "wb")
+		try:
+			pickle.dump(warmState(score), f, 2)
+		finally:
+			f.close()
+		os.rename(temporary, filename)
+		self.Saved += 1
+
+# Default location of the checkpoints of a database: mtgox.sqlite3 -> mtgox.checkpoints
+def checkpointDirectory(sqliteDataFile):
+	return os.path.splitext(sqliteDataFile)[0] + ".checkpoints"
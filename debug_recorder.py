@@ -0,0 +1,140 @@
+import os
+import shutil
+from array import array
+from indicator.ringbuffer import RingBuffer, TIME, VALUE
+
+"""
+	Recorder of the debug series of the strategy logics.
+	Every named series is a pair of typed arrays of floats, the times and
+	the values, instead of a list of {"now":..., "value":...} dicts, so a
+	datapoint costs 16 bytes. Optionally only every decimation-th datapoint
+	of a series is kept, and at most maxlen of them (the oldest ones are
+	dropped, for the bots running live).
+
+	Save() writes one .npy file per series into a directory, which
+	loadDebugData() memory-maps for strategy_plot.StrategyPlot and
+	plot_pickled.py:
+		strategy_logic_simple_trend_follower.debug/RawPrice.npy
+		strategy_logic_simple_trend_follower.debug/Sell.npy
+		...
+	Each file is a structured array with a "now" and a "value" field.
+"""
+
+# Datapoints kept per series by the bots running live
+LIVE_MAXLEN = 100000
+
+# Type of the datapoints in the saved files
+DTYPE = [("now", "<f8"), ("value", "<f8")]
+
+class DebugRecorder:
+
+	def __init__(self, decimation = 1, maxlen = None):
+		self.Decimation = max(int(decimation), 1)
+		self.MaxLen = maxlen
+		# name: RingBuffer of the kept datapoints
+		self._series = {}
+		# name: number of datapoints given, kept or not
+		self._counts = {}
+		# name: last datapoint given, kept or not
+		self._last = {}
+
+	# The datapoints are pickled as the bytes of the arrays, not as lists of floats
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		series = {}
+		for (name, data) in self._series.items():
+			series[name] = (data.Column(TIME).tostring(), data.Column(VALUE).tostring())
+		state["_series"] = series
+		return state
+
+	def __setstate__(self, state):
+		series = state["_series"]
+		self.__dict__.update(state)
+		self._series = {}
+		for (name, (times, values)) in series.items():
+			data = RingBuffer()
+			data.Assign(array('d', times), array('d', values))
+			self._series[name] = data
+
+	def __contains__(self, name):
+		return name in self._series
+
+	def Names(self):
+		return sorted(self._series.keys())
+
+	# Add a datapoint to a series. Unless decimate is False, only every
+	# Decimation-th datapoint is kept; trades are recorded with decimate = False.
+	def Append(self, name, now, value, decimate = True):
+		if (name not in self._series):
+			self._series[name] = RingBuffer()
+			self._counts[name] = 0
+		count = self._counts[name]
+		self._counts[name] = count + 1
+		self._last[name] = (now, value)
+		if (decimate and count % self.Decimation != 0):
+			return
+		data = self._series[name]
+		if (self.MaxLen != None and len(data) >= self.MaxLen):
+			data.DropOldest()
+		data.Append(now, value)
+
+	# Last datapoint given to a series, {"now":..., "value":...}, None if there is none
+	def Last(self, name):
+		if (name not in self._last):
+			return None
+		(now, value) = self._last[name]
+		return {"now":now, "value":value}
+
+	# (times, values) of the datapoints kept, as NumPy arrays
+	def Series(self, name):
+		import numpy as np
+		data = self._series[name]
+		return (np.frombuffer(data.Column(TIME), dtype = float), np.frombuffer(data.Column(VALUE), dtype = float))
+
+	def Clear(self):
+		self._series = {}
+		self._counts = {}
+		self._last = {}
+
+	# Write every series into directory, replacing its content
+	def Save(self, directory):
+		import numpy as np
+		# Write next to the old files and swap at the end, readers never see a partial recording
+		temporary = directory + ".tmp"
+		if (os.path.exists(temporary)):
+			shutil.rmtree(temporary)
+		os.makedirs(temporary)
+		for name in self.Names():
+			(times, values) = self.Series(name)
+			data = np.empty(len(times), dtype = DTYPE)
+			data["now"] = times
+			data["value"] = values
+			np.save(os.path.join(temporary, name + ".npy"), data)
+		if (os.path.exists(directory)):
+			shutil.rmtree(directory)
+		os.rename(temporary, directory)
+
+# Default directory of the saved debug data of a strategy logic: strategy_logic_x.pickle -> strategy_logic_x.debug
+def debugDirectory(filename):
+	return os.path.splitext(filename)[0] + ".debug"
+
+# Memory-map the series saved by DebugRecorder.Save(), {name: structured array}
+def loadDebugData(directory):
+	import numpy as np
+	debugData = {}
+	for filename in sorted(os.listdir(directory)):
+		(name, extension) = os.path.splitext(filename)
+		if (extension == ".npy"):
+			debugData[name] = np.load(os.path.join(directory, filename), mmap_mode = "r")
+	return debugData
+
+# (times, values) NumPy arrays of a series of debug data: a DebugRecorder, the
+# series loaded by loadDebugData(), or lists of dicts saved by older versions
+def debugSeries(debugData, name):
+	import numpy as np
+	if (isinstance(debugData, DebugRecorder)):
+		return debugData.Series(name)
+	data = debugData[name]
+	if (isinstance(data, np.ndarray)):
+		return (data["now"], data["value"])
+	return (np.array([item["now"] for item in data], dtype = float), np.array([item["value"] for item in data], dtype = float))
@@ -15,14 +15,36 @@ class ExchangeConnection:
 	def BuyBTC(self,amount):
 		print "Buying " + str(amount) + " BTC"
 		self.gox.buy(0, self.gox.base2int(amount))
+	def CancelAllOrders(self):
+		for order in self.gox.orderbook.owns:
+			self.gox.cancel(order.oid)
 
 class MockExchangeConnection(ExchangeConnection):
 	def __init__(self, availableBTC = 0.0, availableUSD = 10.0, currentPrice = 200.0):
 		self.availableBTC = availableBTC
 		self.availableUSD = availableUSD
 		self.currentPrice = currentPrice
-	def SetBTCPrice(self, price):
+		# Date of the current price, if given
+		self.currentTime = 0.0
+		# Number of executed sell and buy orders
+		self.orders = 0
+		# Highest total funds in USD seen so far, and the largest relative drop from it
+		self.peakEquity = self.Equity()
+		self.maxDrawdown = 0.0
+		# (date, BTC, USD) at the start and after every executed order
+		self.fills = [(0.0, availableBTC, availableUSD)]
+	def SetBTCPrice(self, price, now = None):
 		self.currentPrice = price
+		if (now != None):
+			self.currentTime = now
+		equity = self.availableUSD + self.availableBTC * price
+		if (equity > self.peakEquity):
+			self.peakEquity = equity
+		elif (self.peakEquity > 0.0 and (self.peakEquity - equity) / self.peakEquity > self.maxDrawdown):
+			self.maxDrawdown = (self.peakEquity - equity) / self.peakEquity
+	# Total funds converted to USD at the current price
+	def Equity(self):
+		return self.availableUSD + self.availableBTC * self.currentPrice
 	def AvailableBTC(self):
 		return self.availableBTC
 	def AvailableUSD(self):
@@ -36,6 +58,8 @@ class MockExchangeConnection(ExchangeConnection):
 		self.availableUSD += amount * self.currentPrice
 		self.availableBTC -= amount
 		self.availableUSD = self.availableUSD - self.availableUSD * 0.006
+		self.orders += 1
+		self.fills.append((self.currentTime, self.availableBTC, self.availableUSD))
 	def BuyBTC(self, amount):
 		if (amount <= 0.0):
 			return
@@ -44,4 +68,8 @@ class MockExchangeConnection(ExchangeConnection):
 			return
 		self.availableUSD -= self.currentPrice * amount
 		self.availableBTC += amount
-		self.availableBTC -= self.availableBTC * 0.006
\ No newline at end of file
+		self.availableBTC -= self.availableBTC * 0.006
+		self.orders += 1
+		self.fills.append((self.currentTime, self.availableBTC, self.availableUSD))
+	def CancelAllOrders(self):
+		pass
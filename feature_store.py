@@ -0,0 +1,359 @@
+import os
+import json
+import time
+import pickle
+import argparse
+import numpy as np
+import backtest
+import trade_cache
+from exchange_connection import MockExchangeConnection
+from indicator.ma import SimpleMovingAverage, ExponentialMovingAverage
+
+"""
+	Moving averages of the price precomputed over the whole trade history.
+	The series are computed once with the batch updates of the indicators
+	(UpdateMany) over the trade cache of a currency, and stored next to it
+	as one .npy file per series, a row per cached trade:
+		mtgox.features/USD/ExponentialMovingAverage_25200.npy			Value after every trade
+		mtgox.features/USD/ExponentialMovingAverage_25200.accurate.npy	IsAccurate() after every trade
+		mtgox.features/USD/ExponentialMovingAverage_25200.pickle		the indicator after the last trade
+		mtgox.features/USD/info.json
+	After new trades are downloaded and the trade cache is rebuilt, running
+	this again only feeds the new trades to the saved indicators and appends
+	their values. If the old trades changed, the series are computed again.
+
+	backtest.py --features and vectorized_backtest.py --features read the
+	moving averages from the store instead of computing them. A value is the
+	one of an indicator fed every trade since the start of the history, as
+	after the longest possible warm-up, so the first orders of a backtest
+	can differ from the ones of a backtest which starts cold.
+
+	Only the moving averages updated with every trade are stored, the ones
+	listed in _storedIndicators by the strategy logics. The volume averages
+	of StrategyLogicVolumeTrendFollower are updated by its one minute bars
+	and are computed as before.
+
+	Usage:
+		python feature_store.py mtgoxdata/mtgox.sqlite3
+		python feature_store.py mtgoxdata/mtgox.sqlite3 -s simple_trend_follower:Price_Fast_EMA_Time=300 --ema 3600
+"""
+
+# Indicator class name: class, of the series that can be stored
+FEATURE_CLASSES = {
+	"SimpleMovingAverage": SimpleMovingAverage,
+	"ExponentialMovingAverage": ExponentialMovingAverage,
+}
+
+# Series computed by default, (class, window in seconds): the price moving averages
+# of the strategy logics with their default constants, as exponential and simple ones
+DEFAULT_GRID = [(cls, window) for cls in (ExponentialMovingAverage, SimpleMovingAverage) for window in (30, 60, 840, 14400, 25200, 50400, 75600)]
+
+# Trades fed to an indicator at once
+BATCH_SIZE = 1000000
+
+# Trades of the store kept as lists by a StoredIndicator at once
+CHUNK_SIZE = 65536
+
+# Default location of the features of a database: mtgox.sqlite3 -> mtgox.features
+def featureDirectory(sqliteDataFile):
+	return os.path.splitext(sqliteDataFile)[0] + ".features"
+
+# Name of the series of an indicator, None if it can not be stored
+def featureName(indicator):
+	name = indicator.__class__.__name__
+	if (FEATURE_CLASSES.get(name) != indicator.__class__ or getattr(indicator, "_buckets", None) != None):
+		return None
+	return name + "_" + ("%g" % indicator._window)
+
+# The indicators listed in _storedIndicators by the strategy logic: {attribute: indicator}
+def storedIndicators(score):
+	return dict([(name, getattr(score, name)) for name in getattr(score, "_storedIndicators", [])])
+
+# Compute or update the series of the indicators (and of the ones already stored)
+# over the trade cache of the currency, building the trade cache if needed.
+# Returns (number of trades, number of them fed to the indicators).
+def updateFeatures(sqliteDataFile, indicators, directory = None, currency = "USD", force = False):
+	trade_cache.buildCache(sqliteDataFile, None, [currency])
+	cache = trade_cache.TradeCache(trade_cache.cacheDirectory(sqliteDataFile), currency)
+	if (directory == None):
+		directory = featureDirectory(sqliteDataFile)
+	target = os.path.join(directory, currency)
+	if (not os.path.isdir(target)):
+		os.makedirs(target)
+
+	info = _loadInfo(target)
+	rows = 0
+	features = {}
+	if (info != None):
+		features = info["features"]
+		if (not force and _isPrefix(info, cache)):
+			rows = info["rows"]
+	for indicator in indicators:
+		name = featureName(indicator)
+		if (name == None):
+			raise ValueError(indicator.__class__.__name__ + " can not be stored")
+		if (name not in features):
+			features[name] = {"class":indicator.__class__.__name__, "window":indicator._window, "rows":0}
+
+	fed = 0
+	for (name, feature) in sorted(features.items()):
+		start = rows if feature.get("rows", rows) == rows else 0
+		fed += _updateFeature(cache, target, name, feature, start)
+		feature["rows"] = len(cache)
+
+	info = {}
+	info["currency"] = currency
+	info["rows"] = len(cache)
+	info["first_tid"] = int(cache.Tids[0]) if len(cache) > 0 else None
+	info["last_tid"] = int(cache.Tids[-1]) if len(cache) > 0 else None
+	info["last_date"] = float(cache.Dates[-1]) if len(cache) > 0 else None
+	info["features"] = features
+	info["built"] = time.time()
+	_saveInfo(target, info)
+	return (len(cache), fed)
+
+def _loadInfo(target):
+	try:
+		f = open(os.path.join(target, "info.json"), "r")
+		try:
+			return json.load(f)
+		finally:
+			f.close()
+	except (IOError, ValueError):
+		return None
+
+def _saveInfo(target, info):
+	filename = os.path.join(target, "info.json")
+	temporary = filename + "." + str(os.getpid()) + ".tmp"
+	f = open(temporary, "w")
+	json.dump(info, f)
+	f.close()
+	os.rename(temporary, filename)
+
+# True if the trades the series were computed over are still the first ones of the cache
+def _isPrefix(info, cache):
+	rows = info["rows"]
+	if (rows > len(cache)):
+		return False
+	if (rows == 0):
+		return True
+	return int(cache.Tids[0]) == info["first_tid"] and int(cache.Tids[rows - 1]) == info["last_tid"] and float(cache.Dates[rows - 1]) == info["last_date"]
+
+# Feed the trades from start on to the indicator of the series, saved after the
+# trade start - 1, or to a new one from the first trade. Returns the number of trades fed.
+def _updateFeature(cache, target, name, feature, start):
+	from numpy.lib.format import open_memmap
+
+	filename = os.path.join(target, name)
+	indicator = None
+	if (start > 0):
+		try:
+			f = open(filename + ".pickle", "rb")
+			try:
+				indicator = pickle.load(f)
+			finally:
+				f.close()
+		except IOError:
+			pass
+	if (indicator == None):
+		indicator = FEATURE_CLASSES[feature["class"]](feature["window"])
+		start = 0
+
+	count = len(cache)
+	if (start == count and start > 0):
+		return 0
+	# Write next to the old series and swap at the end, readers never see a partial one
+	columns = []
+	for (suffix, dtype) in ((".npy", "float64"), (".accurate.npy", "bool")):
+		temporary = filename + suffix + ".tmp"
+		if (count == 0):
+			# An empty file can not be memory-mapped
+			f = open(temporary, "wb")
+			np.save(f, np.empty(0, dtype = dtype))
+			f.close()
+			continue
+		column = open_memmap(temporary, mode = "w+", dtype = dtype, shape = (count,))
+		if (start > 0):
+			column[:start] = np.load(filename + suffix, mmap_mode = "r")[:start]
+		columns.append(column)
+
+	for position in xrange(start, count, BATCH_SIZE):
+		end = min(position + BATCH_SIZE, count)
+		dates = np.asarray(cache.Dates[position:end])
+		columns[1][position:end] = indicator.AccuracyMany(dates)
+		columns[0][position:end] = indicator.UpdateMany(dates, np.asarray(cache.Prices[position:end]))
+	for column in columns:
+		column.flush()
+	del columns
+
+	f = open(filename + ".pickle.tmp", "wb")
+	try:
+		pickle.dump(indicator, f, 2)
+	finally:
+		f.close()
+	for suffix in (".npy", ".accurate.npy", ".pickle"):
+		os.rename(filename + suffix + ".tmp", filename + suffix)
+	return count - start
+
+# The stored series of one currency, memory-mapped read only
+class FeatureStore:
+
+	# cache is the TradeCache of the currency the series were computed over
+	def __init__(self, directory, cache):
+		self.Path = os.path.join(directory, cache.Currency)
+		self.Info = _loadInfo(self.Path)
+		if (self.Info == None):
+			raise IOError("No features in " + self.Path)
+		self.Currency = cache.Currency
+		self.Dates = cache.Dates
+		self._cache = cache
+		self._series = {}
+
+	# True if the series cover all the trades of the cache
+	def IsFresh(self):
+		return self.Info["rows"] == len(self._cache) and _isPrefix(self.Info, self._cache)
+
+	def Has(self, indicator):
+		name = featureName(indicator)
+		return name != None and name in self.Info["features"]
+
+	# Memory-mapped (values, accurate) of the indicator after every trade of the store
+	def Load(self, indicator):
+		name = featureName(indicator)
+		if (name not in self._series):
+			filename = os.path.join(self.Path, name)
+			mode = "r" if self.Info["rows"] > 0 else None
+			self._series[name] = (np.load(filename + ".npy", mmap_mode = mode), np.load(filename + ".accurate.npy", mmap_mode = mode))
+		return self._series[name]
+
+	# (values, accurate) of the indicator after every trade at dates, which
+	# are consecutive trades of the store. None if it is not stored.
+	def Series(self, indicator, dates):
+		if (not self.Has(indicator)):
+			return None
+		dates = np.asarray(dates)
+		if (len(dates) == 0):
+			return (np.empty(0), np.empty(0, dtype = bool))
+		first = int(np.searchsorted(self.Dates, dates[0], side = "left"))
+		last = first + len(dates)
+		if (last > len(self.Dates) or self.Dates[first] != dates[0] or self.Dates[last - 1] != dates[-1]):
+			return None
+		(values, accurate) = self.Load(indicator)
+		return (np.asarray(values[first:last]), np.asarray(accurate[first:last]))
+
+	# Replace the indicators of the strategy logic listed in _storedIndicators
+	# by their stored series. Returns the names of the replaced attributes.
+	def Attach(self, score):
+		attached = []
+		for (name, indicator) in sorted(storedIndicators(score).items()):
+			if (self.Has(indicator)):
+				(values, accurate) = self.Load(indicator)
+				setattr(score, name, StoredIndicator(indicator, self.Dates, values, accurate))
+				attached.append(name)
+		return attached
+
+# Stand-in for a moving average, reading its Value and IsAccurate() from the
+# store instead of computing them. The trades are found by their date, so they
+# have to be the trades of the store; the values of the first trade of the
+# store with the date are given after a trade that is not in it.
+class StoredIndicator:
+
+	def __init__(self, indicator, dates, values, accurate):
+		self.TimeWindow = indicator.TimeWindow
+		self.Value = 0.0
+		self._window = indicator._window
+		self._isAccurate = False
+		self._dates = dates
+		self._values = values
+		self._accurate = accurate
+		# Next row of the store, and the rows held as lists from _start on
+		self._position = 0
+		self._start = 0
+		self._chunkDates = []
+		self._chunkValues = []
+		self._chunkAccurate = []
+
+	def IsAccurate(self):
+		return self._isAccurate
+
+	def Update(self, d):
+		self.UpdateValue(d["now"], d["value"])
+
+	# The series are not pickled with the strategy logic, they stay in the store
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		for name in ("_dates", "_values", "_accurate", "_chunkDates", "_chunkValues", "_chunkAccurate"):
+			state[name] = []
+		return state
+
+	def UpdateValue(self, now, value):
+		position = self._position
+		if (self._date(position) != now):
+			# Not the next trade of the store, look it up
+			position = int(np.searchsorted(self._dates, now, side = "left"))
+			if (self._date(position) != now):
+				position -= 1
+			if (position < 0):
+				self.Value = 0.0
+				self._isAccurate = False
+				return
+			self._date(position)
+		i = position - self._start
+		self.Value = self._chunkValues[i]
+		self._isAccurate = self._chunkAccurate[i]
+		self._position = position + 1
+
+	# Date of the trade of the store at position, None after the last one
+	def _date(self, position):
+		i = position - self._start
+		if (i < 0 or i >= len(self._chunkDates)):
+			if (position < 0 or position >= len(self._dates)):
+				return None
+			self._start = position
+			end = min(position + CHUNK_SIZE, len(self._dates))
+			self._chunkDates = self._dates[position:end].tolist()
+			self._chunkValues = self._values[position:end].tolist()
+			self._chunkAccurate = self._accurate[position:end].tolist()
+			i = 0
+		return self._chunkDates[i]
+
+# The features of a currency next to the database, None if they were not
+# computed or do not cover all the trades of an up to date trade cache
+def openFeatures(sqliteDataFile, currency = "USD"):
+	cache = trade_cache.openCache(sqliteDataFile, currency)
+	if (cache == None):
+		return None
+	directory = featureDirectory(sqliteDataFile)
+	if (not os.path.exists(os.path.join(directory, currency, "info.json"))):
+		return None
+	store = FeatureStore(directory, cache)
+	if (not store.IsFresh()):
+		return None
+	return store
+
+def main():
+	parser = argparse.ArgumentParser(description = "Precompute the moving averages of the price over all the recorded MtGox trades")
+	parser.add_argument('database', nargs = "?", default = "mtgoxdata/mtgox.sqlite3")
+	parser.add_argument('-o', '--output', default = None, help = "feature directory, next to the database by default")
+	parser.add_argument('-c', '--currency', default = "USD")
+	parser.add_argument('-s', '--strategy', action = "append", type = backtest.parseStrategy, default = [], help = "also store the moving averages of a strategy logic, name or name:Name=value,Name=value")
+	parser.add_argument('--ema', action = "append", type = float, default = [], help = "also store an exponential moving average of this window in seconds")
+	parser.add_argument('--sma', action = "append", type = float, default = [], help = "also store a simple moving average of this window in seconds")
+	parser.add_argument('-f', '--force', action = "store_true", help = "compute all the series again")
+	args = parser.parse_args()
+
+	indicators = [cls(window) for (cls, window) in DEFAULT_GRID]
+	indicators += [ExponentialMovingAverage(window) for window in args.ema]
+	indicators += [SimpleMovingAverage(window) for window in args.sma]
+	for (name, params) in args.strategy:
+		score = backtest.createStrategy(name, MockExchangeConnection(), params)
+		if (len(storedIndicators(score)) == 0):
+			parser.error(name + " has no stored indicators")
+		indicators += [indicator for indicator in storedIndicators(score).values() if featureName(indicator) != None]
+
+	started = time.time()
+	(rows, fed) = updateFeatures(args.database, indicators, args.output, args.currency, args.force)
+	print "Fed " + str(fed) + " trade updates to the indicators, " + str(rows) + " trades stored, in " + ("%.1f" % (time.time() - started)) + "s"
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,126 @@
+import os
+import time
+import pickle
+import sqlite3
+import argparse
+import backtest
+from exchange_connection import MockExchangeConnection
+
+"""
+	Incremental backtest of a strategy logic, continued as new trades are downloaded.
+	The whole state of the simulation is saved after every run: the strategy
+	logic with its indicators, its MockExchangeConnection, and the tid of the
+	last trade replayed. The next run restores it and replays only the trades
+	with a higher tid, so a daily report costs a day of trades instead of
+	the whole history.
+
+	Usage:
+		python incremental.py simple_trend_follower trend.state -f "2013 Nov 1 00:00"
+"""
+
+# Yields (date, price, volume, tid) of the trades from date_from on with a tid above last_tid, ordered by date
+def streamNewTrades(sqliteDataFile, date_from, last_tid, currency = "USD", batch_size = backtest.BATCH_SIZE):
+	db = sqlite3.connect(sqliteDataFile)
+	try:
+		cursor = db.cursor()
+		cursor.execute("select date,price,amount,tid from trades where currency=? and tid>? and date>=? order by date,tid", (currency, last_tid, date_from))
+		while True:
+			rows = cursor.fetchmany(batch_size)
+			if (not rows):
+				break
+			for row in rows:
+				yield (float(row[0]), float(row[1]), float(row[2]), int(row[3]))
+		cursor.close()
+	finally:
+		db.close()
+
+class IncrementalBacktest:
+
+	# warmup seconds of trades before date_from warm up the indicators before the first run
+	def __init__(self, strategy, params, date_from, currency = "USD", warmup = 0):
+		self.Strategy = strategy
+		self.Params = params
+		self.DateFrom = date_from
+		self.Currency = currency
+		self.Warmup = warmup
+		self.LastTid = 0
+		self.FirstDate = None
+		self.LastDate = None
+		self.Trades = 0
+		self.Runs = 0
+		self.score = backtest.createStrategy(strategy, MockExchangeConnection(), params)
+
+	# Replay the trades added to the database since the last run.
+	# Returns the result of the whole backtest so far, trades being the number of new trades.
+	def Continue(self, sqliteDataFile):
+		started = time.time()
+		if (self.Runs == 0 and self.Warmup > 0):
+			backtest.warmUp(self.score, sqliteDataFile, self.DateFrom, self.Warmup, self.Currency, use_cache = False)
+		(count, first, last) = backtest.replayTrades(self.score, self._track(streamNewTrades(sqliteDataFile, self.DateFrom, self.LastTid, self.Currency)))
+		elapsed = time.time() - started
+
+		self.Trades += count
+		self.Runs += 1
+		if (self.FirstDate == None and count > 0):
+			self.FirstDate = first
+
+		result = backtest.backtestResult(self.score, count, self.FirstDate or self.DateFrom, self.LastDate or self.DateFrom, elapsed)
+		result["total_trades"] = self.Trades
+		result["last_tid"] = self.LastTid
+		return result
+
+	def Save(self, filename):
+		# Write to a temporary file first, an interrupted save keeps the previous state
+		temporary = filename + ".tmp"
+		f = open(temporary, "wb")
+		try:
+			pickle.dump(self, f, 2)
+		finally:
+			f.close()
+		os.rename(temporary, filename)
+
+	# The tid and the date of a trade are kept once the strategy logic processed it
+	def _track(self, trades):
+		for (date, price, volume, tid) in trades:
+			yield (date, price, volume)
+			self.LastTid = tid
+			self.LastDate = date
+
+def loadIncrementalBacktest(filename):
+	f = open(filename, "rb")
+	try:
+		state = pickle.load(f)
+	finally:
+		f.close()
+	# Subscriptions to the indicators are not saved with them
+	restored = getattr(state.score, "IndicatorsRestored", None)
+	if (restored != None):
+		restored()
+	return state
+
+def main():
+	parser = argparse.ArgumentParser(description = "Continue the backtest of a strategy logic with the trades downloaded since its last run")
+	parser.add_argument('strategy', choices = sorted(backtest.STRATEGIES.keys()))
+	parser.add_argument('state', help = "file of the state of the backtest, created by the first run")
+	parser.add_argument('-f', '--from', dest = "date_from", default = "2013 Nov 1 00:00", help = "start date of a new backtest, e.g. \"2013 Nov 1 00:00\" (UTC)")
+	parser.add_argument('-p', '--param', action = "append", type = backtest.parseParam, default = [], help = "override a constant of the strategy logic of a new backtest, Name=value")
+	parser.add_argument('-d', '--database', default = "mtgoxdata/mtgox.sqlite3")
+	parser.add_argument('-c', '--currency', default = "USD")
+	parser.add_argument('-w', '--warmup', type = float, default = 0, help = "hours of trades before the start date to warm up the indicators of a new backtest with")
+	args = parser.parse_args()
+
+	if (os.path.exists(args.state)):
+		incremental = loadIncrementalBacktest(args.state)
+		if (incremental.Strategy != args.strategy or incremental.Currency != args.currency):
+			parser.error(args.state + " is a backtest of " + incremental.Strategy + " in " + incremental.Currency)
+		print "Continuing after trade " + str(incremental.LastTid) + " of run " + str(incremental.Runs)
+	else:
+		incremental = IncrementalBacktest(args.strategy, dict(args.param), backtest.parseDate(args.date_from), args.currency, args.warmup * 3600)
+
+	result = incremental.Continue(args.database)
+	incremental.Save(args.state)
+	print "Trades since the start: " + str(result["total_trades"]) + ", last trade: " + str(result["last_tid"])
+	backtest.printResult(result)
+
+if __name__ == "__main__":
+	main()
@@ -1 +1 @@
-__all__ = ["base", "ma", "candlestick", "timesum", "timeminmax"]
\ No newline at end of file
+__all__ = ["base", "ma", "candlestick", "timesum", "timeminmax", "ringbuffer", "bank", "candleseries", "volatility", "buckets"]
\ No newline at end of file
@@ -0,0 +1,219 @@
+# Indicators sharing one window of datapoints
+import datetime
+from base import Indicator, toSeconds
+from ringbuffer import RingBuffer, TIME, VALUE
+
+# Candidates for the extreme are stored as (index, value) rows
+INDEX = 0
+
+# Owner of a single time indexed series that many indicators are computed from.
+# Instead of every moving average keeping its own copy of the prices, the
+# indicators are attached to the bank as views: a view keeps only the index of
+# its oldest datapoint and its running value. Every datapoint is stored once,
+# and the storage is trimmed to the longest window in use.
+#
+# Views give the same values as the standalone indicators with the same window,
+# but only the bank is updated, once per datapoint, never the views:
+#   bank = IndicatorBank()
+#   price_sma_slow = bank.AddSimpleMovingAverage(datetime.timedelta(minutes = 14))
+#   price_ema_fast = bank.AddExponentialMovingAverage(datetime.timedelta(seconds = 30))
+#   bank.Update({"now":now, "value":price})
+#   price_sma_slow.Value, price_ema_fast.IsAccurate()
+class IndicatorBank(Indicator):
+
+    def __init__(self):
+        self._data = RingBuffer()
+        # Index of the oldest stored datapoint, counting from the first one ever received
+        self._first = 0
+        self._views = []
+
+    def AddSimpleMovingAverage(self, time_window):
+        return self._attach(SharedSimpleMovingAverage(self, time_window))
+
+    def AddExponentialMovingAverage(self, time_window):
+        return self._attach(SharedExponentialMovingAverage(self, time_window))
+
+    def AddTimeMin(self, time_window):
+        return self._attach(SharedTimeMin(self, time_window))
+
+    def AddTimeMax(self, time_window):
+        return self._attach(SharedTimeMax(self, time_window))
+
+    def AddMovingSum(self, time_window):
+        return self._attach(SharedMovingSum(self, time_window))
+
+    def Update(self, d):
+
+        if (not self._checkData(d)):
+            return
+
+        self.UpdateValue(d["now"], d["value"])
+
+    # Fast path of Update for the callers that already hold validated numbers:
+    # now is a unix timestamp, value is a float
+    def UpdateValue(self, now, value):
+
+        index = self._first + len(self._data)
+        self._data.Append(now, value)
+
+        oldest = index + 1
+        for view in self._views:
+            view._update(index, now, value)
+            oldest = min(oldest, view._head)
+
+        # Forget the datapoints that are out of every window
+        while (self._first < oldest):
+            self._data.DropOldest()
+            self._first += 1
+
+    # Number of datapoints stored for all the views
+    def __len__(self):
+        return len(self._data)
+
+    def _attach(self, view):
+        self._views.append(view)
+        return view
+
+    # Index the next datapoint will get
+    def _nextIndex(self):
+        return self._first + len(self._data)
+
+    def _time(self, index):
+        return self._data.Get(TIME, index - self._first)
+
+    def _value(self, index):
+        return self._data.Get(VALUE, index - self._first)
+
+# Base class for the indicators attached to an IndicatorBank
+# The window of a view are the datapoints of the bank from _head on.
+class SharedWindow(Indicator):
+
+    # The current value of the indicator
+    Value = 0.0
+
+    # The window used to calculate the indicator
+    TimeWindow = datetime.timedelta(hours=1)
+
+    # time_window is a datetime.timedelta or a number of seconds
+    def __init__(self, bank, time_window):
+        if (isinstance(time_window, datetime.timedelta)):
+            self.TimeWindow = abs(time_window)
+        elif (isinstance(time_window, (int, long, float))):
+            self.TimeWindow = datetime.timedelta(seconds = abs(time_window))
+        self._window = toSeconds(self.TimeWindow)
+        self._bank = bank
+        self._head = bank._nextIndex()
+        self._isAccurate = False
+
+    # TimeWindow of the actual data that indicator has received so far
+    def ActualDataTimeWindow(self):
+        last = self._bank._nextIndex() - 1
+        if (last - self._head < 1):
+            return datetime.timedelta(0)
+        return datetime.timedelta(seconds = self._bank._time(last) - self._bank._time(self._head))
+
+    # Returns true if the indicator has enough data to satisfy requested time window
+    def IsAccurate(self):
+        return self._isAccurate
+
+    # Datapoints are fed through the bank only, so that every view sees them once.
+    # Updating the views one by one, like standalone indicators, would feed the
+    # datapoint to the bank once per view and corrupt all of them.
+    def Update(self, d):
+        raise ValueError(self.__class__.__name__ + " is a view of an IndicatorBank, update the bank instead")
+
+    # Same bookkeeping as MovingAverage._updateTimestamps(), for the datapoint
+    # at index that was just added to the bank. Returns true if the oldest
+    # datapoint of the window is outdated and has to be removed.
+    def _isOutdated(self, index, now):
+        length = index - self._head
+        if (length == 0):
+            return False
+        oldest = self._bank._time(self._head)
+        if ( length >= 2 and self._window < self._bank._time(index - 1) - oldest ):
+            self._isAccurate = True
+        return oldest < now - self._window
+
+    def _update(self, index, now, value):
+        pass
+
+# View with the same values as indicator.ma.SimpleMovingAverage
+class SharedSimpleMovingAverage(SharedWindow):
+
+    def _update(self, index, now, value):
+        length = index - self._head
+        if (self._isOutdated(index, now)):
+            self.Value = self.Value + ( value - self._bank._value(self._head) ) / length
+            self._head += 1
+        else:
+            self.Value = self.Value + (value - self.Value) / ( length + 1.0 )
+
+# View with the same values as indicator.ma.ExponentialMovingAverage
+class SharedExponentialMovingAverage(SharedWindow):
+
+    def _update(self, index, now, value):
+        length = index - self._head
+        if (self._isOutdated(index, now)):
+            smoothing = 2.0 / (length + 1.0)
+            self.Value = self.Value + smoothing * ( value - self.Value )
+            self._head += 1
+        else:
+            self.Value = self.Value + (value - self.Value) / ( length + 1.0 )
+
+# Sum of the values in the window, for example the traded volume
+class SharedMovingSum(SharedWindow):
+
+    def _update(self, index, now, value):
+        if (self._isOutdated(index, now)):
+            self.Value = self.Value + value - self._bank._value(self._head)
+            self._head += 1
+        else:
+            self.Value = self.Value + value
+
+# View with the same values as indicator.timeminmax.TimeMin
+class SharedTimeMin(SharedWindow):
+
+    def __init__(self, bank, time_window):
+        SharedWindow.__init__(self, bank, time_window)
+        self.Min = None
+        self._candidates = RingBuffer()
+
+    def _update(self, index, now, value):
+        outdated = self._isOutdated(index, now)
+
+        # Drop the candidates that can not be a minimum anymore
+        while (len(self._candidates) > 0 and self._candidates.Newest(VALUE) > value):
+            self._candidates.DropNewest()
+        self._candidates.Append(index, value)
+
+        if (outdated):
+            self._head += 1
+            if (self._candidates.Oldest(INDEX) < self._head):
+                self._candidates.DropOldest()
+
+        self.Min = self._candidates.Oldest(VALUE)
+        self.Value = self.Min
+
+# View with the same values as indicator.timeminmax.TimeMax
+class SharedTimeMax(SharedWindow):
+
+    def __init__(self, bank, time_window):
+        SharedWindow.__init__(self, bank, time_window)
+        self.Max = None
+        self._candidates = RingBuffer()
+
+    def _update(self, index, now, value):
+        outdated = self._isOutdated(index, now)
+
+        # Drop the candidates that can not be a maximum anymore
+        while (len(self._candidates) > 0 and self._candidates.Newest(VALUE) < value):
+            self._candidates.DropNewest()
+        self._candidates.Append(index, value)
+
+        if (outdated):
+            self._head += 1
+            if (self._candidates.Oldest(INDEX) < self._head):
+                self._candidates.DropOldest()
+
+        self.Max = self._candidates.Oldest(VALUE)
+        self.Value = self.Max
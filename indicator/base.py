@@ -1,3 +1,5 @@
+import time
+
 class Updatable:
     def Update(self, data):
         pass
@@ -30,3 +32,20 @@ class Indicator(Updatable):
             return False
 
         return True
+
+    # Convert a batch of timestamps and values to float NumPy arrays
+    def _checkBatch(self, times, values):
+        import numpy as np
+        times = np.asarray(times, dtype=float)
+        values = np.asarray(values, dtype=float)
+        if (times.ndim != 1 or times.shape != values.shape):
+            raise ValueError("times and values must be one dimensional arrays of the same length")
+        return (times, values)
+
+# Length of a timedelta in seconds
+def toSeconds(timedelta):
+    return timedelta.days * 86400.0 + timedelta.seconds + timedelta.microseconds / 1000000.0
+
+# Unix timestamp of a naive local datetime, the inverse of datetime.fromtimestamp()
+def toTimestamp(date):
+    return time.mktime(date.timetuple()) + date.microsecond / 1000000.0
@@ -0,0 +1,81 @@
+# Window storage aggregated into fixed time buckets
+from ringbuffer import RingBuffer
+
+# Columns of a bucket
+START = 0
+SUM = 1
+COUNT = 2
+MIN = 3
+MAX = 4
+
+# Instead of every datapoint, one row of sum, count, min and max is kept for
+# every bucket of Granularity seconds. Buckets are aligned to the unix epoch
+# and are evicted whole, once they ended before the start of the window.
+# The memory depends on the length of the window and the granularity only,
+# not on the number of trades.
+#
+# Every bucket gets a sequence number: Appended is the sequence number of the
+# newest bucket, and all the buckets up to Evicted have been removed.
+class Buckets:
+
+    # granularity is the length of a bucket in seconds
+    def __init__(self, granularity):
+        if (granularity <= 0):
+            raise ValueError("bucket granularity must be positive")
+        self.Granularity = float(granularity)
+        # Totals over all the buckets in the window
+        self.Sum = 0.0
+        self.Count = 0
+        self.Appended = 0
+        self.Evicted = 0
+        self._rows = RingBuffer(columns = 5)
+        self._newest_timestamp = 0.0
+
+    def __len__(self):
+        return len(self._rows)
+
+    # Add a datapoint to its bucket. Datapoints older than the newest bucket
+    # are added to the newest bucket.
+    def Add(self, now, value):
+        rows = self._rows
+        if (len(rows) == 0 or now >= rows.Newest(START) + self.Granularity):
+            rows.Append(now - now % self.Granularity, value, 1, value, value)
+            self.Appended += 1
+            self._newest_timestamp = now
+        else:
+            rows.Set(SUM, -1, rows.Newest(SUM) + value)
+            rows.Set(COUNT, -1, rows.Newest(COUNT) + 1)
+            if (value < rows.Newest(MIN)):
+                rows.Set(MIN, -1, value)
+            if (value > rows.Newest(MAX)):
+                rows.Set(MAX, -1, value)
+            self._newest_timestamp = max(now, self._newest_timestamp)
+        self.Sum += value
+        self.Count += 1
+
+    # Remove the buckets that ended before window_start
+    def Evict(self, window_start):
+        rows = self._rows
+        while (len(rows) > 0 and rows.Oldest(START) + self.Granularity <= window_start):
+            self.Sum -= rows.Oldest(SUM)
+            self.Count -= int(rows.Oldest(COUNT))
+            rows.DropOldest()
+            self.Evicted += 1
+        if (len(rows) == 0):
+            # Do not carry rounding errors over to the next datapoints
+            self.Sum = 0.0
+            self.Count = 0
+
+    # Value of a column in the oldest bucket
+    def Oldest(self, column):
+        return self._rows.Oldest(column)
+
+    # Value of a column in the newest bucket
+    def Newest(self, column):
+        return self._rows.Newest(column)
+
+    # Seconds between the start of the oldest bucket and the newest datapoint
+    def Span(self):
+        if (len(self._rows) == 0):
+            return 0.0
+        return self._newest_timestamp - self._rows.Oldest(START)
@@ -0,0 +1,203 @@
+# Candle sticks at several resolutions
+import datetime
+from base import Indicator, toSeconds
+from ringbuffer import RingBuffer
+
+# Columns of a bar
+START = 0
+OPEN = 1
+HIGH = 2
+LOW = 3
+CLOSE = 4
+VOLUME = 5
+
+# Aggregates trades into open/high/low/close/volume bars of several resolutions
+# at the same time, for example 1s, 1m, 5m and 1h bars out of one trade stream.
+# Bars are aligned to the unix epoch: a bar of resolution r covers the timestamps
+# [start, start + r). A bar is closed by the first trade of a later bar,
+# periods without trades produce no bars.
+#
+# The last `length` closed bars of every resolution are kept in compact arrays,
+# and the subscribers of a resolution are called with every closed bar:
+#   candles = CandleSeries([datetime.timedelta(minutes = 1), datetime.timedelta(hours = 1)])
+#   candles.Subscribe(datetime.timedelta(minutes = 1), callback)
+#   candles.Update({"now":now, "value":price, "volume":volume})
+# The callback receives a dict with "now" (the end of the bar) and "value" (the
+# closing price), so it can be fed to the other indicators as is, and "start",
+# "open", "high", "low", "close", "volume" and "resolution" (in seconds).
+# Subscribers are not saved with the state, subscribe again after a restore.
+class CandleSeries(Indicator):
+
+    # resolutions are datetime.timedelta or numbers of seconds
+    def __init__(self, resolutions, length = 1000):
+        self.Resolutions = []
+        for resolution in resolutions:
+            if (isinstance(resolution, datetime.timedelta)):
+                resolution = toSeconds(resolution)
+            self.Resolutions.append(abs(float(resolution)))
+        self._length = max(int(length), 1)
+        self._bars = [RingBuffer(columns = 6) for resolution in self.Resolutions]
+        self._open = [None for resolution in self.Resolutions]
+        self._subscribers = [[] for resolution in self.Resolutions]
+        # Bars closed during UpdateMany
+        self._closed = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_subscribers"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._subscribers = [[] for resolution in self.Resolutions]
+
+    # Call callback(bar) every time a bar of the resolution is closed.
+    # Subscribing the same callback again has no effect.
+    def Subscribe(self, resolution, callback):
+        subscribers = self._subscribers[self._resolutionIndex(resolution)]
+        if (callback not in subscribers):
+            subscribers.append(callback)
+
+    # Returns true once a bar of every resolution has been closed
+    def IsAccurate(self):
+        for bars in self._bars:
+            if (len(bars) == 0):
+                return False
+        return True
+
+    # Column of the closed bars of a resolution, ordered from the oldest one
+    def Bars(self, resolution, column = CLOSE):
+        return self._bars[self._resolutionIndex(resolution)].Column(column)
+
+    # The bar of a resolution that is still open, None before the first trade
+    def Current(self, resolution):
+        i = self._resolutionIndex(resolution)
+        if (self._open[i] == None):
+            return None
+        return self._barData(i, self._open[i])
+
+    # The data carries the price in "value" and optionally the traded amount in "volume"
+    def Update(self, d):
+
+        if (not self._checkData(d)):
+            return
+
+        volume = d.get("volume", 0.0)
+        if ( (not isinstance(volume, float)) and (not isinstance(volume, int)) ):
+            volume = 0.0
+
+        self.UpdateTrade(d["now"], d["value"], volume)
+
+    # Fast path of Update for the callers that already hold validated numbers
+    def UpdateValue(self, now, value):
+        self.UpdateTrade(now, value, 0.0)
+
+    def UpdateTrade(self, now, price, volume):
+        for i in range(len(self.Resolutions)):
+            start = now - now % self.Resolutions[i]
+            bar = self._open[i]
+
+            if (bar != None and start > bar[START]):
+                self._closeBar(i, bar)
+                bar = None
+
+            if (bar == None):
+                self._open[i] = [start, price, price, price, price, volume]
+                continue
+
+            if (price > bar[HIGH]):
+                bar[HIGH] = price
+            if (price < bar[LOW]):
+                bar[LOW] = price
+            bar[CLOSE] = price
+            bar[VOLUME] += volume
+
+    # Feed a batch of trades. times, prices and volumes are NumPy arrays (or
+    # array.array) of the same length, volumes may be omitted.
+    # Bars are computed with reduceat over the trades of every bar. The
+    # subscribers get the same bars as with UpdateTrade, but resolution by
+    # resolution instead of interleaved.
+    # Returns a list with the bars closed by the batch for every resolution,
+    # one row of start, open, high, low, close, volume per bar.
+    def UpdateMany(self, times, prices, volumes = None):
+        import numpy as np
+        if (volumes is None):
+            volumes = np.zeros(len(times))
+        (times, prices) = self._checkBatch(times, prices)
+        (times, volumes) = self._checkBatch(times, volumes)
+
+        self._closed = [[] for resolution in self.Resolutions]
+        try:
+            if (np.any(np.diff(times) < 0)):
+                for now, price, volume in zip(times.tolist(), prices.tolist(), volumes.tolist()):
+                    self.UpdateTrade(now, price, volume)
+            elif (len(times) > 0):
+                for i in range(len(self.Resolutions)):
+                    self._updateBars(i, times, prices, volumes)
+            result = [np.array(bars).reshape(-1, 6) for bars in self._closed]
+        finally:
+            self._closed = None
+        return result
+
+    # Aggregate a sorted batch of trades into the bars of one resolution
+    def _updateBars(self, i, times, prices, volumes):
+        import numpy as np
+        starts = times - np.mod(times, self.Resolutions[i])
+        first = np.concatenate(([0], np.flatnonzero(starts[1:] != starts[:-1]) + 1))
+        last = np.concatenate((first[1:] - 1, [len(times) - 1]))
+        bars = np.empty((len(first), 6))
+        bars[:, START] = starts[first]
+        bars[:, OPEN] = prices[first]
+        bars[:, HIGH] = np.maximum.reduceat(prices, first)
+        bars[:, LOW] = np.minimum.reduceat(prices, first)
+        bars[:, CLOSE] = prices[last]
+        bars[:, VOLUME] = np.add.reduceat(volumes, first)
+
+        # The bar that was open before the batch is either closed or continued
+        bar = self._open[i]
+        if (bar != None):
+            if (bars[0, START] > bar[START]):
+                self._closeBar(i, bar)
+            else:
+                bars[0, START] = bar[START]
+                bars[0, OPEN] = bar[OPEN]
+                bars[0, HIGH] = max(bars[0, HIGH], bar[HIGH])
+                bars[0, LOW] = min(bars[0, LOW], bar[LOW])
+                bars[0, VOLUME] += bar[VOLUME]
+
+        for row in bars[:-1].tolist():
+            self._closeBar(i, row)
+        self._open[i] = bars[-1].tolist()
+
+    def _resolutionIndex(self, resolution):
+        if (isinstance(resolution, datetime.timedelta)):
+            resolution = toSeconds(resolution)
+        return self.Resolutions.index(abs(float(resolution)))
+
+    def _barData(self, i, bar):
+        data = {}
+        data["now"] = bar[START] + self.Resolutions[i]
+        data["value"] = bar[CLOSE]
+        data["start"] = bar[START]
+        data["open"] = bar[OPEN]
+        data["high"] = bar[HIGH]
+        data["low"] = bar[LOW]
+        data["close"] = bar[CLOSE]
+        data["volume"] = bar[VOLUME]
+        data["resolution"] = self.Resolutions[i]
+        return data
+
+    # Store a closed bar, keeping at most _length of them, and notify the subscribers
+    def _closeBar(self, i, bar):
+        bars = self._bars[i]
+        if (len(bars) >= self._length):
+            bars.DropOldest()
+        bars.Append(*bar)
+        self._open[i] = None
+        if (self._closed != None):
+            self._closed[i].append(list(bar))
+        if (len(self._subscribers[i]) == 0):
+            return
+        data = self._barData(i, bar)
+        for callback in self._subscribers[i]:
+            callback(data)
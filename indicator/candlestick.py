@@ -1,7 +1,7 @@
 # Candle sticks
 import datetime
 import time
-from base import Indicator
+from base import Indicator, toTimestamp
 
 # Base class for real indicators (SimpleMovingAverage, ExponentialMovingAverage)
 class CandleStick(Indicator):
@@ -27,11 +27,26 @@ class CandleStick(Indicator):
     def __init__(self, openTime, closeTime):
         if (isinstance(openTime, datetime.datetime)):
             self.OpenTime = openTime
+        elif (isinstance(openTime, (int, long, float))):
+            self.OpenTime = datetime.datetime.fromtimestamp(openTime)
         if (isinstance(closeTime, datetime.datetime)):
             self.CloseTime = closeTime
+        elif (isinstance(closeTime, (int, long, float))):
+            self.CloseTime = datetime.datetime.fromtimestamp(closeTime)
+
+        # Opening and closing timestamps as float unix time
+        self._open_timestamp = toTimestamp(self.OpenTime)
+        self._close_timestamp = toTimestamp(self.CloseTime)
         
         self._is_closed = False
 
+    # Older versions kept only the datetime timestamps
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if ("_open_timestamp" not in state):
+            self._open_timestamp = toTimestamp(self.OpenTime)
+            self._close_timestamp = toTimestamp(self.CloseTime)
+
     # Returns true if candle stick accumulated enough data to represent the 
     # time span between Opening and Closing timestamps
     def IsAccurate(self):
@@ -39,7 +54,7 @@ class CandleStick(Indicator):
             
     def Update(self, data):
 
-        if ( self.CloseTime < self.OpenTime ):
+        if ( self._close_timestamp < self._open_timestamp ):
             self._resetPrice(0.0)
             self._is_closed = False
             return
@@ -47,14 +62,81 @@ class CandleStick(Indicator):
         if (not self._checkData(data)):
             return
 
-        _current_timestamp = datetime.datetime.fromtimestamp(data["now"])
-        _price = data["value"]
+        self.UpdateValue(data["now"], data["value"])
+
+    # Fast path of Update for the callers that already hold validated numbers:
+    # now is a unix timestamp, value is a float
+    def UpdateValue(self, now, value):
 
-        if (_current_timestamp >= self.CloseTime):
+        if ( self._close_timestamp < self._open_timestamp ):
+            self._resetPrice(0.0)
+            self._is_closed = False
+            return
+
+        if (now >= self._close_timestamp):
             self._is_closed = True
-        
-        if (_current_timestamp <= self.CloseTime and _current_timestamp >= self.OpenTime):
-            self._updateData(_price)
+
+        if (now <= self._close_timestamp and now >= self._open_timestamp):
+            self._updateData(value)
+
+    # Feed a batch of prices, same as calling Update for every one of them.
+    # times and values are NumPy arrays (or array.array) of the same length.
+    # Returns an array with a row of Open, High, Low, Close after every datapoint
+    def UpdateMany(self, times, values):
+        import numpy as np
+        (times, values) = self._checkBatch(times, values)
+        result = np.zeros((len(times), 4))
+
+        if ( self._close_timestamp < self._open_timestamp ):
+            self._resetPrice(0.0)
+            self._is_closed = False
+            return result
+
+        if (len(times) == 0):
+            return result
+
+        open_time = self._open_timestamp
+        close_time = self._close_timestamp
+        in_candle = (times >= open_time) & (times <= close_time)
+        closing = times >= close_time
+
+        # A zero price would reset the candle again, replay such batches one by one
+        if (np.any(values[in_candle] == 0.0)):
+            values = values.tolist()
+            for i, now in enumerate(times.tolist()):
+                self.UpdateValue(now, values[i])
+                result[i] = (self.Open, self.High, self.Low, self.Close)
+            return result
+
+        start = 0
+        if ( self.High == 0.0 and self.Low == 0.0 and self.Open == 0.0 and self.Close == 0.0):
+            # The first datapoint in the candle initializes all the prices
+            first = np.flatnonzero(in_candle)
+            if (len(first) == 0):
+                self._is_closed = self._is_closed or bool(np.any(closing))
+                return result
+            start = first[0]
+            self._resetPrice(values[start])
+            result[start] = values[start]
+            self._is_closed = False
+            start += 1
+
+        prices = values[start:]
+        mask = in_candle[start:]
+        if (len(prices) > 0):
+            high = np.maximum(self.High, np.maximum.accumulate(np.where(mask, prices, -np.inf)))
+            low = np.minimum(self.Low, np.minimum.accumulate(np.where(mask, prices, np.inf)))
+            last = np.maximum.accumulate(np.where(mask, np.arange(len(prices)), -1))
+            close = np.where(last >= 0, prices[np.maximum(last, 0)], self.Close)
+            result[start:, 0] = self.Open
+            result[start:, 1] = high
+            result[start:, 2] = low
+            result[start:, 3] = close
+            (self.High, self.Low, self.Close) = (float(high[-1]), float(low[-1]), float(close[-1]))
+
+        if (np.any(closing[start:])):
+            self._is_closed = True
+        return result
 
     def _resetPrice(self, price):
         self.High = price
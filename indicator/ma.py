@@ -1,171 +1,478 @@
 # Moving averages indicators
 import datetime
 import time
-from base import Indicator
+import math
+from base import Indicator, toSeconds, toTimestamp
+from ringbuffer import RingBuffer, TIME, VALUE
+from buckets import Buckets, START
 
 # Base class for real indicators (SimpleMovingAverage, ExponentialMovingAverage)
 class MovingAverage(Indicator):
-    
+
     # The current value of moving average
     Value = 0.0
 
     # The window used to calculate the moving average
     TimeWindow = datetime.timedelta(hours=1)
-    
-    def __init__(self, time_window):
+
+    # Indicators that can keep their window in time buckets
+    _supportsBuckets = False
+
+    # Indicators whose UpdateMany keeps the window with _batchWindow()
+    _batchWindowed = False
+
+    # time_window is a datetime.timedelta or a number of seconds
+    # bucket turns on the bucketed mode: instead of every datapoint, the window
+    # keeps the sum, count, min and max of the datapoints of every bucket of
+    # this length (a datetime.timedelta or a number of seconds). The memory
+    # then depends on time_window / bucket only, not on the number of trades.
+    # The price is the precision of the window: whole buckets are evicted once
+    # they ended before the window start, so the window covers between
+    # time_window and time_window + bucket.
+    def __init__(self, time_window, bucket = None):
         if (isinstance(time_window, datetime.timedelta)):
             self.TimeWindow = abs(time_window)
-        self._data = []
-        self._current_timestamp = datetime.datetime.fromtimestamp(time.time())
-        self._window_start_timestamp = datetime.datetime.fromtimestamp(time.time())
-        self._oldest_datapoint_timestamp = datetime.datetime.fromtimestamp(time.time())
+        elif (isinstance(time_window, (int, long, float))):
+            self.TimeWindow = datetime.timedelta(seconds = abs(time_window))
+        # All the timestamps are kept as float unix time, the window in seconds
+        self._window = toSeconds(self.TimeWindow)
+        self._data = RingBuffer()
+        self._buckets = None
+        if (bucket != None):
+            if (not self._supportsBuckets):
+                raise ValueError(self.__class__.__name__ + " does not support bucketed windows")
+            if (isinstance(bucket, datetime.timedelta)):
+                bucket = toSeconds(bucket)
+            self._buckets = Buckets(abs(bucket))
+            self._data = None
+        self._current_timestamp = time.time()
+        self._window_start_timestamp = self._current_timestamp
+        self._oldest_datapoint_timestamp = self._current_timestamp
         self._isAccurate = False
 
+    # Upgrade the state pickled by older versions, which kept the window as a
+    # list of {"now", "value"} dicts and the timestamps as datetime
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if (isinstance(self._data, list)):
+            data = RingBuffer()
+            for datapoint in self._data:
+                data.Append(datapoint["now"], datapoint["value"])
+            self._data = data
+        for name in ("_current_timestamp", "_window_start_timestamp", "_oldest_datapoint_timestamp"):
+            if (isinstance(getattr(self, name), datetime.datetime)):
+                setattr(self, name, toTimestamp(getattr(self, name)))
+        if ("_window" not in state):
+            self._window = toSeconds(self.TimeWindow)
+        if ("_buckets" not in state):
+            self._buckets = None
+
     # TimeWindow of the actual data that indicator has received so far
     def ActualDataTimeWindow(self):
-        if (len(self._data)<=1):
-            return datetime.timedelta(0)
-        oldest = datetime.datetime.fromtimestamp(self._data[0]["now"])
-        newest = datetime.datetime.fromtimestamp(self._data[len(self._data)-1]["now"])
-        result = newest - oldest
-        return result
+        return datetime.timedelta(seconds = self._actualDataSeconds())
 
     # Returns true if the indicator has enough data to satisfy requested time window
     def IsAccurate(self):
         return self._isAccurate
         # return self.TimeWindow > self.ActualDataTimeWindow()
 
-    # Update the running timestamps of the data    
-    def _updateTimestamps(self, data):
-        self._current_timestamp = datetime.datetime.fromtimestamp(data["now"])
-        self._window_start_timestamp = self._current_timestamp - self.TimeWindow
+    def Update(self, d):
+
+        if (not self._checkData(d)):
+            return
+
+        self.UpdateValue(d["now"], d["value"])
+
+    # Fast path of Update for the callers that already hold validated numbers:
+    # now is a unix timestamp, value is a float
+    def UpdateValue(self, now, value):
+        pass
+
+    # Feed a batch of datapoints, same as calling Update for every one of them.
+    # times and values are NumPy arrays (or array.array) of the same length.
+    # Returns the series of Value after every datapoint of the batch
+    def UpdateMany(self, times, values):
+        import numpy as np
+        (times, values) = self._checkBatch(times, values)
+        result = np.empty(len(times))
+        values = values.tolist()
+        for i, now in enumerate(times.tolist()):
+            self.UpdateValue(now, values[i])
+            result[i] = self.Value
+        return result
+
+    # Series of IsAccurate() that UpdateMany would give for a batch of timestamps,
+    # without updating the indicator. It depends on the timestamps only.
+    def AccuracyMany(self, times):
+        import copy
+        import numpy as np
+        (times, values) = self._checkBatch(times, np.zeros(len(times)))
+        if (len(times) == 0):
+            return np.empty(0, dtype=bool)
+        window = None
+        if (self._batchWindowed and self._buckets == None):
+            window = self._batchWindow(times, values)
+        if (window != None):
+            return window[5]
+        # Unsorted timestamps or bucketed window, replay a copy of the indicator
+        indicator = copy.deepcopy(self)
+        result = np.empty(len(times), dtype=bool)
+        for i, now in enumerate(times.tolist()):
+            indicator.UpdateValue(now, 0.0)
+            result[i] = indicator.IsAccurate()
+        return result
+
+    # Seconds between the oldest and the newest datapoint in the window
+    def _actualDataSeconds(self):
+        if (self._buckets != None):
+            return self._buckets.Span()
+        if (len(self._data)<=1):
+            return 0.0
+        return self._data.Newest(TIME) - self._data.Oldest(TIME)
+
+    # Update the running timestamps of the data
+    def _updateTimestamps(self, now):
+        self._current_timestamp = now
+        self._window_start_timestamp = now - self._window
         if (len(self._data)==0):
-            self._oldest_datapoint_timestamp = self._current_timestamp
+            self._oldest_datapoint_timestamp = now
         else:
-            self._oldest_datapoint_timestamp = datetime.datetime.fromtimestamp(self._data[0]["now"])
-        if ( self.TimeWindow < self.ActualDataTimeWindow() ):
+            self._oldest_datapoint_timestamp = self._data.Oldest(TIME)
+        if ( self._window < self._actualDataSeconds() ):
+            self._isAccurate = True
+
+    # Bucketed counterpart of _updateTimestamps(): add the datapoint to its
+    # bucket and evict the buckets that ended before the window start.
+    # Returns true if the data covered the whole window before the update,
+    # which is when the datapoint based window evicts its oldest datapoint.
+    def _updateBuckets(self, now, value):
+        buckets = self._buckets
+        covered = ( len(buckets) > 0 and buckets.Oldest(START) < now - self._window )
+        self._current_timestamp = now
+        self._window_start_timestamp = now - self._window
+        buckets.Add(now, value)
+        buckets.Evict(self._window_start_timestamp)
+        self._oldest_datapoint_timestamp = buckets.Oldest(START)
+        if ( self._window < self._actualDataSeconds() ):
             self._isAccurate = True
+        return covered
+
+    # Replay the window bookkeeping of UpdateValue() over a batch of datapoints at once.
+    # The datapoints stored in the window are prepended to the batch, so the
+    # returned arrays are indexed from the oldest stored datapoint:
+    #  times, values - the stored window followed by the batch
+    #  index         - index of every datapoint of the batch
+    #  heads         - index of the oldest datapoint in the window before every update
+    #  evicted       - true if the update removed the oldest datapoint
+    #  accurate      - IsAccurate() after every update
+    # Returns None if the timestamps are not sorted, such batches are replayed
+    # one datapoint at a time.
+    def _batchWindow(self, times, values):
+        import numpy as np
+
+        stored = len(self._data)
+        times = np.concatenate((_column(self._data, TIME), times))
+        values = np.concatenate((_column(self._data, VALUE), values))
+        if (np.any(np.diff(times) < 0)):
+            return None
+
+        window = self._window
+        index = np.arange(stored, len(times))
+
+        # Datapoints older than the window start, as seen by every update.
+        # Update removes at most one datapoint per call, so the oldest datapoint
+        # lags behind: heads_after[k] = min(heads_after[k-1] + 1, outdated[k])
+        outdated = np.searchsorted(times, times[stored:] - window, side="left")
+        heads_after = index + np.minimum(np.minimum.accumulate(outdated - index), 1 - stored)
+        heads = np.concatenate(([0], heads_after[:-1]))
+        evicted = heads_after > heads
+
+        # IsAccurate() turns true once the window before an update spans more than TimeWindow
+        span = times[np.maximum(index - 1, 0)] - times[heads]
+        accurate = np.logical_or.accumulate(((index - heads) >= 2) & (span > window))
+        accurate |= self._isAccurate
+
+        return (times, values, index, heads, evicted, accurate)
+
+    # Store the window left by the last update of a batch, see _batchWindow()
+    def _storeBatchWindow(self, times, values, index, heads, evicted, accurate):
+        last = index[-1]
+        oldest = heads[-1]
+        self._current_timestamp = float(times[last])
+        self._window_start_timestamp = self._current_timestamp - self._window
+        self._oldest_datapoint_timestamp = float(times[oldest])
+        if (evicted[-1]):
+            oldest += 1
+        self._data.Assign(times[oldest:].tolist(), values[oldest:].tolist())
+        self._isAccurate = bool(accurate[-1])
 
 # Moving average of a price over a period of time
 class SimpleMovingAverage(MovingAverage):
 
-    def Update(self, d):
+    _supportsBuckets = True
+    _batchWindowed = True
 
-        if (not self._checkData(d)):
-            return
+    def UpdateValue(self, now, value):
 
-        # force copy values to prevent storing a reference to the object outside self
-        data = {"now":d["now"], "value":d["value"]}
+        if (self._buckets != None):
+            # The mean of all the datapoints in the buckets
+            self._updateBuckets(now, value)
+            self.Value = self._buckets.Sum / self._buckets.Count
+            return
 
-        self._updateTimestamps(data)
+        self._updateTimestamps(now)
 
         if ( self._oldest_datapoint_timestamp < self._window_start_timestamp ):
             # Update current moving average, avoiding the loop over all datapoints
-            self.Value = self.Value + ( data["value"] - self._data[0]["value"] ) / len(self._data) 
+            self.Value = self.Value + ( value - self._data.Oldest(VALUE) ) / len(self._data)
             # Remove outdated datapoint from the storage
-            self._data.pop(0)
+            self._data.DropOldest()
         else:
             # Not enough data accumulated. Compute cumulative moving average
-            self.Value = self.Value + (data["value"] - self.Value) / ( len(self._data) + 1.0 )
+            self.Value = self.Value + (value - self.Value) / ( len(self._data) + 1.0 )
 
         # Add the data point to the storage
-        self._data.append(data)
+        self._data.Append(now, value)
+
+    # The moving average is the mean of the window, so a batch is computed
+    # from the cumulative sums of the values
+    def UpdateMany(self, times, values):
+        import numpy as np
+        (times, values) = self._checkBatch(times, values)
+        if (len(times) == 0):
+            return np.empty(0)
+        if (self._buckets != None):
+            return MovingAverage.UpdateMany(self, times, values)
+
+        window = self._batchWindow(times, values)
+        if (window == None):
+            return MovingAverage.UpdateMany(self, times, values)
+        (times, values, index, heads, evicted, accurate) = window
+
+        # Shift the values by the first one to keep the sums small
+        base = values[0]
+        sums = np.concatenate(([0.0], np.cumsum(values - base)))
+        heads_after = heads + evicted
+        result = base + (sums[index + 1] - sums[heads_after]) / (index + 1 - heads_after)
+
+        self._storeBatchWindow(times, values, index, heads, evicted, accurate)
+        self.Value = float(result[-1])
+        return result
 
 # Moving average with exponential smoothing of a price over a period of time
 class ExponentialMovingAverage(MovingAverage):
 
-    def Update(self, d):
+    _supportsBuckets = True
+    _batchWindowed = True
 
-        if (not self._checkData(d)):
+    def UpdateValue(self, now, value):
+
+        if (self._buckets != None):
+            # Smoothing by the number of datapoints in the buckets
+            if (self._updateBuckets(now, value)):
+                smoothing = 2.0 / (self._buckets.Count + 1.0)
+                self.Value = self.Value + smoothing * ( value - self.Value )
+            else:
+                self.Value = self.Value + (value - self.Value) / self._buckets.Count
             return
-        
-        # force copy values to prevent storing a reference to the object outside self
-        data = {"now":d["now"], "value":d["value"]}
-       
-        self._updateTimestamps(data)
-        
+
+        self._updateTimestamps(now)
+
         smoothing = 2.0 / (len(self._data) + 1.0)
 
         if ( self._oldest_datapoint_timestamp < self._window_start_timestamp ):
             # Update current exponential moving average, avoiding the loop over all datapoints
-            self.Value = self.Value + smoothing * ( data["value"] - self.Value ) 
+            self.Value = self.Value + smoothing * ( value - self.Value )
             # Remove outdated datapoint from the storage
-            self._data.pop(0)
+            self._data.DropOldest()
         else:
             # Not enough data accumulated. Compute cumulative moving average
-            self.Value = self.Value + (data["value"] - self.Value) / ( len(self._data) + 1.0 )
+            self.Value = self.Value + (value - self.Value) / ( len(self._data) + 1.0 )
 
         # Add the data point to the storage
-        self._data.append(data)
-    
+        self._data.Append(now, value)
+
+    # The smoothing depends on the previous value, so only the window
+    # bookkeeping is done in bulk and the recurrence runs over plain floats
+    def UpdateMany(self, times, values):
+        import numpy as np
+        (times, values) = self._checkBatch(times, values)
+        if (len(times) == 0):
+            return np.empty(0)
+        if (self._buckets != None):
+            return MovingAverage.UpdateMany(self, times, values)
+
+        window = self._batchWindow(times, values)
+        if (window == None):
+            return MovingAverage.UpdateMany(self, times, values)
+        (times, values, index, heads, evicted, accurate) = window
+
+        result = np.empty(len(index))
+        value = self.Value
+        lengths = (index - heads).tolist()
+        batch = values[index].tolist()
+        evicted_list = evicted.tolist()
+        for i in range(len(batch)):
+            if (evicted_list[i]):
+                smoothing = 2.0 / (lengths[i] + 1.0)
+                value = value + smoothing * ( batch[i] - value )
+            else:
+                value = value + (batch[i] - value) / ( lengths[i] + 1.0 )
+            result[i] = value
+
+        self._storeBatchWindow(times, values, index, heads, evicted, accurate)
+        self.Value = value
+        return result
+
+# Moving average with exponential time decay of a price over a period of time
+# Every datapoint is weighted by exp(-age/tau), where age is the time passed
+# since it arrived, and Value is the weighted mean of all datapoints so far.
+# Trades come at irregular times, so the weight decays by exp(-dt/tau) between
+# two datapoints, dt being the time between them. Only the last value, the sum
+# of the weights and the last timestamp are kept, the memory does not grow with
+# the number of datapoints in the window.
+#
+# Conversion from ExponentialMovingAverage: it smooths with 2/(N+1), where N is
+# the number of datapoints in TimeWindow. With a trade every dt seconds,
+# N = TimeWindow/dt, and the weight of a datapoint 1-exp(-dt/tau) ~ dt/tau
+# equals 2/(N+1) ~ 2*dt/TimeWindow for tau = TimeWindow/2, which is the default.
+# So a strategy can switch by importing this class as ema instead of
+# ExponentialMovingAverage, without changing the time windows.
+# IsAccurate() turns true once more than TimeWindow passed since the first
+# datapoint, same as for the windowed moving averages.
+class TimeExponentialMovingAverage(MovingAverage):
+
+    # tau is the decay time constant, a datetime.timedelta or a number of seconds
+    def __init__(self, time_window, tau = None):
+        MovingAverage.__init__(self, time_window)
+        # No window storage, the whole state is Value, weight and two timestamps
+        self._data = None
+        if (isinstance(tau, datetime.timedelta)):
+            self._tau = toSeconds(abs(tau))
+        elif (isinstance(tau, (int, long, float))):
+            self._tau = abs(float(tau))
+        else:
+            self._tau = self._window / 2.0
+        self._weight = 0.0
+        self._first_timestamp = None
+
+    def UpdateValue(self, now, value):
+
+        if (self._first_timestamp == None):
+            self._first_timestamp = now
+            self._current_timestamp = now
+
+        # Decay the weight of the datapoints received so far
+        dt = max(now - self._current_timestamp, 0.0)
+        if (self._tau > 0.0):
+            self._weight = self._weight * math.exp(-dt / self._tau) + 1.0
+        else:
+            self._weight = 1.0
+        self.Value = self.Value + (value - self.Value) / self._weight
+        self._current_timestamp = max(now, self._current_timestamp)
+
+        if ( self._window < self._actualDataSeconds() ):
+            self._isAccurate = True
+
+    # The decay factors are computed in bulk, the recurrence runs over plain floats
+    def UpdateMany(self, times, values):
+        import numpy as np
+        (times, values) = self._checkBatch(times, values)
+        if (len(times) == 0):
+            return np.empty(0)
+        if (self._first_timestamp == None):
+            self.UpdateValue(times[0], values[0])
+            return np.concatenate(([self.Value], self.UpdateMany(times[1:], values[1:])))
+
+        latest = np.maximum.accumulate(np.concatenate(([self._current_timestamp], times)))
+        dt = np.maximum(times - latest[:-1], 0.0)
+        if (self._tau > 0.0):
+            decay = np.exp(-dt / self._tau).tolist()
+        else:
+            decay = np.zeros(len(times)).tolist()
+
+        result = np.empty(len(times))
+        value = self.Value
+        weight = self._weight
+        batch = values.tolist()
+        for i in range(len(batch)):
+            weight = weight * decay[i] + 1.0
+            value = value + (batch[i] - value) / weight
+            result[i] = value
+
+        self.Value = value
+        self._weight = weight
+        self._current_timestamp = float(latest[-1])
+        if ( self._window < self._actualDataSeconds() ):
+            self._isAccurate = True
+        return result
+
+    def _actualDataSeconds(self):
+        if (self._first_timestamp == None):
+            return 0.0
+        return self._current_timestamp - self._first_timestamp
+
 # Moving average with exponential smoothing of a volume over a period of time
 # If two values arrive on the same timestamp, they are added together
-# Imagine to execute an order there was several trades, then the total volume 
-# of the order would be split up into several volumes. 
+# Imagine to execute an order there was several trades, then the total volume
+# of the order would be split up into several volumes.
 class SimpleCummulativeMovingAverage(MovingAverage):
 
-    def Update(self, d):
+    def UpdateValue(self, now, value):
 
-        if (not self._checkData(d)):
-            return
-
-        # force copy values to prevent storing a reference to the object outside self
-        data = {"now":d["now"], "value":d["value"]}
-        
         # if there is more values for the same point in time, add them up
-        if (datetime.datetime.fromtimestamp(data["now"]) == self._current_timestamp):
-            data["value"] += self._data.pop()["value"]
+        if (now == self._current_timestamp):
+            value += self._data.PopNewest()[VALUE]
             self.Value = self._lastValue
 
         self._lastValue = self.Value
 
-        self._updateTimestamps(data)
+        self._updateTimestamps(now)
 
         if ( self._oldest_datapoint_timestamp < self._window_start_timestamp ):
             # Update current moving average, avoiding the loop over all datapoints
-            self.Value = self.Value + ( data["value"] - self._data[0]["value"] ) / len(self._data) 
+            self.Value = self.Value + ( value - self._data.Oldest(VALUE) ) / len(self._data)
             # Remove outdated datapoint from the storage
-            self._data.pop(0)
+            self._data.DropOldest()
         else:
             # Not enough data accumulated. Compute cumulative moving average
-            self.Value = self.Value + (data["value"] - self.Value) / ( len(self._data) + 1.0 )
+            self.Value = self.Value + (value - self.Value) / ( len(self._data) + 1.0 )
 
         # Add the data point to the storage
-        self._data.append(data)
+        self._data.Append(now, value)
 
 # Moving average with exponential smoothing of a volume over a period of time
 # If two values arrive on the same timestamp, they are added together
-# Imagine to execute an order there was several trades, then the total volume 
-# of the order would be split up into several volumes. 
+# Imagine to execute an order there was several trades, then the total volume
+# of the order would be split up into several volumes.
 class ExponentialCummulativeMovingAverage(MovingAverage):
 
-    def Update(self, d):
+    def UpdateValue(self, now, value):
 
-        if (not self._checkData(d)):
-            return
-        
-        # force copy values to prevent storing a reference to the object outside self
-        data = {"now":d["now"], "value":d["value"]}
-        
         # if there is more values for the same point in time, add them up
-        if (datetime.datetime.fromtimestamp(data["now"]) == self._current_timestamp):
-            data["value"] += self._data.pop()["value"]
+        if (now == self._current_timestamp):
+            value += self._data.PopNewest()[VALUE]
             self.Value = self._lastValue
 
         self._lastValue = self.Value
-       
-        self._updateTimestamps(data)
-        
+
+        self._updateTimestamps(now)
+
         smoothing = 2.0 / (len(self._data) + 1.0)
 
         if ( self._oldest_datapoint_timestamp < self._window_start_timestamp ):
             # Update current exponential moving average, avoiding the loop over all datapoints
-            self.Value = self.Value + smoothing * ( data["value"] - self.Value ) 
+            self.Value = self.Value + smoothing * ( value - self.Value )
             # Remove outdated datapoint from the storage
-            self._data.pop(0)
+            self._data.DropOldest()
         else:
             # Not enough data accumulated. Compute cumulative moving average
-            self.Value = self.Value + (data["value"] - self.Value) / ( len(self._data) + 1.0 )
+            self.Value = self.Value + (value - self.Value) / ( len(self._data) + 1.0 )
 
         # Add the data point to the storage
-        self._data.append(data)
+        self._data.Append(now, value)
+
+# Column of a RingBuffer as a NumPy array
+def _column(ringbuffer, column):
+    import numpy as np
+    return np.array(ringbuffer.Column(column), dtype=float)
@@ -0,0 +1,134 @@
+# Compact storage for the datapoints of indicator windows
+from array import array
+
+# Column indexes of the default (time, value) layout
+TIME = 0
+VALUE = 1
+
+# First in, first out storage of rows of floats.
+# Every column is kept in its own typed array('d'), so a datapoint costs
+# 8 bytes per column instead of a dict. Rows are appended at the newest end
+# and evicted from the oldest end in O(1). When the buffer is full, the
+# capacity is doubled.
+class RingBuffer:
+
+    def __init__(self, columns = 2, capacity = 16):
+        capacity = max(int(capacity), 1)
+        self._columns = [array('d', [0.0]) * capacity for i in range(columns)]
+        self._capacity = capacity
+        self._head = 0
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    # Add a row at the newest end of the buffer
+    def Append(self, *row):
+        if (self._length == self._capacity):
+            self._grow()
+        position = self._head + self._length
+        if (position >= self._capacity):
+            position -= self._capacity
+        columns = self._columns
+        for i in range(len(row)):
+            columns[i][position] = row[i]
+        self._length += 1
+
+    # Remove the oldest row
+    def DropOldest(self):
+        if (self._length == 0):
+            raise IndexError("drop from an empty RingBuffer")
+        self._head += 1
+        if (self._head == self._capacity):
+            self._head = 0
+        self._length -= 1
+
+    # Remove the newest row
+    def DropNewest(self):
+        if (self._length == 0):
+            raise IndexError("drop from an empty RingBuffer")
+        self._length -= 1
+
+    # Remove the newest row and return it as a tuple
+    def PopNewest(self):
+        if (self._length == 0):
+            raise IndexError("pop from an empty RingBuffer")
+        self._length -= 1
+        position = self._head + self._length
+        if (position >= self._capacity):
+            position -= self._capacity
+        return tuple([column[position] for column in self._columns])
+
+    # Value of a column in the oldest row
+    def Oldest(self, column):
+        if (self._length == 0):
+            raise IndexError("RingBuffer is empty")
+        return self._columns[column][self._head]
+
+    # Value of a column in the newest row
+    def Newest(self, column):
+        if (self._length == 0):
+            raise IndexError("RingBuffer is empty")
+        position = self._head + self._length - 1
+        if (position >= self._capacity):
+            position -= self._capacity
+        return self._columns[column][position]
+
+    # Value of a column in a row. Index 0 is the oldest row, -1 the newest one
+    def Get(self, column, index):
+        return self._columns[column][self._position(index)]
+
+    # Overwrite the value of a column in a row, indexed the same way as Get
+    def Set(self, column, index, value):
+        self._columns[column][self._position(index)] = value
+
+    # Copy of a column ordered from the oldest to the newest row
+    def Column(self, column):
+        data = self._columns[column]
+        end = self._head + self._length
+        if (end <= self._capacity):
+            return data[self._head:end]
+        return data[self._head:] + data[:end - self._capacity]
+
+    # Replace the content of the buffer with the given columns, one sequence
+    # of equal length per column
+    def Assign(self, *columns):
+        if (len(columns) != len(self._columns)):
+            raise ValueError("expected " + str(len(self._columns)) + " columns")
+        length = len(columns[0])
+        capacity = 16
+        while (capacity < length):
+            capacity *= 2
+        data = []
+        for column in columns:
+            if (len(column) != length):
+                raise ValueError("all columns must have the same length")
+            column = array('d', column)
+            column.extend(array('d', [0.0]) * (capacity - length))
+            data.append(column)
+        self._columns = data
+        self._capacity = capacity
+        self._head = 0
+        self._length = length
+
+    def Clear(self):
+        self._head = 0
+        self._length = 0
+
+    def _position(self, index):
+        if (index < 0):
+            index += self._length
+        if (index < 0 or index >= self._length):
+            raise IndexError("RingBuffer index out of range")
+        return (self._head + index) % self._capacity
+
+    # Double the capacity, unwrapping the rows to the start of the new arrays
+    def _grow(self):
+        columns = []
+        for column in range(len(self._columns)):
+            data = self.Column(column)
+            data.extend(array('d', [0.0]) * self._capacity)
+            columns.append(data)
+        self._columns = columns
+        self._head = 0
+        self._capacity *= 2
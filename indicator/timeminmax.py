@@ -1,73 +1,180 @@
 from ma import MovingAverage
+from ringbuffer import RingBuffer, VALUE
+from buckets import MIN, MAX
+
+# Candidates for the extreme are stored as (sequence number, value) rows
+SEQUENCE = 0
 
 # Indicator to represent a minimum value over a time window
 # For example, the minimum price of all trades during a time period
+#
+# Candidates for the minimum are kept in a monotonic deque: every datapoint
+# that is larger than a newer one can never become the minimum again, so it
+# is dropped. The front of the deque is always the minimum of the window,
+# which makes both update and eviction amortized O(1).
 class TimeMin(MovingAverage):
 
-    def __init__(self, time_window):
-        MovingAverage.__init__(self, time_window)
-        self.Min = None
-
-    def Update(self, d):
+    _supportsBuckets = True
 
-        if (not self._checkData(d)):
+    def __init__(self, time_window, bucket = None):
+        MovingAverage.__init__(self, time_window, bucket)
+        self.Min = None
+        self._candidates = RingBuffer()
+        self._appended = 0
+        self._evicted = 0
+
+    # Older versions kept no candidates, they are rebuilt from the window
+    def __setstate__(self, state):
+        MovingAverage.__setstate__(self, state)
+        if ("_candidates" in state):
+            return
+        self._candidates = RingBuffer()
+        self._appended = 0
+        self._evicted = 0
+        for value in self._data.Column(VALUE):
+            self._appended += 1
+            while (len(self._candidates) > 0 and self._candidates.Newest(VALUE) > value):
+                self._candidates.DropNewest()
+            self._candidates.Append(self._appended, value)
+
+    def UpdateValue(self, now, value):
+
+        if (self._buckets != None):
+            self._updateBucketMin(now, value)
             return
 
-        # force copy values to prevent storing a reference to the object outside self
-        data = {"now":d["now"], "value":d["value"]}
-
-        self._updateTimestamps(data)
+        self._updateTimestamps(now)
 
         # Add the data point to the storage
-        self._data.append(data)
-
-        # Recalculate min
-        if (self.Min == None):
-            self.Min = d["value"]
+        self._data.Append(now, value)
+        self._appended += 1
 
-        if (d["value"] < self.Min):
-            self.Min = d["value"]
+        # Drop the candidates that can not be a minimum anymore
+        while (len(self._candidates) > 0 and self._candidates.Newest(VALUE) > value):
+            self._candidates.DropNewest()
+        self._candidates.Append(self._appended, value)
 
         if ( self._oldest_datapoint_timestamp < self._window_start_timestamp ):
             # Remove outdated datapoint from the storage
-            oldest_value = self._data.pop(0)
-            # if the oldest was the minimum, do a full linear search for min
-            if (self.Min == oldest_value["value"]):
-                minvalue = min(self._data, key=lambda x:x["value"])
-                self.Min = minvalue["value"]
+            self._data.DropOldest()
+            self._evicted += 1
+            if (self._candidates.Oldest(SEQUENCE) <= self._evicted):
+                self._candidates.DropOldest()
+
+        self.Min = self._candidates.Oldest(VALUE)
+
+    # In the bucketed mode the candidates are the minima of the buckets,
+    # at most one per bucket, numbered by the bucket sequence
+    def _updateBucketMin(self, now, value):
+        buckets = self._buckets
+        self._updateBuckets(now, value)
+        extreme = buckets.Newest(MIN)
+
+        # The previous minimum of the newest bucket is replaced
+        if (len(self._candidates) > 0 and self._candidates.Newest(SEQUENCE) == buckets.Appended):
+            self._candidates.DropNewest()
+        while (len(self._candidates) > 0 and self._candidates.Newest(VALUE) > extreme):
+            self._candidates.DropNewest()
+        self._candidates.Append(buckets.Appended, extreme)
+
+        while (self._candidates.Oldest(SEQUENCE) <= buckets.Evicted):
+            self._candidates.DropOldest()
+
+        self.Min = self._candidates.Oldest(VALUE)
+
+    # Same as MovingAverage.UpdateMany, returns the series of Min
+    def UpdateMany(self, times, values):
+        import numpy as np
+        (times, values) = self._checkBatch(times, values)
+        result = np.empty(len(times))
+        values = values.tolist()
+        for i, now in enumerate(times.tolist()):
+            self.UpdateValue(now, values[i])
+            result[i] = self.Min
+        return result
 
 # Indicator to represent a maximum value over a time window
 # For example, the maximum price of all trades during a time period
+#
+# Same as TimeMin, the deque keeps only the datapoints that are not
+# dominated by a newer and larger value.
 class TimeMax(MovingAverage):
 
-    def __init__(self, time_window):
-        MovingAverage.__init__(self, time_window)
-        self.Max = None
-
-    def Update(self, d):
+    _supportsBuckets = True
 
-        if (not self._checkData(d)):
+    def __init__(self, time_window, bucket = None):
+        MovingAverage.__init__(self, time_window, bucket)
+        self.Max = None
+        self._candidates = RingBuffer()
+        self._appended = 0
+        self._evicted = 0
+
+    # Older versions kept no candidates, they are rebuilt from the window
+    def __setstate__(self, state):
+        MovingAverage.__setstate__(self, state)
+        if ("_candidates" in state):
+            return
+        self._candidates = RingBuffer()
+        self._appended = 0
+        self._evicted = 0
+        for value in self._data.Column(VALUE):
+            self._appended += 1
+            while (len(self._candidates) > 0 and self._candidates.Newest(VALUE) < value):
+                self._candidates.DropNewest()
+            self._candidates.Append(self._appended, value)
+
+    def UpdateValue(self, now, value):
+
+        if (self._buckets != None):
+            self._updateBucketMax(now, value)
             return
 
-        # force copy values to prevent storing a reference to the object outside self
-        data = {"now":d["now"], "value":d["value"]}
-
-        self._updateTimestamps(data)
+        self._updateTimestamps(now)
 
         # Add the data point to the storage
-        self._data.append(data)
-
-        # Recalculate max
-        if (self.Max == None):
-            self.Max = d["value"]
+        self._data.Append(now, value)
+        self._appended += 1
 
-        if (d["value"] > self.Max):
-            self.Max = d["value"]
+        # Drop the candidates that can not be a maximum anymore
+        while (len(self._candidates) > 0 and self._candidates.Newest(VALUE) < value):
+            self._candidates.DropNewest()
+        self._candidates.Append(self._appended, value)
 
         if ( self._oldest_datapoint_timestamp < self._window_start_timestamp ):
             # Remove outdated datapoint from the storage
-            oldest_value = self._data.pop(0)
-            # if the oldest was the maximum, do a full linear search for min
-            if (self.Max == oldest_value["value"]):
-                maxvalue = max(self._data, key=lambda x:x["value"])
-                self.Max = maxvalue["value"]
+            self._data.DropOldest()
+            self._evicted += 1
+            if (self._candidates.Oldest(SEQUENCE) <= self._evicted):
+                self._candidates.DropOldest()
+
+        self.Max = self._candidates.Oldest(VALUE)
+
+    # In the bucketed mode the candidates are the maxima of the buckets,
+    # at most one per bucket, numbered by the bucket sequence
+    def _updateBucketMax(self, now, value):
+        buckets = self._buckets
+        self._updateBuckets(now, value)
+        extreme = buckets.Newest(MAX)
+
+        # The previous maximum of the newest bucket is replaced
+        if (len(self._candidates) > 0 and self._candidates.Newest(SEQUENCE) == buckets.Appended):
+            self._candidates.DropNewest()
+        while (len(self._candidates) > 0 and self._candidates.Newest(VALUE) < extreme):
+            self._candidates.DropNewest()
+        self._candidates.Append(buckets.Appended, extreme)
+
+        while (self._candidates.Oldest(SEQUENCE) <= buckets.Evicted):
+            self._candidates.DropOldest()
+
+        self.Max = self._candidates.Oldest(VALUE)
+
+    # Same as MovingAverage.UpdateMany, returns the series of Max
+    def UpdateMany(self, times, values):
+        import numpy as np
+        (times, values) = self._checkBatch(times, values)
+        result = np.empty(len(times))
+        values = values.tolist()
+        for i, now in enumerate(times.tolist()):
+            self.UpdateValue(now, values[i])
+            result[i] = self.Max
+        return result
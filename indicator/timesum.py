@@ -1,7 +1,7 @@
 # Candle sticks
 import datetime
 import time
-from base import Indicator
+from base import Indicator, toTimestamp
 
 # Indicator to represent a sum of values over a time window
 # For example, the volume of all trades during a time period
@@ -18,11 +18,26 @@ class TimeSum(Indicator):
     def __init__(self, openTime, closeTime):
         if (isinstance(openTime, datetime.datetime)):
             self.OpenTime = openTime
+        elif (isinstance(openTime, (int, long, float))):
+            self.OpenTime = datetime.datetime.fromtimestamp(openTime)
         if (isinstance(closeTime, datetime.datetime)):
             self.CloseTime = closeTime
+        elif (isinstance(closeTime, (int, long, float))):
+            self.CloseTime = datetime.datetime.fromtimestamp(closeTime)
+
+        # Opening and closing timestamps as float unix time
+        self._open_timestamp = toTimestamp(self.OpenTime)
+        self._close_timestamp = toTimestamp(self.CloseTime)
         
         self._is_closed = False
 
+    # Older versions kept only the datetime timestamps
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if ("_open_timestamp" not in state):
+            self._open_timestamp = toTimestamp(self.OpenTime)
+            self._close_timestamp = toTimestamp(self.CloseTime)
+
     # Returns true if candle stick accumulated enough data to represent the 
     # time span between Opening and Closing timestamps
     def IsAccurate(self):
@@ -30,7 +45,7 @@ class TimeSum(Indicator):
             
     def Update(self, data):
 
-        if ( self.CloseTime < self.OpenTime ):
+        if ( self._close_timestamp < self._open_timestamp ):
             self._resetValue(0.0)
             self._is_closed = False
             return
@@ -38,14 +53,47 @@ class TimeSum(Indicator):
         if (not self._checkData(data)):
             return
 
-        _current_timestamp = datetime.datetime.fromtimestamp(data["now"])
-        _value = data["value"]
+        self.UpdateValue(data["now"], data["value"])
+
+    # Fast path of Update for the callers that already hold validated numbers:
+    # now is a unix timestamp, value is a float
+    def UpdateValue(self, now, value):
 
-        if (_current_timestamp >= self.CloseTime):
+        if ( self._close_timestamp < self._open_timestamp ):
+            self._resetValue(0.0)
+            self._is_closed = False
+            return
+
+        if (now >= self._close_timestamp):
             self._is_closed = True
-        
-        if (_current_timestamp <= self.CloseTime and _current_timestamp >= self.OpenTime):
-            self._updateData(_value)
+
+        if (now <= self._close_timestamp and now >= self._open_timestamp):
+            self._updateData(value)
+
+    # Feed a batch of values, same as calling Update for every one of them.
+    # times and values are NumPy arrays (or array.array) of the same length.
+    # Returns the series of Value after every datapoint
+    def UpdateMany(self, times, values):
+        import numpy as np
+        (times, values) = self._checkBatch(times, values)
+
+        if ( self._close_timestamp < self._open_timestamp ):
+            self._resetValue(0.0)
+            self._is_closed = False
+            return np.zeros(len(times))
+
+        if (len(times) == 0):
+            return np.empty(0)
+
+        open_time = self._open_timestamp
+        close_time = self._close_timestamp
+        in_sum = (times >= open_time) & (times <= close_time)
+        result = np.cumsum(np.concatenate(([self.Value], np.where(in_sum, values, 0.0))))[1:]
+
+        self.Value = float(result[-1])
+        if (np.any(times >= close_time)):
+            self._is_closed = True
+        return result
 
     def _resetValue(self, value):
         self.Value = value
@@ -0,0 +1,161 @@
+# Dispersion indicators: variance, standard deviation and Bollinger bands
+import math
+from ma import MovingAverage, _column
+from ringbuffer import VALUE
+
+# Variance of a price over a period of time
+# The window is the same as the one of SimpleMovingAverage, and Mean has
+# its value. The sum of squared differences from the mean is updated
+# Welford style when a datapoint is added, and when an outdated datapoint is
+# replaced by the new one, so an update costs the same as for the moving average.
+# The rounding errors of the updates add up, most for small moves of a large
+# price, so the mean and the sum are computed again from the window every time
+# all of its datapoints have been replaced.
+# Value is the (population) variance, also available as Variance, and
+# StandardDeviation is its square root.
+class MovingVariance(MovingAverage):
+
+    _batchWindowed = True
+
+    def __init__(self, time_window):
+        MovingAverage.__init__(self, time_window)
+        self.Mean = 0.0
+        self.Variance = 0.0
+        self.StandardDeviation = 0.0
+        # Sum of the squared differences from the mean of the window
+        self._m2 = 0.0
+        # Datapoints replaced since the sum was computed from the window
+        self._replaced = 0
+
+    def UpdateValue(self, now, value):
+
+        self._updateTimestamps(now)
+
+        if ( self._oldest_datapoint_timestamp < self._window_start_timestamp ):
+            # The new datapoint replaces the outdated one, the size of the window stays
+            oldest = self._data.Oldest(VALUE)
+            mean = self.Mean + ( value - oldest ) / len(self._data)
+            self._m2 += ( value - oldest ) * ( value - mean + oldest - self.Mean )
+            self.Mean = mean
+            # Remove outdated datapoint from the storage
+            self._data.DropOldest()
+            self._replaced += 1
+        else:
+            # Not enough data accumulated. Add the datapoint to the window
+            delta = value - self.Mean
+            self.Mean = self.Mean + delta / ( len(self._data) + 1.0 )
+            self._m2 += delta * ( value - self.Mean )
+
+        # Add the data point to the storage
+        self._data.Append(now, value)
+
+        if (self._replaced >= len(self._data)):
+            self._resync()
+
+        # Rounding errors must not make the variance negative
+        if (self._m2 < 0.0):
+            self._m2 = 0.0
+        self._setStatistics(self.Mean, self._m2 / len(self._data))
+
+    # The mean and the variance of every window are computed from the cumulative
+    # sums of the values and of their squares.
+    # Returns the series of Value after every datapoint of the batch
+    def UpdateMany(self, times, values):
+        import numpy as np
+        (times, values) = self._checkBatch(times, values)
+        if (len(times) == 0):
+            return self._batchResult(np.empty(0), np.empty(0))
+
+        window = self._batchWindow(times, values)
+        if (window == None):
+            # Unsorted timestamps, replay the datapoints one at a time
+            means = np.empty(len(times))
+            variances = np.empty(len(times))
+            batch = values.tolist()
+            for i, now in enumerate(times.tolist()):
+                self.UpdateValue(now, batch[i])
+                means[i] = self.Mean
+                variances[i] = self.Variance
+            return self._batchResult(means, variances)
+        (times, values, index, heads, evicted, accurate) = window
+
+        # Shift the values by the first one to keep the sums small
+        base = values[0]
+        shifted = values - base
+        sums = np.concatenate(([0.0], np.cumsum(shifted)))
+        squares = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+        heads_after = heads + evicted
+        counts = index + 1 - heads_after
+        means = ( sums[index + 1] - sums[heads_after] ) / counts
+        variances = ( squares[index + 1] - squares[heads_after] ) / counts - means * means
+        variances = np.maximum(variances, 0.0)
+        means += base
+
+        self._storeBatchWindow(times, values, index, heads, evicted, accurate)
+        self._m2 = float(variances[-1]) * len(self._data)
+        self._replaced = 0
+        self._setStatistics(float(means[-1]), float(variances[-1]))
+        return self._batchResult(means, variances)
+
+    # Compute the mean and the sum of squared differences from the window,
+    # shifted by its oldest value to keep the sums small
+    def _resync(self):
+        values = self._data.Column(VALUE)
+        base = values[0]
+        total = 0.0
+        for value in values:
+            total += value - base
+        mean = total / len(values)
+        m2 = 0.0
+        for value in values:
+            m2 += ( value - base - mean ) ** 2
+        self.Mean = base + mean
+        self._m2 = m2
+        self._replaced = 0
+
+    def _setStatistics(self, mean, variance):
+        self.Mean = mean
+        self.Variance = variance
+        self.StandardDeviation = math.sqrt(variance)
+        self.Value = variance
+
+    # Values of a batch, given the mean and the variance after every datapoint
+    def _batchResult(self, means, variances):
+        return variances
+
+# Standard deviation of a price over a period of time
+# Same as MovingVariance, with Value being the standard deviation
+class MovingStandardDeviation(MovingVariance):
+
+    def _setStatistics(self, mean, variance):
+        MovingVariance._setStatistics(self, mean, variance)
+        self.Value = self.StandardDeviation
+
+    def _batchResult(self, means, variances):
+        import numpy as np
+        return np.sqrt(variances)
+
+# Bollinger bands of a price over a period of time
+# Middle is the simple moving average of the window, Upper and Lower are
+# width standard deviations above and below it. Value is the middle band.
+# UpdateMany() returns a row of Lower, Middle, Upper for every datapoint.
+class BollingerBands(MovingVariance):
+
+    def __init__(self, time_window, width = 2.0):
+        MovingVariance.__init__(self, time_window)
+        self.Width = abs(float(width))
+        self.Middle = 0.0
+        self.Upper = 0.0
+        self.Lower = 0.0
+
+    def _setStatistics(self, mean, variance):
+        MovingVariance._setStatistics(self, mean, variance)
+        self.Middle = mean
+        self.Upper = mean + self.Width * self.StandardDeviation
+        self.Lower = mean - self.Width * self.StandardDeviation
+        self.Value = mean
+
+    def _batchResult(self, means, variances):
+        import numpy as np
+        deviations = self.Width * np.sqrt(variances)
+        return np.column_stack((means - deviations, means, means + deviations))
@@ -0,0 +1,113 @@
+import numpy as np
+
+"""
+	Risk and return statistics of a backtest, computed with NumPy.
+	A MockExchangeConnection keeps its fills, the BTC and USD it holds
+	after every order and the date of the order. The holdings only change
+	with an order, so the equity after every trade is the price array times
+	the BTC held plus the USD held, looked up for all the trades at once.
+	The statistics are computed from that equity curve:
+
+		return			final equity over the equity at the first trade, minus 1
+		sharpe			mean over standard deviation of the returns every
+						METRICS_INTERVAL seconds, annualized (the market never closes)
+		max_drawdown	largest relative drop of the equity from its highest value
+		exposure		fraction of the time with BTC held
+		orders			number of orders in the range
+
+	Sweeps and optimizers rank their results with rankResults().
+"""
+
+# The returns of the Sharpe ratio are measured every so many seconds
+METRICS_INTERVAL = 3600
+
+SECONDS_PER_YEAR = 365 * 86400
+
+# Metrics for which lower is better
+LOWER_IS_BETTER = set(["max_drawdown"])
+
+# The fills of a MockExchangeConnection as (dates, BTC, USD) arrays
+def fillArrays(fills):
+	fills = np.asarray(fills, dtype = float).reshape(-1, 3)
+	return (fills[:, 0], fills[:, 1], fills[:, 2])
+
+# BTC and USD held at every date, given the fills sorted by date. At the date of
+# an order, the holdings before it, as when MockExchangeConnection.SetBTCPrice()
+# measures the drawdown. Dates before the first fill get the first holdings.
+def holdingsAt(dates, fill_dates, fill_btc, fill_usd):
+	last = np.maximum(np.searchsorted(fill_dates, dates, side = "left") - 1, 0)
+	return (fill_btc[last], fill_usd[last])
+
+# Equity in USD and BTC held after every trade
+def equityCurve(dates, prices, fills):
+	(fill_dates, fill_btc, fill_usd) = fillArrays(fills)
+	(btc, usd) = holdingsAt(dates, fill_dates, fill_btc, fill_usd)
+	return (usd + btc * prices, btc)
+
+# Largest relative drop of the equity from its running maximum
+def maxDrawdown(equity):
+	if (len(equity) == 0):
+		return 0.0
+	peak = np.maximum.accumulate(equity)
+	drawdown = (peak - equity) / np.where(peak > 0.0, peak, 1.0)
+	return float(drawdown.max())
+
+# Annualized Sharpe ratio of the returns every interval seconds, without a risk free rate
+def sharpeRatio(dates, equity, interval = METRICS_INTERVAL):
+	if (len(dates) < 2):
+		return 0.0
+	grid = np.arange(dates[0] + interval, dates[-1], interval)
+	samples = np.concatenate(([equity[0]], equity[np.searchsorted(dates, grid, side = "right") - 1], [equity[-1]]))
+	previous = samples[:-1]
+	returns = np.diff(samples) / np.where(previous > 0.0, previous, 1.0)
+	deviation = returns.std()
+	if (len(returns) < 2 or deviation <= 0.0):
+		return 0.0
+	return float(returns.mean() / deviation * np.sqrt(SECONDS_PER_YEAR / float(interval)))
+
+# Fraction of the time between the first and the last trade with BTC held
+def exposure(dates, btc):
+	if (len(dates) < 2 or dates[-1] <= dates[0]):
+		return 0.0
+	held = np.diff(dates)[btc[:-1] > 0.0]
+	return float(held.sum() / (dates[-1] - dates[0]))
+
+# Statistics of an equity curve, equity and btc after every trade at dates, see above
+def computeMetrics(dates, equity, btc, orders, interval = METRICS_INTERVAL):
+	dates = np.asarray(dates, dtype = float)
+	metrics = {}
+	metrics["return"] = float(equity[-1] / equity[0] - 1.0) if (len(equity) > 0 and equity[0] > 0.0) else 0.0
+	metrics["sharpe"] = sharpeRatio(dates, equity, interval)
+	metrics["max_drawdown"] = maxDrawdown(equity)
+	metrics["exposure"] = exposure(dates, btc)
+	metrics["orders"] = orders
+	return metrics
+
+# Statistics of the backtest of xcon (a MockExchangeConnection) over the trades at dates and prices
+def backtestMetrics(xcon, dates, prices, interval = METRICS_INTERVAL):
+	dates = np.asarray(dates, dtype = float)
+	prices = np.asarray(prices, dtype = float)
+	(equity, btc) = equityCurve(dates, prices, xcon.fills)
+	(fill_dates, fill_btc, fill_usd) = fillArrays(xcon.fills[1:])
+	if (len(dates) > 0):
+		orders = int(np.count_nonzero((fill_dates >= dates[0]) & (fill_dates <= dates[-1])))
+	else:
+		orders = 0
+	return computeMetrics(dates, equity, btc, orders, interval)
+
+# The results (dicts) sorted from the best to the worst by the metric key.
+# Results without a value for it are last.
+def rankResults(results, key = "sharpe"):
+	values = np.array([float(result.get(key, np.nan)) for result in results])
+	if (key not in LOWER_IS_BETTER):
+		values = -values
+	# NaN are sorted last, a stable sort keeps the order of the ties
+	order = np.argsort(values, kind = "mergesort")
+	return [results[i] for i in order]
+
+# Metrics of several backtests side by side, a row per name
+def printMetrics(names, results):
+	width = max([len(name) for name in names] + [len("Strategy")])
+	print "%-*s %8s %12s %9s %13s %9s" % (width, "Strategy", "Orders", "Return", "Sharpe", "Max drawdown", "Exposure")
+	for (name, result) in zip(names, results):
+		print "%-*s %8d %11.2f%% %9.2f %12.2f%% %8.1f%%" % (width, name, result["orders"], result["return"] * 100, result["sharpe"], result["max_drawdown"] * 100, result["exposure"] * 100)
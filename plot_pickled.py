@@ -1,6 +1,26 @@
+import os
+import sys
+import pickle
 import strategy_plot
-from strategy_core_trailing_stoploss import StrategyCoreTrailingStoploss
-from exchange_connection import MockExchangeConnection
+from debug_recorder import loadDebugData
+
+"""
+	Plots the debug data of a bot: the state it dumps when unloaded or when
+	"D" is pressed (strategy_logic_*.pickle), or a directory written by
+	DebugRecorder.Save(), which is memory-mapped instead of loaded.
+
+	Usage:
+		python plot_pickled.py strategy_logic_trailing_stoploss.pickle
+		python plot_pickled.py strategy_logic_simple_trend_follower.debug
+"""
+
+def loadDebugDataFile(filename):
+	if (os.path.isdir(filename)):
+		return loadDebugData(filename)
+	f = open(filename, "rb")
+	state = pickle.load(f)
+	f.close()
+	return state["_debugData"]
 
 def plotStrategyCorePerformance(debugData):
 
@@ -9,17 +29,18 @@ def plotStrategyCorePerformance(debugData):
 	splot.Plot("RawPrice",1, "y-")
 	splot.Plot("Sell", 1, "go")
 	splot.Plot("Buy", 1, "y^")
+	splot.Plot("PriceEmaSlow", 1, "g-")
+	splot.Plot("PriceSmaSlow", 1, "g-")
 	splot.Plot("PriceEmaFast", 1, "b-")
+	splot.Plot("PriceEmaLongTerm", 1, "r-")
 
 	splot.Show()
 
 def main():
-	# Test this strategy core by mocking ExchangeConnection
-	# And by feeding it the prerecorded data
-	xcon = MockExchangeConnection()
-	score = StrategyCoreTrailingStoploss(xcon, debug = True)
-	score.Load()
-	plotStrategyCorePerformance(score._debugData)
+	filename = "strategy_logic_trailing_stoploss.pickle"
+	if (len(sys.argv) > 1):
+		filename = sys.argv[1]
+	plotStrategyCorePerformance(loadDebugDataFile(filename))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
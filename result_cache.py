@@ -0,0 +1,185 @@
+import os
+import sys
+import glob
+import pickle
+import hashlib
+import inspect
+import sqlite3
+import trade_cache
+from checkpoint import warmState, indicatorSettings
+from indicator.base import Indicator
+
+"""
+	Cache of the backtest results, on the local disk.
+	A result is stored under a hash of everything it depends on: the
+	source of the modules of the strategy logic, of its indicators and of
+	the replay (backtest.py, the mock exchange connection, the indicator
+	package), the values of its constants, the settings of its indicators
+	and of its debug recorder, the starting funds, the date range, the
+	warm-up, the bars, the use of the feature store, and a fingerprint of
+	the trades of the range (their number and highest tid).
+	Editing any of these modules, changing a constant or downloading trades
+	into the range gives a new key; downloading trades after the range
+	does not.
+
+	An entry holds the result, the state of the MockExchangeConnection
+	(funds, drawdown and fills, from which metrics.py rebuilds the equity
+	curve) and the debug series. The least recently used entries are
+	deleted when the cache grows above its size limit.
+"""
+
+# Size limit of the cache in bytes
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+# Attributes of these types are the constants (and the starting state) of a strategy logic
+CONSTANT_TYPES = (int, long, float, str, unicode, bool, type(None))
+
+# Number of trades and highest tid between date_from and date_to,
+# from the trade cache when it is up to date
+def dataFingerprint(sqliteDataFile, date_from, date_to, currency = "USD"):
+	cache = trade_cache.openCache(sqliteDataFile, currency)
+	if (cache != None):
+		(first, last) = cache.Range(date_from, date_to)
+		max_tid = int(cache.Tids[first:last].max()) if last > first else None
+		return (last - first, max_tid)
+	db = sqlite3.connect(sqliteDataFile)
+	try:
+		(count, max_tid) = db.execute("select count(*),max(tid) from trades where date>=? and date<? and currency=?", (date_from, date_to, currency)).fetchone()
+	finally:
+		db.close()
+	return (count, max_tid)
+
+# Modules run by every backtest, besides the ones of the strategy logic and of its indicators
+BACKTEST_MODULES = ["backtest", "exchange_connection", "debug_recorder", "checkpoint", "trade_cache"]
+
+# Source files of the code a backtest of score runs: the modules of the strategy logic
+# and of its indicators, BACKTEST_MODULES and the whole indicator package
+def sourceFiles(score):
+	import indicator
+	classes = set([score.__class__] + [value.__class__ for value in warmState(score).values() if isinstance(value, Indicator)])
+	modules = [sys.modules[cls.__module__] for cls in classes] + [__import__(name) for name in BACKTEST_MODULES]
+	filenames = set([os.path.abspath(inspect.getsourcefile(module)) for module in modules])
+	filenames.update([os.path.abspath(filename) for filename in glob.glob(os.path.join(os.path.dirname(indicator.__file__), "*.py"))])
+	return sorted(filenames)
+
+# Hash of the source of the modules a backtest of score runs, see sourceFiles().
+# Module level code counts as well as the classes.
+def strategySourceHash(score):
+	return sourceHash(sourceFiles(score))
+
+def sourceHash(filenames):
+	digest = hashlib.sha1()
+	for filename in filenames:
+		f = open(filename, "rb")
+		try:
+			digest.update(os.path.basename(filename) + ":" + f.read())
+		finally:
+			f.close()
+	return digest.hexdigest()
+
+# Attributes of simple types of an object, sorted: [(name, value)]
+def simpleAttributes(obj):
+	return sorted([(name, value) for (name, value) in obj.__dict__.items() if isinstance(value, CONSTANT_TYPES)])
+
+class ResultCache:
+
+	def __init__(self, directory, max_size = DEFAULT_MAX_SIZE):
+		self.Directory = directory
+		self.MaxSize = max_size
+		self.Hits = 0
+		self.Misses = 0
+
+	# Key of the backtest of score, not run yet, on the trades with the data fingerprint
+	def Key(self, score, fingerprint, date_from, date_to, currency = "USD", warmup = 0, bar = 0, features = False):
+		digest = hashlib.sha1()
+		digest.update(score.__class__.__name__ + ":" + strategySourceHash(score))
+		digest.update(repr(simpleAttributes(score)))
+		for (name, value) in sorted(warmState(score).items()):
+			if (isinstance(value, Indicator)):
+				digest.update(name + ":" + ",".join(indicatorSettings(value)) + ";")
+		debug = score._debugData
+		digest.update(repr((debug.Decimation, debug.MaxLen)))
+		digest.update(repr(simpleAttributes(score.xcon)))
+		digest.update(repr((fingerprint, date_from, date_to, currency, warmup, bar)))
+		if (features):
+			# Results of backtests without the feature store keep their keys
+			import feature_store
+			digest.update("features:" + sourceHash([inspect.getsourcefile(feature_store)]))
+		return digest.hexdigest()
+
+	def Filename(self, key):
+		return os.path.join(self.Directory, key + ".pickle")
+
+	# The cached result of the backtest, None if there is none. The exchange
+	# connection and the debug series of score are restored, not the strategy logic.
+	def Load(self, score, key):
+		filename = self.Filename(key)
+		try:
+			f = open(filename, "rb")
+		except IOError:
+			self.Misses += 1
+			return None
+		try:
+			entry = pickle.load(f)
+		finally:
+			f.close()
+		# The modification time orders the entries from the least recently used
+		os.utime(filename, None)
+		score.xcon.__dict__.update(entry["xcon"])
+		score._debugData = entry["debug"]
+		result = entry["result"]
+		result["cached"] = True
+		self.Hits += 1
+		return result
+
+	def Save(self, score, key, result):
+		if (not os.path.isdir(self.Directory)):
+			try:
+				os.makedirs(self.Directory)
+			except OSError:
+				if (not os.path.isdir(self.Directory)):
+					raise
+		entry = {}
+		entry["result"] = result
+		entry["xcon"] = score.xcon.__dict__
+		entry["debug"] = score._debugData
+		# Write to a temporary file first, a reader never sees half an entry
+		filename = self.Filename(key)
+		temporary = filename + "." + str(os.getpid()) + ".tmp"
+		f = open(temporary, "wb")
+		try:
+			pickle.dump(entry, f, 2)
+		finally:
+			f.close()
+		os.rename(temporary, filename)
+		self.Evict(keep = filename)
+
+	# Delete the least recently used entries until the cache fits in MaxSize
+	def Evict(self, keep = None):
+		entries = []
+		for name in os.listdir(self.Directory):
+			if (not name.endswith(".pickle")):
+				continue
+			filename = os.path.join(self.Directory, name)
+			try:
+				stat = os.stat(filename)
+			except OSError:
+				# Evicted by another process
+				continue
+			entries.append((stat.st_mtime, stat.st_size, filename))
+		entries.sort()
+		total = sum([size for (mtime, size, filename) in entries])
+		for (mtime, size, filename) in entries:
+			if (total <= self.MaxSize):
+				break
+			if (filename == keep):
+				continue
+			try:
+				os.remove(filename)
+			except OSError:
+				pass
+			total -= size
+
+# Default location of the results of a database: mtgox.sqlite3 -> mtgox.results
+def resultDirectory(sqliteDataFile):
+	return os.path.splitext(sqliteDataFile)[0] + ".results"
@@ -1,11 +1,12 @@
 import datetime
 import time
 import pickle
-import sqlite3
 import calendar
 import math
 from indicator.ma import ExponentialMovingAverage as ema
 from exchange_connection import ExchangeConnection, MockExchangeConnection
+from debug_recorder import DebugRecorder, LIVE_MAXLEN
+from backtest import feedRecordedData
 
 """
 	Simple mean reversion bot. It relies on three moving averages.
@@ -18,6 +19,10 @@ from exchange_connection import ExchangeConnection, MockExchangeConnection
 """
 
 class StrategyLogicSimpleMeanReversion:
+
+	# The moving averages of the price can be read from the feature store, see feature_store.py
+	_storedIndicators = ["price_ema_slow", "price_ema_fast", "price_ema_longterm"]
+
 	def __init__(self, xcon, filename = "strategy_logic_simple_mean_reversion.pickle", debug = False):
 
 		self.filename = filename
@@ -35,7 +40,21 @@ class StrategyLogicSimpleMeanReversion:
 		self.MinimumSpreadBuy = 0.0385
 		self.MinimumSpreadSell = 0.00832
 
-		# Price indicators
+		self.CreateIndicators()
+
+		# Live bots keep only the latest debug datapoints
+		self._debugData = DebugRecorder(maxlen = (None if debug else LIVE_MAXLEN))
+
+		# Restore state from disk if possible
+		if (not debug):
+			self.Load()
+
+		# Make sure we use the currently passed ExchangeConnection, not the restored one
+		self.xcon = xcon
+		self.debug = debug
+
+	# (Re)create the indicators from the constants
+	def CreateIndicators(self):
 
 		# Slow moving price average
 		timedelta = datetime.timedelta(minutes = self.Price_Slow_EMA_Time)
@@ -49,16 +68,6 @@ class StrategyLogicSimpleMeanReversion:
 		timedelta = datetime.timedelta(minutes = self.Price_LongTerm_EMA_Time)
 		self.price_ema_longterm = ema(timedelta)
 
-		self._debugData = {}
-
-		# Restore state from disk if possible
-		if (not debug):
-			self.Load()
-
-		# Make sure we use the currently passed ExchangeConnection, not the restored one
-		self.xcon = xcon
-		self.debug = debug
-
 	def UpdatePrice(self, data):
 
 		self.price_ema_slow.Update(data)
@@ -137,6 +146,9 @@ class StrategyLogicSimpleMeanReversion:
 			f = open(self.filename,'rb')
 			tmp_dict = pickle.load(f)
 			self.__dict__.update(tmp_dict)
+			# Debug data saved as lists of dicts by older versions is not restored
+			if (not isinstance(self._debugData, DebugRecorder)):
+				self._debugData = DebugRecorder(maxlen = LIVE_MAXLEN)
 			print "LoadSuccess!"
 			f.close()
 		except:
@@ -153,9 +165,7 @@ class StrategyLogicSimpleMeanReversion:
 			print "StrategyLogicSimpleMeanReversion: Failed to save my state, all the data will be lost"
 
 	def CancelAllOutstandingOrders(self):
-		if (not self.debug):
-			for order in gox.orderbook.owns:
-				gox.cancel(order.oid)
+		self.xcon.CancelAllOrders()
 
 	def ConvertAllToUSD(self):
 		self.CancelAllOutstandingOrders()
@@ -177,7 +187,7 @@ class StrategyLogicSimpleMeanReversion:
 		if (not self.debug):
 			return False
 
-		now = datetime.datetime.fromtimestamp(self._debugData["PriceEmaFast"][-1]["now"])
+		now = datetime.datetime.fromtimestamp(self._debugData.Last("PriceEmaFast")["now"])
 		time_of_interest = datetime.datetime.strptime(timestring,timeformat)
 		if (now > time_of_interest):
 			return True
@@ -188,39 +198,10 @@ class StrategyLogicSimpleMeanReversion:
 		if (not self.debug):
 			return
 
-		if ("RawPrice" not in self._debugData):
-			self._debugData["RawPrice"] = []
-
-		if ("PriceEmaSlow" not in self._debugData):
-			self._debugData["PriceEmaSlow"] = []
-
-		if ("PriceEmaFast" not in self._debugData):
-			self._debugData["PriceEmaFast"] = []
-
-		if ("PriceEmaLongTerm" not in self._debugData):
-			self._debugData["PriceEmaLongTerm"] = []
-
-		self._debugData["RawPrice"].append(data)
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.price_ema_slow.Value
-		self._debugData["PriceEmaSlow"].append(tmp)
-		del tmp
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.price_ema_fast.Value
-		self._debugData["PriceEmaFast"].append(tmp)
-		del tmp
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.price_ema_longterm.Value
-		self._debugData["PriceEmaLongTerm"].append(tmp)
-		del tmp
-
-		self._debugData["LastPriceUpdateTime"] = data["now"]
+		self._debugData.Append("RawPrice", data["now"], data["value"])
+		self._debugData.Append("PriceEmaSlow", data["now"], self.price_ema_slow.Value)
+		self._debugData.Append("PriceEmaFast", data["now"], self.price_ema_fast.Value)
+		self._debugData.Append("PriceEmaLongTerm", data["now"], self.price_ema_longterm.Value)
 
 	def _preSellBTCDebugHook(self):
 		if (not self.debug):
@@ -234,24 +215,12 @@ class StrategyLogicSimpleMeanReversion:
 			return
 		msg = " Wallet: " + str(self.xcon.AvailableBTC()) + " BTC " + str(self.xcon.AvailableUSD()) + " USD"
 		msg += " totalUSD: " + str(self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price)
-		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData["LastPriceUpdateTime"]))
+		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData.Last("RawPrice")["now"]))
 		print msg
 
-		if ("Trades" not in self._debugData):
-			self._debugData["Trades"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price
-		self._debugData["Trades"].append(tmp)
-
-		if ("Sell" not in self._debugData):
-			self._debugData["Sell"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.Last_Sell_Price
-		self._debugData["Sell"].append(tmp)
+		now = self._debugData.Last("RawPrice")["now"]
+		self._debugData.Append("Trades", now, self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price, decimate = False)
+		self._debugData.Append("Sell", now, self.Last_Sell_Price, decimate = False)
 
 	def _preBuyBTCDebugHook(self):
 		if (not self.debug):
@@ -265,63 +234,12 @@ class StrategyLogicSimpleMeanReversion:
 			return
 		msg = " Wallet: " + str(self.xcon.AvailableBTC()) + " BTC " + str(self.xcon.AvailableUSD()) + " USD"
 		msg += " totalUSD: " + str(self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price)
-		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData["LastPriceUpdateTime"]))
+		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData.Last("RawPrice")["now"]))
 		print msg
 
-		if ("Trades" not in self._debugData):
-			self._debugData["Trades"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price
-		self._debugData["Trades"].append(tmp)
-
-		if ("Buy" not in self._debugData):
-			self._debugData["Buy"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.Last_Buy_Price
-		self._debugData["Buy"].append(tmp)
-
-def feedRecordedData(score, sqliteDataFile, date_from, date_to):
-
-	db = sqlite3.connect(sqliteDataFile)
-	cursor = db.cursor()
-	data = cursor.execute("select amount,price,date from trades where ( (date>"+str(date_from)+") and (date<"+str(date_to)+") and (currency='USD') )")
-	actual_date_from = 9999999999999
-	actual_date_to = 0
-
-	price_volume_data = []
-
-	for row in data:
-		volume = float(row[0])
-		price = float(row[1])
-		date = float(row[2])
-
-		if ( actual_date_from > date ):
-			actual_date_from = date
-		if ( actual_date_to < date ):
-			actual_date_to = date
-
-		update_data = {}
-		update_data["now"] = date
-		update_data["price"] = price
-		update_data["volume"] = volume
-		price_volume_data.append(update_data)
-
-	from operator import itemgetter
-	price_volume_data = sorted(price_volume_data, key=itemgetter("now"))
-
-	for item in price_volume_data:
-		score.xcon.SetBTCPrice(item["price"])
-		tmp = {"now":item["now"], "value": item["price"]}
-		score.UpdatePrice(tmp)
-		score.Act()
-
-	cursor.close()
-
-	return (actual_date_from, actual_date_to)
+		now = self._debugData.Last("RawPrice")["now"]
+		self._debugData.Append("Trades", now, self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price, decimate = False)
+		self._debugData.Append("Buy", now, self.Last_Buy_Price, decimate = False)
 
 def plotStrategyCorePerformance(debugData):
 	import strategy_plot
@@ -337,38 +255,20 @@ def plotStrategyCorePerformance(debugData):
 
 	splot.Show()
 
-def minimizeFunction(minSpread):
-	xcon = MockExchangeConnection()
-	score = StrategyLogicSimpleMeanReversion(xcon, debug = True)
-	minSpreadBuy = minSpread[0]
-	minSpreadSell = minSpread[1]
-	score.MinimumSpreadBuy = minSpreadBuy
-	score.MinimumSpreadSell = minSpreadSell
+# Tune MinimumSpreadBuy and MinimumSpreadSell for the highest final funds in December 2013
+def optimizeMagicNumbers():
+	import surrogate
 
 	tmp = datetime.datetime.strptime("2013 Dec 1 00:00", "%Y %b %d %H:%M")
 	date_from = float(calendar.timegm(tmp.utctimetuple()))
 	tmp = datetime.datetime.strptime("2014 Jan 1 00:00", "%Y %b %d %H:%M")
 	date_to = float(calendar.timegm(tmp.utctimetuple()))
 
-	feedRecordedData(score, "mtgoxdata/mtgox.sqlite3", date_from, date_to)
-	totalFunds = xcon.AvailableBTC() * score.Current_Price + xcon.AvailableUSD()
-	print "MinimumSpreadBuy="+ str(minSpreadBuy) + " MinimumSpreadSell=" + str(minSpreadSell)
-	print "Total funds = " + str(totalFunds)
-	print "*********************************************"
-	return 1/totalFunds
-
-def optimizeMagicNumbers():
-	from scipy.optimize import fmin
-	from scipy.optimize import minimize
-	from scipy.optimize import fmin_tnc
-	from scipy.optimize import anneal
-
-	xopt = anneal(minimizeFunction, [0.0385, 0.00832], maxeval=50, disp=True, lower=[0.0, 0.0], upper=[0.1, 0.1] )
-	print "MonteCarlo optimzation results: " + str(xopt)
-	print "Starting gradient descent with the following starting point: MinimumSpreadBuy=" + str(xopt[0][0]) + "MinimumSpreadSell=" +str(xopt[0][1])
-	xopt = fmin(minimizeFunction, [xopt[0][0], xopt[0][1]], maxiter=100, maxfun=4000)
-	print "Gradient descent optimization results: " + str(xopt)
-	print "Result: MinimumSpreadBuy=" + str(xopt[0]) + " MinimumSpreadSell=" + str(xopt[1])
+	bounds = {"MinimumSpreadBuy": (0.0, 0.1), "MinimumSpreadSell": (0.0, 0.1)}
+	results = surrogate.optimize("simple_mean_reversion", bounds, "mtgoxdata/mtgox.sqlite3", date_from, date_to, key = "equity", seed = 1)
+	best = results[0]
+	print "Result: MinimumSpreadBuy=" + str(best["params"]["MinimumSpreadBuy"]) + " MinimumSpreadSell=" + str(best["params"]["MinimumSpreadSell"])
+	print "Total funds = " + str(best["equity"])
 
 def main():
 	# Test this strategy core by mocking ExchangeConnection
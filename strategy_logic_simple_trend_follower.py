@@ -1,12 +1,13 @@
 import datetime
 import time
 import pickle
-import sqlite3
 import calendar
 import math
 from indicator.ma import ExponentialMovingAverage as ema
 from indicator.ma import SimpleMovingAverage as ema
 from exchange_connection import ExchangeConnection, MockExchangeConnection
+from debug_recorder import DebugRecorder, LIVE_MAXLEN
+from backtest import feedRecordedData
 
 """
 	Simple trend following bot. It relies on three moving averages.
@@ -17,6 +18,10 @@ from exchange_connection import ExchangeConnection, MockExchangeConnection
 """
 
 class StrategyLogicSimpleTrendFollower:
+
+	# The moving averages of the price can be read from the feature store, see feature_store.py
+	_storedIndicators = ["price_ema_slow", "price_ema_fast", "price_ema_longterm"]
+
 	def __init__(self, xcon, filename = "strategy_logic_simple_trend_follower.pickle", debug = False):
 
 		self.filename = filename
@@ -33,7 +38,21 @@ class StrategyLogicSimpleTrendFollower:
 
 		self.MinimumSpread = 0.0012
 
-		# Price indicators
+		self.CreateIndicators()
+
+		# Live bots keep only the latest debug datapoints
+		self._debugData = DebugRecorder(maxlen = (None if debug else LIVE_MAXLEN))
+
+		# Restore state from disk if possible
+		if (not debug):
+			self.Load()
+
+		# Make sure we use the currently passed ExchangeConnection, not the restored one
+		self.xcon = xcon
+		self.debug = debug
+
+	# (Re)create the indicators from the constants
+	def CreateIndicators(self):
 
 		# Slow moving price average
 		timedelta = datetime.timedelta(minutes = self.Price_Slow_EMA_Time)
@@ -47,16 +66,6 @@ class StrategyLogicSimpleTrendFollower:
 		timedelta = datetime.timedelta(minutes = self.Price_LongTerm_EMA_Time)
 		self.price_ema_longterm = ema(timedelta)
 
-		self._debugData = {}
-
-		# Restore state from disk if possible
-		if (not debug):
-			self.Load()
-
-		# Make sure we use the currently passed ExchangeConnection, not the restored one
-		self.xcon = xcon
-		self.debug = debug
-
 	def UpdatePrice(self, data):
 
 		self.price_ema_slow.Update(data)
@@ -131,6 +140,9 @@ class StrategyLogicSimpleTrendFollower:
 			f = open(self.filename,'rb')
 			tmp_dict = pickle.load(f)
 			self.__dict__.update(tmp_dict)
+			# Debug data saved as lists of dicts by older versions is not restored
+			if (not isinstance(self._debugData, DebugRecorder)):
+				self._debugData = DebugRecorder(maxlen = LIVE_MAXLEN)
 			print "LoadSuccess!"
 			f.close()
 		except:
@@ -164,7 +176,7 @@ class StrategyLogicSimpleTrendFollower:
 		if (not self.debug):
 			return False
 
-		now = datetime.datetime.fromtimestamp(self._debugData["PriceEmaFast"][-1]["now"])
+		now = datetime.datetime.fromtimestamp(self._debugData.Last("PriceEmaFast")["now"])
 		time_of_interest = datetime.datetime.strptime(timestring,timeformat)
 		if (now > time_of_interest):
 			return True
@@ -175,39 +187,10 @@ class StrategyLogicSimpleTrendFollower:
 		if (not self.debug):
 			return
 
-		if ("RawPrice" not in self._debugData):
-			self._debugData["RawPrice"] = []
-
-		if ("PriceEmaSlow" not in self._debugData):
-			self._debugData["PriceEmaSlow"] = []
-
-		if ("PriceEmaFast" not in self._debugData):
-			self._debugData["PriceEmaFast"] = []
-
-		if ("PriceEmaLongTerm" not in self._debugData):
-			self._debugData["PriceEmaLongTerm"] = []
-
-		self._debugData["RawPrice"].append(data)
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.price_ema_slow.Value
-		self._debugData["PriceEmaSlow"].append(tmp)
-		del tmp
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.price_ema_fast.Value
-		self._debugData["PriceEmaFast"].append(tmp)
-		del tmp
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.price_ema_longterm.Value
-		self._debugData["PriceEmaLongTerm"].append(tmp)
-		del tmp
-
-		self._debugData["LastPriceUpdateTime"] = data["now"]
+		self._debugData.Append("RawPrice", data["now"], data["value"])
+		self._debugData.Append("PriceEmaSlow", data["now"], self.price_ema_slow.Value)
+		self._debugData.Append("PriceEmaFast", data["now"], self.price_ema_fast.Value)
+		self._debugData.Append("PriceEmaLongTerm", data["now"], self.price_ema_longterm.Value)
 
 	def _preSellBTCDebugHook(self):
 		if (not self.debug):
@@ -221,24 +204,12 @@ class StrategyLogicSimpleTrendFollower:
 			return
 		msg = " Wallet: " + str(self.xcon.AvailableBTC()) + " BTC " + str(self.xcon.AvailableUSD()) + " USD"
 		msg += " totalUSD: " + str(self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price)
-		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData["LastPriceUpdateTime"]))
+		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData.Last("RawPrice")["now"]))
 		print msg
 
-		if ("Trades" not in self._debugData):
-			self._debugData["Trades"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price
-		self._debugData["Trades"].append(tmp)
-
-		if ("Sell" not in self._debugData):
-			self._debugData["Sell"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.Last_Sell_Price
-		self._debugData["Sell"].append(tmp)
+		now = self._debugData.Last("RawPrice")["now"]
+		self._debugData.Append("Trades", now, self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price, decimate = False)
+		self._debugData.Append("Sell", now, self.Last_Sell_Price, decimate = False)
 
 	def _preBuyBTCDebugHook(self):
 		if (not self.debug):
@@ -252,63 +223,12 @@ class StrategyLogicSimpleTrendFollower:
 			return
 		msg = " Wallet: " + str(self.xcon.AvailableBTC()) + " BTC " + str(self.xcon.AvailableUSD()) + " USD"
 		msg += " totalUSD: " + str(self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price)
-		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData["LastPriceUpdateTime"]))
+		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData.Last("RawPrice")["now"]))
 		print msg
 
-		if ("Trades" not in self._debugData):
-			self._debugData["Trades"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price
-		self._debugData["Trades"].append(tmp)
-
-		if ("Buy" not in self._debugData):
-			self._debugData["Buy"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.Last_Buy_Price
-		self._debugData["Buy"].append(tmp)
-
-def feedRecordedData(score, sqliteDataFile, date_from, date_to):
-
-	db = sqlite3.connect(sqliteDataFile)
-	cursor = db.cursor()
-	data = cursor.execute("select amount,price,date from trades where ( (date>"+str(date_from)+") and (date<"+str(date_to)+") and (currency='USD') )")
-	actual_date_from = 9999999999999
-	actual_date_to = 0
-
-	price_volume_data = []
-
-	for row in data:
-		volume = float(row[0])
-		price = float(row[1])
-		date = float(row[2])
-
-		if ( actual_date_from > date ):
-			actual_date_from = date
-		if ( actual_date_to < date ):
-			actual_date_to = date
-
-		update_data = {}
-		update_data["now"] = date
-		update_data["price"] = price
-		update_data["volume"] = volume
-		price_volume_data.append(update_data)
-
-	from operator import itemgetter
-	price_volume_data = sorted(price_volume_data, key=itemgetter("now"))
-
-	for item in price_volume_data:
-		score.xcon.SetBTCPrice(item["price"])
-		tmp = {"now":item["now"], "value": item["price"]}
-		score.UpdatePrice(tmp)
-		score.Act()
-
-	cursor.close()
-
-	return (actual_date_from, actual_date_to)
+		now = self._debugData.Last("RawPrice")["now"]
+		self._debugData.Append("Trades", now, self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price, decimate = False)
+		self._debugData.Append("Buy", now, self.Last_Buy_Price, decimate = False)
 
 def plotStrategyCorePerformance(debugData):
 	import strategy_plot
@@ -1,7 +1,6 @@
 import datetime
 import time
 import pickle
-import sqlite3
 import calendar
 import math
 import smtplib
@@ -9,6 +8,8 @@ from email.mime.text import MIMEText
 from indicator.ma import ExponentialMovingAverage as ema
 from indicator.timeminmax import TimeMax, TimeMin
 from exchange_connection import ExchangeConnection, MockExchangeConnection
+from debug_recorder import DebugRecorder, LIVE_MAXLEN
+from backtest import feedRecordedData
 
 """
 	Trailing stop loss bot.
@@ -18,6 +19,10 @@ from exchange_connection import ExchangeConnection, MockExchangeConnection
 """
 
 class StrategyLogicTrailingStoploss:
+
+	# The moving averages of the price can be read from the feature store, see feature_store.py
+	_storedIndicators = ["price_ema_fast"]
+
 	def __init__(self, xcon, filename = "strategy_logic_trailing_stoploss.pickle", debug = False):
 
 		self.filename = filename
@@ -30,15 +35,10 @@ class StrategyLogicTrailingStoploss:
 		self.Current_Price = 0.0
 		self.Enabled = True
 
-		# Fast price moving average
-		timedelta = datetime.timedelta(minutes = self.Price_Fast_EMA_Time)
-		self.price_ema_fast = ema(timedelta)
-
-		# Price maximum values over an hour for sell signal
-		timedelta = datetime.timedelta(minutes = self.Price_Max_Time)
-		self.price_trailing_max = TimeMax(timedelta)
+		self.CreateIndicators()
 
-		self._debugData = {}
+		# Live bots keep only the latest debug datapoints
+		self._debugData = DebugRecorder(maxlen = (None if debug else LIVE_MAXLEN))
 
 		# If we are in debug mode, do not restore previously saved state from file
 		if (not debug):
@@ -48,6 +48,17 @@ class StrategyLogicTrailingStoploss:
 		self.xcon = xcon
 		self.debug = debug
 
+	# (Re)create the indicators from the constants
+	def CreateIndicators(self):
+
+		# Fast price moving average
+		timedelta = datetime.timedelta(minutes = self.Price_Fast_EMA_Time)
+		self.price_ema_fast = ema(timedelta)
+
+		# Price maximum values over an hour for sell signal
+		timedelta = datetime.timedelta(minutes = self.Price_Max_Time)
+		self.price_trailing_max = TimeMax(timedelta)
+
 	def __del__(self):
 		self.Save()
 
@@ -106,6 +117,9 @@ class StrategyLogicTrailingStoploss:
 			f = open(self.filename,'rb')
 			tmp_dict = pickle.load(f)
 			self.__dict__.update(tmp_dict)
+			# Debug data saved as lists of dicts by older versions is not restored
+			if (not isinstance(self._debugData, DebugRecorder)):
+				self._debugData = DebugRecorder(maxlen = LIVE_MAXLEN)
 			f.close()
 		except:
 			print "StrategyCore: Failed to load previous state, starting from scratch"
@@ -141,7 +155,7 @@ class StrategyLogicTrailingStoploss:
 		msg = "Hello!\n\n"
 		msg += "This is a notification from your mtgox trailing stop loss bot.\n"
 		msg += "I have just sold "+ str(self.xcon.AvailableBTC()) + " BTC " + "at a price of " + str(self.Current_Price) + " USD\n"
-		msg += "Date: " + str(datetime.datetime.fromtimestamp(self._debugData["LastPriceUpdateTime"]))
+		msg += "Date: " + str(datetime.datetime.fromtimestamp(self._debugData.Last("RawPrice")["now"]))
 		msg += "\n\n"
 		msg += "If this bot was helpful to you, please consider donating to 16csNHCBstmdcLnPg45fxF2PdKoPyPJDhX\n\n"
 		msg += "Thank you!"
@@ -171,21 +185,8 @@ class StrategyLogicTrailingStoploss:
 
 	def _updatePriceDebugHook(self, data):
 
-		if ("RawPrice" not in self._debugData):
-			self._debugData["RawPrice"] = []
-
-		if ("PriceEmaFast" not in self._debugData):
-			self._debugData["PriceEmaFast"] = []
-
-		self._debugData["RawPrice"].append(data)
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.price_ema_fast.Value
-		self._debugData["PriceEmaFast"].append(tmp)
-		del tmp
-
-		self._debugData["LastPriceUpdateTime"] = data["now"]
+		self._debugData.Append("RawPrice", data["now"], data["value"])
+		self._debugData.Append("PriceEmaFast", data["now"], self.price_ema_fast.Value)
 
 	def _preSellBTCDebugHook(self):
 
@@ -197,24 +198,12 @@ class StrategyLogicTrailingStoploss:
 
 		msg = " Wallet: " + str(self.xcon.AvailableBTC()) + " BTC " + str(self.xcon.AvailableUSD()) + " USD"
 		msg += " totalUSD: " + str(self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price)
-		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData["LastPriceUpdateTime"]))
+		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData.Last("RawPrice")["now"]))
 		print msg
 
-		if ("Trades" not in self._debugData):
-			self._debugData["Trades"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price
-		self._debugData["Trades"].append(tmp)
-
-		if ("Sell" not in self._debugData):
-			self._debugData["Sell"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.Last_Sell_Price
-		self._debugData["Sell"].append(tmp)
+		now = self._debugData.Last("RawPrice")["now"]
+		self._debugData.Append("Trades", now, self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price, decimate = False)
+		self._debugData.Append("Sell", now, self.Last_Sell_Price, decimate = False)
 
 	def _preBuyBTCDebugHook(self):
 
@@ -226,63 +215,12 @@ class StrategyLogicTrailingStoploss:
 
 		msg = " Wallet: " + str(self.xcon.AvailableBTC()) + " BTC " + str(self.xcon.AvailableUSD()) + " USD"
 		msg += " totalUSD: " + str(self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price)
-		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData["LastPriceUpdateTime"]))
+		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData.Last("RawPrice")["now"]))
 		print msg
 
-		if ("Trades" not in self._debugData):
-			self._debugData["Trades"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price
-		self._debugData["Trades"].append(tmp)
-
-		if ("Buy" not in self._debugData):
-			self._debugData["Buy"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.Last_Buy_Price
-		self._debugData["Buy"].append(tmp)
-
-def feedRecordedData(score, sqliteDataFile, date_from, date_to):
-
-	db = sqlite3.connect(sqliteDataFile)
-	cursor = db.cursor()
-	data = cursor.execute("select amount,price,date from trades where ( (date>"+str(date_from)+") and (date<"+str(date_to)+") and (currency='USD') )")
-	actual_date_from = 9999999999999
-	actual_date_to = 0
-
-	price_volume_data = []
-
-	for row in data:
-		volume = float(row[0])
-		price = float(row[1])
-		date = float(row[2])
-
-		if ( actual_date_from > date ):
-			actual_date_from = date
-		if ( actual_date_to < date ):
-			actual_date_to = date
-
-		update_data = {}
-		update_data["now"] = date
-		update_data["price"] = price
-		update_data["volume"] = volume
-		price_volume_data.append(update_data)
-
-	from operator import itemgetter
-	price_volume_data = sorted(price_volume_data, key=itemgetter("now"))
-
-	for item in price_volume_data:
-		score.xcon.SetBTCPrice(item["price"])
-		tmp = {"now":item["now"], "value": item["price"]}
-		score.UpdatePrice(tmp)
-		score.Act()
-
-	cursor.close()
-
-	return (actual_date_from, actual_date_to)
+		now = self._debugData.Last("RawPrice")["now"]
+		self._debugData.Append("Trades", now, self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price, decimate = False)
+		self._debugData.Append("Buy", now, self.Last_Buy_Price, decimate = False)
 
 def plotStrategyCorePerformance(debugData):
 	import strategy_plot
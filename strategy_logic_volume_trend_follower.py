@@ -1,15 +1,18 @@
 import datetime
 import time
 import pickle
-import sqlite3
 import calendar
 import math
 from indicator.ma import ExponentialMovingAverage as ema
 from indicator.ma import SimpleMovingAverage as sma
 from indicator.candlestick import CandleStick
-from indicator.timesum import TimeSum
+from indicator.candleseries import CandleSeries
 from indicator.timeminmax import TimeMax, TimeMin
+from indicator.bank import IndicatorBank
+from indicator.ringbuffer import TIME, VALUE
 from exchange_connection import ExchangeConnection, MockExchangeConnection
+from debug_recorder import DebugRecorder, LIVE_MAXLEN
+from backtest import feedRecordedData
 
 """
 	Volume Trend Following bot
@@ -21,6 +24,11 @@ from exchange_connection import ExchangeConnection, MockExchangeConnection
 """
 
 class StrategyLogicVolumeTrendFollower:
+
+	# The volume spike flag is warmed up with the indicators, see checkpoint.py
+	_warmAttributes = ["volume_spike"]
+	_warmConstants = ["Volume_MA_Spike_Diff_Coef", "Volume_MA_Spike_Diff_Value"]
+
 	def __init__(self, xcon, filename = "strategy_logic_volume_trend_follower.pickle", debug = False):
 
 		self.filename = filename
@@ -42,10 +50,35 @@ class StrategyLogicVolumeTrendFollower:
 		self.Last_Sell_Price = 0.0
 		self.Current_Price = 0.0
 
+		self.CreateIndicators()
+
+		# Live bots keep only the latest debug datapoints
+		self._debugData = DebugRecorder(maxlen = (None if debug else LIVE_MAXLEN))
+
+		# Restore state from disk if possible
+		if (not debug):
+			self.Load()
+
+		# Make sure we use the currently passed ExchangeConnection, not the restored one
+		self.xcon = xcon
+		self.debug = debug
+
+		self.IndicatorsRestored()
+
+	# Subscribers are not restored with the state
+	def IndicatorsRestored(self):
+		timedelta = datetime.timedelta(minutes = self.Volume_TimeSum_Time)
+		self.volume_candles.Subscribe(timedelta, self._volumeBarClosed)
+
+	# (Re)create the indicators from the constants
+	def CreateIndicators(self):
+
 		# Volume indicators
 
-		# Volume TimeSum - a sum of all trades per timeframe
-		self.current_volume_timesum = None
+		# Volume bars - a sum of all trades per timeframe, aligned to the clock
+		timedelta = datetime.timedelta(minutes = self.Volume_TimeSum_Time)
+		self.volume_candles = CandleSeries([timedelta])
+		self.volume_candles.Subscribe(timedelta, self._volumeBarClosed)
 
 		# Volume slow moving average
 		timedelta = datetime.timedelta(minutes = self.Volume_Slow_SMA_Time)
@@ -57,45 +90,40 @@ class StrategyLogicVolumeTrendFollower:
 
 		self.volume_spike = False
 
-		# Price indicators
+		self.CreatePriceIndicators()
+
+	# Price indicators
+	# All the price moving averages share one window of prices
+	def CreatePriceIndicators(self):
+
+		self.price_bank = IndicatorBank()
 
 		# Slow moving price average
 		timedelta = datetime.timedelta(minutes = self.Price_Slow_SMA_Time)
-		self.price_sma_slow = sma(timedelta)
+		self.price_sma_slow = self.price_bank.AddSimpleMovingAverage(timedelta)
 
 		# Fast five minutes moving averages
 		timedelta = datetime.timedelta(minutes = self.Price_Fast_EMA_Time)
-		self.price_ema_fast = ema(timedelta)
+		self.price_ema_fast = self.price_bank.AddExponentialMovingAverage(timedelta)
 
 		# Long Term moving average
 		timedelta = datetime.timedelta(minutes = self.Price_LongTerm_EMA_Time)
-		self.price_ema_longterm = ema(timedelta)
-
-		self._debugData = {}
-
-		# Restore state from disk if possible
-		if (not debug):
-			self.Load()
-
-		# Make sure we use the currently passed ExchangeConnection, not the restored one
-		self.xcon = xcon
-		self.debug = debug
+		self.price_ema_longterm = self.price_bank.AddExponentialMovingAverage(timedelta)
 
+	# data may carry the price of the trade in "price", the live bot updates the
+	# volume before the price, so Current_Price is still the one of the previous trade
 	def UpdateVolume(self, data):
 
-		if (self.current_volume_timesum == None):
-			timesum_time_from = datetime.datetime.fromtimestamp(int(data["now"]))
-			timesum_time_to = timesum_time_from + datetime.timedelta(minutes = self.Volume_TimeSum_Time)
-			self.current_volume_timesum = TimeSum(timesum_time_from, timesum_time_to)
-
-		self.current_volume_timesum.Update(data)
+		self.volume_candles.UpdateTrade(data["now"], data.get("price", self.Current_Price), data["value"])
 
 		self._volumeUpdateDebugHook(data)
 
-		if ( not self.current_volume_timesum.IsAccurate() ):
-			return
+	# Called by volume_candles with the total volume of every closed bar
+	def _volumeBarClosed(self, bar):
+
+		data = {"now":bar["now"], "value":bar["volume"]}
+		self._volumeBarDebugHook(data)
 
-		data["value"] = self.current_volume_timesum.Value
 		self.volume_sma_slow.Update(data)
 		self.volume_ema_fast.Update(data)
 
@@ -106,13 +134,9 @@ class StrategyLogicVolumeTrendFollower:
 		if (self.volume_ema_fast.Value < self.volume_sma_slow.Value ):
 			self.volume_spike = False
 
-		self.current_volume_timesum = None
-
 	def UpdatePrice(self, data):
 
-		self.price_sma_slow.Update(data)
-		self.price_ema_fast.Update(data)
-		self.price_ema_longterm.Update(data)
+		self.price_bank.Update(data)
 		self.Current_Price = data["value"]
 
 		self._updatePriceDebugHook(data)
@@ -190,6 +214,19 @@ class StrategyLogicVolumeTrendFollower:
 			f = open(self.filename,'rb')
 			tmp_dict = pickle.load(f)
 			self.__dict__.update(tmp_dict)
+			# Debug data saved as lists of dicts by older versions is not restored
+			if (not isinstance(self._debugData, DebugRecorder)):
+				self._debugData = DebugRecorder(maxlen = LIVE_MAXLEN)
+			# Older versions kept standalone price averages, which UpdatePrice does
+			# not update anymore. The bank is rebuilt from the prices in the window
+			# of the long term average, the longest one.
+			if ("price_bank" not in tmp_dict):
+				longterm = self.price_ema_longterm
+				self.CreatePriceIndicators()
+				for i in range(len(longterm._data)):
+					self.price_bank.UpdateValue(longterm._data.Get(TIME, i), longterm._data.Get(VALUE, i))
+			# The restored volume bars have no subscribers
+			self.IndicatorsRestored()
 			print "LoadSuccess!"
 			f.close()
 		except:
@@ -224,88 +261,27 @@ class StrategyLogicVolumeTrendFollower:
 		if (not self.debug):
 			return
 
-		if ("RawPrice" not in self._debugData):
-			self._debugData["RawPrice"] = []
-
-		if ("PriceSmaSlow" not in self._debugData):
-			self._debugData["PriceSmaSlow"] = []
-
-		if ("PriceEmaFast" not in self._debugData):
-			self._debugData["PriceEmaFast"] = []
-
-		if ("PriceEmaLongTerm" not in self._debugData):
-			self._debugData["PriceEmaLongTerm"] = []
-
-		if ("PriceEmaDiff" not in self._debugData):
-			self._debugData["PriceEmaDiff"] = []
-
-		self._debugData["RawPrice"].append(data)
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.price_sma_slow.Value
-		self._debugData["PriceSmaSlow"].append(tmp)
-		del tmp
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.price_ema_fast.Value
-		self._debugData["PriceEmaFast"].append(tmp)
-		del tmp
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.price_ema_longterm.Value
-		self._debugData["PriceEmaLongTerm"].append(tmp)
-		del tmp
-
-		self._debugData["LastPriceUpdateTime"] = data["now"]
+		self._debugData.Append("RawPrice", data["now"], data["value"])
+		self._debugData.Append("PriceSmaSlow", data["now"], self.price_sma_slow.Value)
+		self._debugData.Append("PriceEmaFast", data["now"], self.price_ema_fast.Value)
+		self._debugData.Append("PriceEmaLongTerm", data["now"], self.price_ema_longterm.Value)
 
 	def _volumeUpdateDebugHook(self, data):
 
 		if (not self.debug):
 			return
 
-		if ("RawVolume" not in self._debugData):
-			self._debugData["RawVolume"] = []
-
-		if ("VolumeTimeSums" not in self._debugData):
-			self._debugData["VolumeTimeSums"] = []
+		self._debugData.Append("RawVolume", data["now"], data["value"])
+		self._debugData.Append("VolumeSmaSlow", data["now"], self.volume_sma_slow.Value)
+		self._debugData.Append("VolumeEmaFast", data["now"], self.volume_ema_fast.Value)
+		self._debugData.Append("VolumeSpike", data["now"], self.volume_spike)
 
-		if ("VolumeSmaSlow" not in self._debugData):
-			self._debugData["VolumeSmaSlow"] = []
+	def _volumeBarDebugHook(self, data):
 
-		if ("VolumeEmaFast" not in self._debugData):
-			self._debugData["VolumeEmaFast"] = []
-
-		if ("VolumeSpike" not in self._debugData):
-			self._debugData["VolumeSpike"] = []
-
-		self._debugData["RawVolume"].append(data)
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.volume_sma_slow.Value
-		self._debugData["VolumeSmaSlow"].append(tmp)
-		del tmp
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.volume_ema_fast.Value
-		self._debugData["VolumeEmaFast"].append(tmp)
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.current_volume_timesum.Value
-		if (self.current_volume_timesum.IsAccurate()):
-			self._debugData["VolumeTimeSums"].append(tmp)
-
-		tmp = {}
-		tmp["now"] = data["now"]
-		tmp["value"] = self.volume_spike
-		self._debugData["VolumeSpike"].append(tmp)
+		if (not self.debug):
+			return
 
-		self._debugData["LastVolumeUpdateTime"] = data["now"]
+		self._debugData.Append("VolumeTimeSums", data["now"], data["value"])
 
 	def _preSellBTCDebugHook(self):
 		if (not self.debug):
@@ -319,24 +295,12 @@ class StrategyLogicVolumeTrendFollower:
 			return
 		msg = " Wallet: " + str(self.xcon.AvailableBTC()) + " BTC " + str(self.xcon.AvailableUSD()) + " USD"
 		msg += " totalUSD: " + str(self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price)
-		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData["LastPriceUpdateTime"]))
+		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData.Last("RawPrice")["now"]))
 		print msg
 
-		if ("Trades" not in self._debugData):
-			self._debugData["Trades"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price
-		self._debugData["Trades"].append(tmp)
-
-		if ("Sell" not in self._debugData):
-			self._debugData["Sell"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.Last_Sell_Price
-		self._debugData["Sell"].append(tmp)
+		now = self._debugData.Last("RawPrice")["now"]
+		self._debugData.Append("Trades", now, self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price, decimate = False)
+		self._debugData.Append("Sell", now, self.Last_Sell_Price, decimate = False)
 
 	def _preBuyBTCDebugHook(self):
 		if (not self.debug):
@@ -350,65 +314,12 @@ class StrategyLogicVolumeTrendFollower:
 			return
 		msg = " Wallet: " + str(self.xcon.AvailableBTC()) + " BTC " + str(self.xcon.AvailableUSD()) + " USD"
 		msg += " totalUSD: " + str(self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price)
-		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData["LastPriceUpdateTime"]))
+		msg += " date: " + str(datetime.datetime.fromtimestamp(self._debugData.Last("RawPrice")["now"]))
 		print msg
 
-		if ("Trades" not in self._debugData):
-			self._debugData["Trades"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price
-		self._debugData["Trades"].append(tmp)
-
-		if ("Buy" not in self._debugData):
-			self._debugData["Buy"] = []
-
-		tmp = {}
-		tmp["now"] = self._debugData["LastPriceUpdateTime"]
-		tmp["value"] = self.Last_Buy_Price
-		self._debugData["Buy"].append(tmp)
-
-def feedRecordedData(score, sqliteDataFile, date_from, date_to):
-
-	db = sqlite3.connect(sqliteDataFile)
-	cursor = db.cursor()
-	data = cursor.execute("select amount,price,date from trades where ( (date>"+str(date_from)+") and (date<"+str(date_to)+") and (currency='USD') )")
-	actual_date_from = 9999999999999
-	actual_date_to = 0
-
-	price_volume_data = []
-
-	for row in data:
-		volume = float(row[0])
-		price = float(row[1])
-		date = float(row[2])
-
-		if ( actual_date_from > date ):
-			actual_date_from = date
-		if ( actual_date_to < date ):
-			actual_date_to = date
-
-		update_data = {}
-		update_data["now"] = date
-		update_data["price"] = price
-		update_data["volume"] = volume
-		price_volume_data.append(update_data)
-
-	from operator import itemgetter
-	price_volume_data = sorted(price_volume_data, key=itemgetter("now"))
-
-	for item in price_volume_data:
-		score.xcon.SetBTCPrice(item["price"])
-		tmp = {"now":item["now"], "value": item["price"]}
-		score.UpdatePrice(tmp)
-		tmp = {"now":item["now"], "value": item["volume"]}
-		score.UpdateVolume(tmp)
-		score.Act()
-
-	cursor.close()
-
-	return (actual_date_from, actual_date_to)
+		now = self._debugData.Last("RawPrice")["now"]
+		self._debugData.Append("Trades", now, self.xcon.AvailableUSD() + self.xcon.AvailableBTC() * self.Current_Price, decimate = False)
+		self._debugData.Append("Buy", now, self.Last_Buy_Price, decimate = False)
 
 def plotStrategyCorePerformance(debugData):
 	import strategy_plot
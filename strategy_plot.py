@@ -9,24 +9,52 @@ from indicator.ma import SimpleMovingAverage as sma
 from indicator.candlestick import CandleStick
 from indicator.timesum import TimeSum
 from exchange_connection import ExchangeConnection, MockExchangeConnection
+from debug_recorder import debugSeries
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as pltdates
 
+# Indexes of the datapoints to plot for a series of more than 2 * buckets datapoints.
+# The time range is cut in buckets of equal duration, and the lowest and the highest
+# datapoint of every bucket are kept, in time order, so the spikes are still drawn.
+# times must be sorted.
+def downsampleMinMax(times, values, buckets):
+	count = len(times)
+	if (count <= 2 * buckets):
+		return np.arange(count)
+	span = float(times[-1] - times[0])
+	if (span <= 0.0):
+		return np.array([0, count - 1])
+	bucket = np.minimum(((times - times[0]) * (buckets / span)).astype(int), buckets - 1)
+	# Sorted by bucket, then by value: the first datapoint of a bucket is its minimum, the last one its maximum
+	order = np.lexsort((values, bucket))
+	starts = np.flatnonzero(np.diff(bucket[order]) != 0) + 1
+	firsts = np.concatenate(([0], starts))
+	lasts = np.concatenate((starts - 1, [count - 1]))
+	return np.unique(np.concatenate((order[firsts], order[lasts], [0, count - 1])))
+
+# Plots the debug data of a strategy logic: a DebugRecorder, the series
+# memory-mapped by debug_recorder.loadDebugData(), or a dict of lists of dicts.
+# A series is reduced to about two datapoints per pixel of the width of the figure.
 class StrategyPlot:
 
-	def __init__(self, debugData, numberSubplots):
+	def __init__(self, debugData, numberSubplots, width = None):
 		self.debugData = debugData
 		self.numberSubplots = numberSubplots
 		self.xfrom = None
 		self.xto = None
 
+		# Width of the figure in pixels
+		if (width == None):
+			figure = plt.gcf()
+			width = int(figure.get_size_inches()[0] * figure.get_dpi())
+		self.Width = width
+
 		# Get the right x scale
-		time = []
-		for item in debugData["RawPrice"]:
-			time.append( datetime.datetime.fromtimestamp(item["now"]) )
-		self.SetXLimits(time[0], time[-1])
+		(times, values) = debugSeries(debugData, "RawPrice")
+		self.SetXLimits(pltdates.epoch2num(times[0]), pltdates.epoch2num(times[-1]))
 
+	# Limits of the time axis, datetimes or matplotlib date numbers
 	def SetXLimits(self, xfrom, xto):
 		self.xfrom = xfrom
 		self.xto = xto
@@ -36,14 +64,13 @@ class StrategyPlot:
 		if (plotName not in self.debugData):
 			return
 
-		time = []
-		value = []
-		for item in self.debugData[plotName]:
-			time.append( datetime.datetime.fromtimestamp(item["now"]) )
-			value.append(item["value"])
+		(times, values) = debugSeries(self.debugData, plotName)
+		kept = downsampleMinMax(times, values, self.Width)
+		dates = pltdates.epoch2num(np.asarray(times)[kept])
 
 		plt.subplot(self.numberSubplots,1,subplot)
-		plt.plot(time, value, format)
+		plt.plot(dates, np.asarray(values)[kept], format)
+		plt.gca().xaxis_date()
 		plt.ylabel(plotName)
 		if ( (self.xfrom != None) and (self.xto != None) ):
 			plt.xlim([self.xfrom, self.xto])
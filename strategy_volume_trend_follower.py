@@ -54,7 +54,7 @@ class Strategy(goxapi.BaseObject):
         # a trade message has been received
 
         # update the volume indicators
-        data = {"now": float(time.time()), "value": gox.base2float(volume) }
+        data = {"now": float(time.time()), "value": gox.base2float(volume), "price": gox.quote2float(price) }
         self.strategy_logic.UpdateVolume(data)
 
         # update price indicators
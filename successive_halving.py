@@ -0,0 +1,230 @@
+import os
+import sys
+import math
+import time
+import datetime
+import argparse
+import numpy as np
+import backtest
+import metrics
+import sweep
+from vectorized_backtest import loadPrices
+from exchange_connection import MockExchangeConnection
+
+"""
+	Successive halving optimizer of the constants of a strategy logic.
+	All the candidates are backtested on a short prefix of the date range
+	(the first rung), and only the best 1/eta of them are promoted to the
+	next rung, eta times longer, until the last rung covers the whole range.
+	A promoted candidate is not replayed from the start: it keeps its
+	strategy logic and its MockExchangeConnection, and continues with the
+	trades of the next rung. The trades are read once, and every trade is
+	fed to all the candidates still running, like backtest.replayTradesMany().
+	A candidate whose drawdown crosses --max-drawdown is aborted at the
+	trade where it does.
+
+	With --hyperband, several brackets are run one after the other, from
+	many candidates on a short first rung to few candidates on the whole
+	range, so that a strategy logic which needs time to pay off is not
+	always pruned early.
+
+	Usage:
+		python successive_halving.py simple_mean_reversion -r MinimumSpreadBuy=0.0:0.1 -r MinimumSpreadSell=0.0:0.1 -n 81
+		python successive_halving.py simple_trend_follower -r MinimumSpread=0.0:0.01 --hyperband --max-drawdown 0.3
+"""
+
+# Yields the trades of a stream rung after rung, without reading any twice
+class TradeStream:
+
+	def __init__(self, trades):
+		self._trades = iter(trades)
+		self._next = next(self._trades, None)
+
+	# Yields the trades before date_to not yielded yet
+	def Until(self, date_to):
+		while (self._next != None and self._next[0] < date_to):
+			trade = self._next
+			self._next = next(self._trades, None)
+			yield trade
+
+# End dates of the rungs: the last one is date_to, every other one eta times shorter than the next
+def rungEnds(date_from, date_to, rungs, eta):
+	return [date_from + (date_to - date_from) / float(eta) ** (rungs - 1 - i) for i in range(rungs)]
+
+# A strategy logic being optimized, with its own exchange connection
+def createCandidate(strategy, params):
+	xcon = MockExchangeConnection()
+	candidate = {}
+	candidate["params"] = params
+	candidate["xcon"] = xcon
+	candidate["score"] = backtest.createStrategy(strategy, xcon, params)
+	candidate["aborted"] = False
+	candidate["rung"] = 0
+	return candidate
+
+# Feed the trades to the candidates, aborting a candidate at the trade where
+# its drawdown goes above max_drawdown. Returns the number of trades.
+def replayPruning(candidates, trades, max_drawdown):
+	running = [candidate for candidate in candidates if not candidate["aborted"]]
+	# The strategy logics print every order in debug mode
+	stdout = sys.stdout
+	sys.stdout = open(os.devnull, "w")
+	try:
+		total = _replayPruning(running, trades, max_drawdown)
+	finally:
+		sys.stdout.close()
+		sys.stdout = stdout
+	return total
+
+# The fan-out of backtest.replayTradesMany(), checking the drawdown of every
+# candidate after the price update, before it acts on the trade
+def _replayPruning(running, trades, max_drawdown):
+	total = 0
+	fanout = [(candidate, candidate["xcon"], candidate["score"], getattr(candidate["score"], "UpdateVolume", None)) for candidate in running]
+	for (date, price, volume) in trades:
+		if (len(fanout) == 0):
+			break
+		total += 1
+		price_data = {"now":date, "value":price}
+		volume_data = {"now":date, "value":volume, "price":price}
+		aborted = False
+		for (candidate, xcon, score, updateVolume) in fanout:
+			xcon.SetBTCPrice(price, date)
+			if (xcon.maxDrawdown > max_drawdown):
+				candidate["aborted"] = True
+				aborted = True
+				continue
+			score.UpdatePrice(price_data)
+			if (updateVolume != None):
+				updateVolume(volume_data)
+			score.Act()
+		if (aborted):
+			fanout = [entry for entry in fanout if not entry[0]["aborted"]]
+	return total
+
+# Result of a candidate at the end of a rung, with the metrics of its equity curve so far
+def candidateResult(candidate, dates, prices):
+	xcon = candidate["xcon"]
+	result = {}
+	result["params"] = candidate["params"]
+	result["rung"] = candidate["rung"]
+	result["aborted"] = candidate["aborted"]
+	result["btc"] = xcon.AvailableBTC()
+	result["usd"] = xcon.AvailableUSD()
+	result["equity"] = xcon.Equity()
+	if (candidate["aborted"]):
+		# The equity curve ends at the trade that aborted the candidate
+		end = int(np.searchsorted(dates, xcon.currentTime, side = "right"))
+		(dates, prices) = (dates[:end], prices[:end])
+	result.update(metrics.backtestMetrics(xcon, dates, prices))
+	# The drawdown that aborted the candidate, measured before its last order if any
+	result["max_drawdown"] = max(result["max_drawdown"], xcon.maxDrawdown)
+	return result
+
+# Backtest the combinations (dicts of constants) with successive halving.
+# Returns the results of the candidates of the last rung, best first, followed
+# by the ones pruned or aborted earlier, by the rung they reached.
+def successiveHalving(strategy, combinations, database, date_from, date_to, rungs = 4, eta = 3, max_drawdown = 0.5, key = "sharpe", currency = "USD", warmup = 0, checkpoints = None, verbose = True):
+	ends = rungEnds(date_from, date_to, rungs, eta)
+	candidates = [createCandidate(strategy, params) for params in combinations]
+	if (warmup > 0):
+		checkpoints = backtest.createCheckpoints(database, checkpoints)
+		for candidate in candidates:
+			backtest.warmUp(candidate["score"], database, date_from, warmup, currency, checkpoints = checkpoints)
+
+	stream = TradeStream(backtest.loadTrades(database, date_from, date_to, currency))
+	running = candidates
+	finished = []
+	for (rung, end) in enumerate(ends):
+		started = time.time()
+		for candidate in running:
+			candidate["rung"] = rung
+		count = replayPruning(running, stream.Until(end), max_drawdown)
+
+		(dates, prices) = loadPrices(database, date_from, min(end, date_to), currency)
+		results = metrics.rankResults([candidateResult(candidate, dates, prices) for candidate in running], key)
+		aborted = [result for result in results if result["aborted"]]
+		results = [result for result in results if not result["aborted"]]
+		if (verbose):
+			print "Rung " + str(rung + 1) + "/" + str(rungs) + " until " + datetime.datetime.utcfromtimestamp(end).strftime(backtest.DATE_FORMAT) + ": " + str(len(running)) + " candidates, " + str(count) + " trades in " + ("%.1f" % (time.time() - started)) + "s, " + str(len(aborted)) + " aborted above " + ("%.0f" % (max_drawdown * 100)) + "% drawdown"
+
+		if (rung == len(ends) - 1):
+			return results + aborted + finished
+		# Promote the best 1/eta of the candidates which are still running
+		promoted = int(math.ceil(len(running) / float(eta)))
+		kept = set([id(result["params"]) for result in results[:promoted]])
+		finished = results[promoted:] + aborted + finished
+		running = [candidate for candidate in running if id(candidate["params"]) in kept]
+		if (len(running) == 0):
+			return finished
+
+# Hyperband: successive halving in brackets from rungs rungs down to a single one,
+# with random combinations between the bounds. Returns all the results, best first.
+def hyperband(strategy, bounds, database, date_from, date_to, rungs = 4, eta = 3, max_drawdown = 0.5, key = "sharpe", currency = "USD", warmup = 0, checkpoints = None, seed = None):
+	results = []
+	for bracket in reversed(range(rungs)):
+		samples = int(math.ceil(rungs / float(bracket + 1) * eta ** bracket))
+		bracket_seed = None if seed == None else seed + bracket
+		print "Bracket of " + str(bracket + 1) + " rungs, " + str(samples) + " candidates"
+		combinations = sweep.randomCombinations(bounds, samples, bracket_seed)
+		finals = successiveHalving(strategy, combinations, database, date_from, date_to, bracket + 1, eta, max_drawdown, key, currency, warmup, checkpoints)
+		# Only the candidates which ran over the whole range are compared across brackets
+		results += [result for result in finals if result["rung"] == bracket and not result["aborted"]]
+	return metrics.rankResults(results, key)
+
+def printCandidates(results, names, count = sweep.RANKED):
+	widths = [max(len(name), 14) for name in names]
+	print " ".join(["%*s" % (width, name) for (width, name) in zip(widths, names)]) + " %5s %14s %8s %12s %9s %13s" % ("Rung", "Equity", "Orders", "Return", "Sharpe", "Max drawdown")
+	for result in results[:count]:
+		state = " aborted" if result["aborted"] else ""
+		print " ".join(["%*s" % (width, ("%.6g" % result["params"][name]) if isinstance(result["params"][name], float) else result["params"][name]) for (width, name) in zip(widths, names)]) + " %5d %14.5f %8d %11.2f%% %9.2f %12.2f%%" % (result["rung"] + 1, result["equity"], result["orders"], result["return"] * 100, result["sharpe"], result["max_drawdown"] * 100) + state
+
+def main():
+	parser = argparse.ArgumentParser(description = "Optimize the constants of a strategy logic by successive halving")
+	parser.add_argument('strategy', choices = sorted(backtest.STRATEGIES.keys()))
+	parser.add_argument('-g', '--grid', action = "append", type = backtest.parseParam, default = [], help = "grid parameter, Name=a,b,c or Name=start:stop:step")
+	parser.add_argument('-r', '--random', action = "append", type = backtest.parseParam, default = [], help = "random search parameter, Name=low:high")
+	parser.add_argument('-n', '--samples', type = int, default = 81, help = "number of random combinations")
+	parser.add_argument('-s', '--seed', type = int, default = 1)
+	parser.add_argument('-f', '--from', dest = "date_from", default = "2013 Nov 1 00:00", help = "start date, e.g. \"2013 Nov 1 00:00\" (UTC)")
+	parser.add_argument('-t', '--to', dest = "date_to", default = "2013 Nov 30 00:00", help = "end date (UTC)")
+	parser.add_argument('-d', '--database', default = "mtgoxdata/mtgox.sqlite3")
+	parser.add_argument('-c', '--currency', default = "USD")
+	parser.add_argument('--rungs', type = int, default = 4, help = "number of rungs, the first one covers 1/eta^(rungs-1) of the range")
+	parser.add_argument('--eta', type = float, default = 3, help = "1/eta of the candidates is promoted to a rung eta times longer")
+	parser.add_argument('--max-drawdown', type = float, default = 0.5, help = "abort a candidate whose drawdown goes above this fraction")
+	parser.add_argument('--hyperband', action = "store_true", help = "run brackets of rungs, from many candidates on a short first rung to few on the whole range")
+	parser.add_argument('--rank', default = "sharpe", choices = ["equity", "return", "sharpe", "max_drawdown", "exposure"], help = "metric to promote the candidates by, the Sharpe ratio by default")
+	parser.add_argument('-w', '--warmup', type = float, default = 0, help = "hours of trades before the start date to warm up the indicators with")
+	parser.add_argument('--checkpoints', default = None, help = "directory of the warm-up checkpoints, next to the database by default")
+	args = parser.parse_args()
+
+	if (args.eta <= 1):
+		parser.error("eta must be above 1")
+	if (len(args.grid) > 0 and (len(args.random) > 0 or args.hyperband)):
+		parser.error("use either grid or random search parameters, hyperband draws random ones")
+	date_from = backtest.parseDate(args.date_from)
+	date_to = backtest.parseDate(args.date_to)
+
+	started = time.time()
+	if (args.hyperband):
+		if (len(args.random) == 0):
+			parser.error("no parameters to optimize")
+		bounds = dict([(name, sweep.parseBounds(sweep.formatValue(value))) for (name, value) in args.random])
+		results = hyperband(args.strategy, bounds, args.database, date_from, date_to, args.rungs, args.eta, args.max_drawdown, args.rank, args.currency, args.warmup * 3600, args.checkpoints, args.seed)
+		names = sorted(bounds.keys())
+	else:
+		if (len(args.grid) > 0):
+			combinations = sweep.gridCombinations(dict([(name, sweep.parseGrid(sweep.formatValue(value))) for (name, value) in args.grid]))
+		elif (len(args.random) > 0):
+			combinations = sweep.randomCombinations(dict([(name, sweep.parseBounds(sweep.formatValue(value))) for (name, value) in args.random]), args.samples, args.seed)
+		else:
+			parser.error("no parameters to optimize")
+		results = successiveHalving(args.strategy, combinations, args.database, date_from, date_to, args.rungs, args.eta, args.max_drawdown, args.rank, args.currency, args.warmup * 3600, args.checkpoints)
+		names = sorted(combinations[0].keys())
+
+	print "Optimized in " + ("%.1f" % (time.time() - started)) + "s, best candidates by " + args.rank + ":"
+	printCandidates(results, names)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,258 @@
+import math
+import time
+import argparse
+import multiprocessing
+import numpy as np
+import backtest
+import metrics
+import sweep
+from exchange_connection import MockExchangeConnection
+
+"""
+	Surrogate model optimizer of the constants of a strategy logic.
+	A Gaussian process, fitted with NumPy on the backtests done so far,
+	predicts the metric of the untried constants and how uncertain it is.
+	The next batch of constants is the one with the highest expected
+	improvement over the best backtest, one candidate after the other: a
+	candidate is assumed to score what the model predicts ("kriging
+	believer"), and the model is refitted before picking the next one, so
+	a batch spreads over the promising regions. The batch is backtested in
+	parallel by the process pool of sweep.py, or scored by
+	vectorized_backtest. It usually converges in a few tens of backtests.
+
+	Any numeric constant of a strategy logic can be optimized, between
+	bounds; the constants whose bounds are both integers stay integers.
+
+	Usage:
+		python surrogate.py simple_mean_reversion -r MinimumSpreadBuy=0.0:0.1 -r MinimumSpreadSell=0.0:0.1
+		python surrogate.py simple_trend_follower -r MinimumSpread=0.0:0.01 -r Price_Fast_EMA_Time=3:10 --rank equity -v
+"""
+
+# Length scales (in the unit cube of the bounds) and noise levels (of the standardized metric) tried when fitting
+LENGTH_SCALES = [0.05, 0.1, 0.2, 0.4, 0.8]
+NOISE_LEVELS = [1e-4, 1e-2, 1e-1]
+
+# Random candidates per dimension among which the next constants are picked
+CANDIDATES_PER_DIMENSION = 1000
+
+# Gaussian process regression with a squared exponential kernel
+class GaussianProcess:
+
+	def __init__(self):
+		self.LengthScale = None
+		self.Noise = None
+		self._x = None
+		self._alpha = None
+		self._cholesky = None
+		self._mean = 0.0
+		self._scale = 1.0
+
+	# Fit the points x (n x d) with values y, with the length scale and the noise of highest marginal likelihood
+	def Fit(self, x, y):
+		x = np.asarray(x, dtype = float)
+		y = np.asarray(y, dtype = float)
+		self._mean = y.mean()
+		self._scale = y.std() if y.std() > 0.0 else 1.0
+		target = (y - self._mean) / self._scale
+		distances = _squaredDistances(x, x)
+
+		best = None
+		for length_scale in LENGTH_SCALES:
+			for noise in NOISE_LEVELS:
+				covariance = np.exp(-0.5 * distances / length_scale ** 2) + noise * np.eye(len(x))
+				try:
+					cholesky = np.linalg.cholesky(covariance)
+				except np.linalg.LinAlgError:
+					continue
+				alpha = np.linalg.solve(cholesky.T, np.linalg.solve(cholesky, target))
+				likelihood = -0.5 * np.dot(target, alpha) - np.log(np.diag(cholesky)).sum()
+				if (best == None or likelihood > best[0]):
+					best = (likelihood, length_scale, noise, cholesky, alpha)
+		(likelihood, self.LengthScale, self.Noise, self._cholesky, self._alpha) = best
+		self._x = x
+
+	# Mean and standard deviation of the values predicted at the points x
+	def Predict(self, x):
+		x = np.asarray(x, dtype = float)
+		cross = np.exp(-0.5 * _squaredDistances(x, self._x) / self.LengthScale ** 2)
+		mean = np.dot(cross, self._alpha)
+		v = np.linalg.solve(self._cholesky, cross.T)
+		variance = np.maximum(1.0 - (v * v).sum(axis = 0), 1e-12)
+		return (mean * self._scale + self._mean, np.sqrt(variance) * self._scale)
+
+def _squaredDistances(a, b):
+	return ((a[:, np.newaxis, :] - b[np.newaxis, :, :]) ** 2).sum(axis = 2)
+
+_erf = np.vectorize(math.erf)
+
+# Expected improvement over best of a value predicted with mean and std, to maximize
+def expectedImprovement(mean, std, best, xi = 0.01):
+	z = (mean - best - xi) / std
+	cdf = 0.5 * (1.0 + _erf(z / math.sqrt(2.0)))
+	pdf = np.exp(-0.5 * z * z) / math.sqrt(2.0 * math.pi)
+	return (mean - best - xi) * cdf + std * pdf
+
+# Constants of the strategy logic to optimize, between bounds {name: (low, high)}
+class SurrogateOptimizer:
+
+	def __init__(self, bounds, initial = 8, seed = None):
+		self.Names = sorted(bounds.keys())
+		self.Bounds = bounds
+		self.Initial = initial
+		# Backtests told so far: (constants, value)
+		self.Observations = []
+		self._rnd = np.random.RandomState(seed)
+		self._seed = seed
+
+	# Next batch of constants to backtest, a list of {name: value}.
+	# The first ones are random, the next ones proposed by the model.
+	def Ask(self, batch):
+		if (len(self.Observations) < self.Initial):
+			count = min(batch, self.Initial - len(self.Observations))
+			seed = None if self._seed == None else self._seed + len(self.Observations)
+			return sweep.randomCombinations(self.Bounds, count, seed)
+
+		x = [self._toUnit(params) for (params, value) in self.Observations]
+		y = [value for (params, value) in self.Observations]
+		candidates = self._candidates(np.array(x), np.array(y))
+		proposals = []
+		model = GaussianProcess()
+		for i in range(batch):
+			model.Fit(x, y)
+			(mean, std) = model.Predict(candidates)
+			improvement = expectedImprovement(mean, std, max(y))
+			pick = int(np.argmax(improvement))
+			params = self._fromUnit(candidates[pick])
+			proposals.append(params)
+			# Believe the model about this candidate, and pick the next one elsewhere
+			x.append(self._toUnit(params))
+			y.append(float(mean[pick]))
+			candidates = np.delete(candidates, pick, axis = 0)
+		return proposals
+
+	# Record the value (higher is better) of the backtest of the constants params
+	def Tell(self, params, value):
+		self.Observations.append((params, value))
+
+	# Best (constants, value) so far
+	def Best(self):
+		return max(self.Observations, key = lambda observation: observation[1])
+
+	# Random points of the unit cube, and points close to the best observations
+	def _candidates(self, x, y):
+		dimensions = len(self.Names)
+		uniform = self._rnd.uniform(size = (CANDIDATES_PER_DIMENSION * dimensions, dimensions))
+		best = x[np.argsort(-y)[:3]]
+		local = best[self._rnd.randint(len(best), size = CANDIDATES_PER_DIMENSION // 4)]
+		local = np.clip(local + self._rnd.normal(scale = 0.05, size = local.shape), 0.0, 1.0)
+		return np.vstack((uniform, local))
+
+	def _isInteger(self, name):
+		(low, high) = self.Bounds[name]
+		return isinstance(low, int) and isinstance(high, int)
+
+	def _toUnit(self, params):
+		unit = []
+		for name in self.Names:
+			(low, high) = self.Bounds[name]
+			unit.append((params[name] - low) / float(high - low) if high > low else 0.0)
+		return unit
+
+	def _fromUnit(self, unit):
+		params = {}
+		for (name, value) in zip(self.Names, unit):
+			(low, high) = self.Bounds[name]
+			value = low + value * (high - low)
+			if (self._isInteger(name)):
+				value = int(round(value))
+			else:
+				value = float(value)
+			params[name] = value
+		return params
+
+# Check that the constants are numeric attributes of the strategy logic
+def checkBounds(strategy, bounds):
+	cls = backtest.loadStrategy(strategy)
+	score = backtest.createStrategy(strategy, MockExchangeConnection())
+	for name in bounds.keys():
+		if (not hasattr(score, name)):
+			raise ValueError(cls.__name__ + " has no parameter " + name)
+		if (isinstance(getattr(score, name), bool) or not isinstance(getattr(score, name), (int, long, float))):
+			raise ValueError(cls.__name__ + "." + name + " is not a number")
+
+# Optimize the constants of a strategy logic between bounds with batches of backtests.
+# The metric key of metrics.py is maximized, or minimized for the ones of metrics.LOWER_IS_BETTER.
+# Returns the results of all the backtests, best first.
+def optimize(strategy, bounds, database, date_from, date_to, batches = 4, batch = 4, initial = 8, key = "sharpe", currency = "USD", processes = None, vectorized = False, warmup = 0, checkpoints = None, seed = None):
+	checkBounds(strategy, bounds)
+	sign = -1.0 if key in metrics.LOWER_IS_BETTER else 1.0
+	optimizer = SurrogateOptimizer(bounds, initial, seed)
+
+	if (vectorized):
+		import vectorized_backtest
+		(dates, prices) = vectorized_backtest.loadPrices(database, date_from, date_to, currency)
+		vectorized = vectorized_backtest.VectorizedBacktest(dates, prices)
+		pool = None
+	else:
+		if (processes == None):
+			processes = multiprocessing.cpu_count()
+		pool = multiprocessing.Pool(processes, sweep._initWorker)
+
+	total = initial + batches * batch
+	results = []
+	try:
+		while (len(results) < total):
+			size = initial - len(results) if len(results) < initial else min(batch, total - len(results))
+			tasks = [(strategy, params, database, date_from, date_to, currency, warmup, checkpoints) for params in optimizer.Ask(size)]
+			started = time.time()
+			if (pool == None):
+				evaluated = [sweep.evaluateVectorized(vectorized, task) for task in tasks]
+			else:
+				evaluated = pool.map(sweep.evaluate, tasks)
+			for result in evaluated:
+				optimizer.Tell(result["params"], sign * result[key])
+				results.append(result)
+			(best, value) = optimizer.Best()
+			print "Backtests: " + str(len(results)) + " in " + ("%.1f" % (time.time() - started)) + "s, best " + key + ": " + str(sign * value) + " " + str(best)
+		if (pool != None):
+			pool.close()
+	except KeyboardInterrupt:
+		if (pool != None):
+			pool.terminate()
+		raise
+	finally:
+		if (pool != None):
+			pool.join()
+	return metrics.rankResults(results, key)
+
+def main():
+	parser = argparse.ArgumentParser(description = "Optimize the constants of a strategy logic with a surrogate model")
+	parser.add_argument('strategy', choices = sorted(backtest.STRATEGIES.keys()))
+	parser.add_argument('-r', '--random', dest = "bounds", action = "append", type = backtest.parseParam, default = [], help = "constant to optimize, Name=low:high")
+	parser.add_argument('-i', '--initial', type = int, default = 8, help = "number of random backtests before the model proposes constants")
+	parser.add_argument('-b', '--batches', type = int, default = 4, help = "number of batches proposed by the model")
+	parser.add_argument('-n', '--batch', type = int, default = multiprocessing.cpu_count(), help = "backtests per batch, the number of cores by default")
+	parser.add_argument('-s', '--seed', type = int, default = 1)
+	parser.add_argument('-f', '--from', dest = "date_from", default = "2013 Nov 1 00:00", help = "start date, e.g. \"2013 Nov 1 00:00\" (UTC)")
+	parser.add_argument('-t', '--to', dest = "date_to", default = "2013 Nov 30 00:00", help = "end date (UTC)")
+	parser.add_argument('-d', '--database', default = "mtgoxdata/mtgox.sqlite3")
+	parser.add_argument('-c', '--currency', default = "USD")
+	parser.add_argument('-j', '--processes', type = int, default = None, help = "size of the pool, the number of cores by default")
+	parser.add_argument('-v', '--vectorized', action = "store_true", help = "score the moving average crossover strategies with vectorized_backtest")
+	parser.add_argument('--rank', default = "sharpe", choices = ["equity", "return", "sharpe", "max_drawdown", "exposure"], help = "metric to optimize, the Sharpe ratio by default")
+	parser.add_argument('-w', '--warmup', type = float, default = 0, help = "hours of trades before the start date to warm up the indicators with")
+	parser.add_argument('--checkpoints', default = None, help = "directory of the warm-up checkpoints, next to the database by default")
+	args = parser.parse_args()
+
+	if (len(args.bounds) == 0):
+		parser.error("no parameters to optimize")
+	if (args.vectorized and args.warmup > 0):
+		parser.error("the vectorized backtest does not warm up the indicators")
+	bounds = dict([(name, sweep.parseBounds(sweep.formatValue(value))) for (name, value) in args.bounds])
+	results = optimize(args.strategy, bounds, args.database, backtest.parseDate(args.date_from), backtest.parseDate(args.date_to), args.batches, max(args.batch, 1), args.initial, args.rank, args.currency, args.processes, args.vectorized, args.warmup * 3600, args.checkpoints, args.seed)
+	best = results[0]
+	print "Best of " + str(len(results)) + " backtests by " + args.rank + ": " + " ".join([name + "=" + sweep.formatValue(best["params"][name]) for name in sorted(bounds.keys())])
+	print "Equity: " + str(best["equity"]) + " orders: " + str(best["orders"]) + " return: " + ("%.2f" % (best["return"] * 100)) + "% Sharpe: " + ("%.2f" % best["sharpe"]) + " max drawdown: " + ("%.2f" % (best["max_drawdown"] * 100)) + "%"
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,255 @@
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import multiprocessing
+import backtest
+import metrics
+from vectorized_backtest import loadPrices
+from exchange_connection import MockExchangeConnection
+
+"""
+	Parameter sweeps of a strategy logic over a process pool.
+	Every combination of the parameters is backtested in its own process,
+	the pool has one process per core by default. The results are appended
+	to a CSV file as soon as they are known, one row per combination with
+	the parameters, the final funds, the number of orders and the metrics of
+	the equity curve (metrics.py). Combinations already in the file are
+	skipped, so an interrupted sweep continues where it stopped. At the end,
+	all the combinations in the file are ranked, by Sharpe ratio by default.
+
+	Usage:
+		python sweep.py simple_mean_reversion -g MinimumSpreadBuy=0.01:0.05:0.01 -g MinimumSpreadSell=0.005,0.01
+		python sweep.py simple_trend_follower -r MinimumSpread=0.0:0.01 -n 64 -o trend.csv
+"""
+
+# Columns of the results, after the parameters
+RESULT_COLUMNS = ["equity", "orders", "max_drawdown", "return", "sharpe", "exposure", "trades", "seconds"]
+
+# Combinations printed by the ranking
+RANKED = 10
+
+# The values of a grid parameter: "a,b,c" or "start:stop:step", stop included
+def parseGrid(text):
+	if (":" in text):
+		(start, stop, step) = [backtest.parseParam("x=" + value)[1] for value in text.split(":")]
+		if (step <= 0):
+			raise ValueError("the step must be positive: " + text)
+		values = []
+		i = 0
+		# Count the steps instead of adding them up, to not accumulate rounding errors
+		while (start + i * step <= stop + step * 1e-9):
+			values.append(start + i * step)
+			i += 1
+		return values
+	return [backtest.parseParam("x=" + value)[1] for value in text.split(",")]
+
+# (low, high) of a random search parameter: "low:high"
+def parseBounds(text):
+	(low, high) = [backtest.parseParam("x=" + value)[1] for value in text.split(":")]
+	return (low, high)
+
+# All the combinations of the grid, a list of {name: value}
+def gridCombinations(grid):
+	combinations = [{}]
+	for name in sorted(grid.keys()):
+		combinations = [dict(combination, **{name: value}) for combination in combinations for value in grid[name]]
+	return combinations
+
+# samples random combinations, uniform between the bounds, integers if both bounds are integers
+def randomCombinations(bounds, samples, seed = None):
+	rnd = random.Random(seed)
+	combinations = []
+	for i in xrange(samples):
+		combination = {}
+		for name in sorted(bounds.keys()):
+			(low, high) = bounds[name]
+			if (isinstance(low, int) and isinstance(high, int)):
+				combination[name] = rnd.randint(low, high)
+			else:
+				combination[name] = rnd.uniform(low, high)
+		combinations.append(combination)
+	return combinations
+
+# Text of a parameter value in the CSV, floats are written exactly
+def formatValue(value):
+	if (isinstance(value, float)):
+		return repr(value)
+	return str(value)
+
+def combinationKey(names, combination):
+	return tuple([formatValue(combination[name]) for name in names])
+
+# Keys of the combinations already in the results file
+def finishedCombinations(filename, names):
+	finished = set()
+	if (not os.path.exists(filename)):
+		return finished
+	f = open(filename, "rb")
+	try:
+		for row in csv.DictReader(f):
+			finished.add(tuple([row.get(name) for name in names]))
+	finally:
+		f.close()
+	return finished
+
+# Columns of the results file
+def readHeader(filename):
+	f = open(filename, "rb")
+	try:
+		return next(csv.reader(f), [])
+	finally:
+		f.close()
+
+# Rows of the results file, {column: value} with the values converted to numbers
+def loadResults(filename):
+	f = open(filename, "rb")
+	try:
+		return [dict([backtest.parseParam(name + "=" + value) for (name, value) in row.items()]) for row in csv.DictReader(f)]
+	finally:
+		f.close()
+
+# The best combinations in the results file by the metric key
+def printRanking(filename, names, key, count = RANKED):
+	if (not os.path.exists(filename)):
+		return
+	ranked = metrics.rankResults(loadResults(filename), key)
+	print "Best " + str(min(count, len(ranked))) + " of " + str(len(ranked)) + " combinations by " + key + ":"
+	widths = [max(len(name), 14) for name in names]
+	print " ".join(["%*s" % (width, name) for (width, name) in zip(widths, names)]) + " %14s %8s %12s %9s %13s %9s" % ("Equity", "Orders", "Return", "Sharpe", "Max drawdown", "Exposure")
+	for row in ranked[:count]:
+		print " ".join(["%*s" % (width, formatValue(row[name])) for (width, name) in zip(widths, names)]) + " %14.5f %8d %11.2f%% %9.2f %12.2f%% %8.1f%%" % (row["equity"], row["orders"], row["return"] * 100, row["sharpe"], row["max_drawdown"] * 100, row["exposure"] * 100)
+
+def _initWorker():
+	# The strategy logics print every order in debug mode
+	sys.stdout = open(os.devnull, "w")
+
+# Backtest one combination, runs in a worker process
+def evaluate(task):
+	(strategy, params, database, date_from, date_to, currency, warmup, checkpoints) = task
+	xcon = MockExchangeConnection()
+	score = backtest.createStrategy(strategy, xcon, params)
+	checkpoints = backtest.createCheckpoints(database, checkpoints, warmup > 0)
+	result = backtest.runBacktest(score, database, date_from, date_to, currency, warmup = warmup, checkpoints = checkpoints)
+	(dates, prices) = loadPrices(database, date_from, date_to, currency)
+	result.update(metrics.backtestMetrics(xcon, dates, prices))
+	result["params"] = params
+	return result
+
+# Score one combination on the moving averages computed once for the whole sweep
+def evaluateVectorized(vectorized, task):
+	(strategy, params, database, date_from, date_to, currency, warmup, checkpoints) = task
+	score = backtest.createStrategy(strategy, MockExchangeConnection(), params)
+	result = vectorized.Run(score)
+	result["params"] = params
+	return result
+
+# Backtest every combination over a pool of processes, appending the results to filename.
+# Combinations already in the file are skipped. Returns the results of this run.
+# With vectorized, the moving average crossover strategies are scored in this
+# process by vectorized_backtest, which is faster than a pool of replays.
+# With warmup seconds, the indicators are warmed up before date_from, and the
+# warm-up is shared through the checkpoints directory (next to the database by default).
+def runSweep(strategy, combinations, database, date_from, date_to, filename, currency = "USD", processes = None, vectorized = False, warmup = 0, checkpoints = None):
+	if (vectorized and warmup > 0):
+		raise ValueError("the vectorized backtest does not warm up the indicators")
+	if (len(combinations) == 0):
+		return []
+	names = sorted(combinations[0].keys())
+
+	finished = finishedCombinations(filename, names)
+	tasks = []
+	for combination in combinations:
+		if (combinationKey(names, combination) in finished):
+			continue
+		finished.add(combinationKey(names, combination))
+		tasks.append((strategy, combination, database, date_from, date_to, currency, warmup, checkpoints))
+	print "Combinations: " + str(len(combinations)) + ", already done: " + str(len(combinations) - len(tasks))
+	if (len(tasks) == 0):
+		return []
+
+	new_file = not os.path.exists(filename)
+	if (not new_file and readHeader(filename) != names + RESULT_COLUMNS):
+		raise ValueError(filename + " has other columns, sweep into another file")
+	f = open(filename, "ab")
+	writer = csv.writer(f)
+	if (new_file):
+		writer.writerow(names + RESULT_COLUMNS)
+		f.flush()
+
+	started = time.time()
+	if (vectorized):
+		import vectorized_backtest
+		(dates, prices) = vectorized_backtest.loadPrices(database, date_from, date_to, currency)
+		vectorized = vectorized_backtest.VectorizedBacktest(dates, prices)
+		processes = 1
+		pool = None
+		evaluated = (evaluateVectorized(vectorized, task) for task in tasks)
+	else:
+		if (processes == None):
+			processes = multiprocessing.cpu_count()
+		pool = multiprocessing.Pool(processes, _initWorker)
+		evaluated = pool.imap_unordered(evaluate, tasks)
+	results = []
+	try:
+		for result in evaluated:
+			row = [formatValue(result["params"][name]) for name in names]
+			row += [formatValue(result[column]) for column in RESULT_COLUMNS]
+			writer.writerow(row)
+			f.flush()
+			results.append(result)
+			print str(len(results)) + "/" + str(len(tasks)) + " " + str(result["params"]) + " equity: " + str(result["equity"]) + " orders: " + str(result["orders"]) + " max drawdown: " + ("%.2f" % (result["max_drawdown"] * 100)) + "%"
+		if (pool != None):
+			pool.close()
+	except KeyboardInterrupt:
+		if (pool != None):
+			pool.terminate()
+		raise
+	finally:
+		if (pool != None):
+			pool.join()
+		f.close()
+	print "Sweep of " + str(len(tasks)) + " combinations in " + ("%.1f" % (time.time() - started)) + "s on " + str(processes) + " processes"
+	return results
+
+def main():
+	parser = argparse.ArgumentParser(description = "Sweep the parameters of a strategy logic over a process pool")
+	parser.add_argument('strategy', choices = sorted(backtest.STRATEGIES.keys()))
+	parser.add_argument('-g', '--grid', action = "append", type = backtest.parseParam, default = [], help = "grid parameter, Name=a,b,c or Name=start:stop:step")
+	parser.add_argument('-r', '--random', action = "append", type = backtest.parseParam, default = [], help = "random search parameter, Name=low:high")
+	parser.add_argument('-n', '--samples', type = int, default = 32, help = "number of random combinations")
+	parser.add_argument('-s', '--seed', type = int, default = 1)
+	parser.add_argument('-f', '--from', dest = "date_from", default = "2013 Nov 1 00:00", help = "start date, e.g. \"2013 Nov 1 00:00\" (UTC)")
+	parser.add_argument('-t', '--to', dest = "date_to", default = "2013 Nov 30 00:00", help = "end date (UTC)")
+	parser.add_argument('-d', '--database', default = "mtgoxdata/mtgox.sqlite3")
+	parser.add_argument('-c', '--currency', default = "USD")
+	parser.add_argument('-o', '--output', default = None, help = "results CSV file, sweep_<strategy>.csv by default")
+	parser.add_argument('-j', '--processes', type = int, default = None, help = "size of the pool, the number of cores by default")
+	parser.add_argument('-v', '--vectorized', action = "store_true", help = "score the moving average crossover strategies with vectorized_backtest")
+	parser.add_argument('-w', '--warmup', type = float, default = 0, help = "hours of trades before the start date to warm up the indicators with")
+	parser.add_argument('--checkpoints', default = None, help = "directory of the warm-up checkpoints, next to the database by default")
+	parser.add_argument('--rank', default = "sharpe", choices = ["equity", "return", "sharpe", "max_drawdown", "exposure"], help = "metric to rank the combinations by, the Sharpe ratio by default")
+	args = parser.parse_args()
+
+	if (args.vectorized and args.warmup > 0):
+		parser.error("the vectorized backtest does not warm up the indicators")
+	if (len(args.grid) > 0 and len(args.random) > 0):
+		parser.error("use either grid or random search parameters")
+	if (len(args.grid) > 0):
+		combinations = gridCombinations(dict([(name, parseGrid(formatValue(value))) for (name, value) in args.grid]))
+	elif (len(args.random) > 0):
+		combinations = randomCombinations(dict([(name, parseBounds(formatValue(value))) for (name, value) in args.random]), args.samples, args.seed)
+	else:
+		parser.error("no parameters to sweep")
+
+	filename = args.output
+	if (filename == None):
+		filename = "sweep_" + args.strategy + ".csv"
+
+	runSweep(args.strategy, combinations, args.database, backtest.parseDate(args.date_from), backtest.parseDate(args.date_to), filename, args.currency, args.processes, args.vectorized, args.warmup * 3600, args.checkpoints)
+	printRanking(filename, sorted(combinations[0].keys()), args.rank)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,110 @@
+import unittest
+import numpy as np
+from indicator.ma import SimpleMovingAverage, ExponentialMovingAverage, TimeExponentialMovingAverage
+from indicator.timeminmax import TimeMin, TimeMax
+from indicator.volatility import MovingVariance
+
+"""
+	UpdateMany() of an indicator computes the window of a whole batch of
+	datapoints at once. It has to give the same values as UpdateValue()
+	called for every datapoint, whatever the batches are.
+
+	Usage:
+		python -m unittest test_indicator_batch
+"""
+
+# Window of the indicators, in seconds
+WINDOW = 60.0
+
+# Relative difference allowed between the batches and the datapoints fed one by one
+TOLERANCE = 1e-9
+
+# Timestamps and prices of trades. The trades come every 5 seconds first, so
+# that the window of 60 seconds is evicted from before it fills the 16 rows
+# of a RingBuffer, which wraps around. Then they come every 0.2 seconds, the
+# window grows to 300 datapoints and the RingBuffer doubles its capacity.
+# Some trades share their timestamp with the previous one.
+def trades(seed = 1):
+	random = np.random.RandomState(seed)
+	gaps = np.concatenate((random.uniform(4.0, 6.0, 200), random.uniform(0.0, 0.4, 2000), random.uniform(0.0, 10.0, 300)))
+	gaps[random.randint(0, len(gaps), 100)] = 0.0
+	times = 1383264000.0 + np.cumsum(gaps)
+	prices = 200.0 + np.cumsum(random.normal(0.0, 0.5, len(times)))
+	return (times, prices)
+
+# Value of the indicator after every datapoint, fed one by one
+def updateValues(indicator, times, prices, value):
+	result = np.empty(len(times))
+	for i in range(len(times)):
+		indicator.UpdateValue(float(times[i]), float(prices[i]))
+		result[i] = getattr(indicator, value)
+	return result
+
+class UpdateManyTest(unittest.TestCase):
+
+	def assertSeries(self, result, expected):
+		self.assertEqual(len(result), len(expected))
+		scale = max(1.0, np.abs(expected).max())
+		self.assertTrue(np.abs(result - expected).max() <= TOLERANCE * scale, "largest difference " + str(np.abs(result - expected).max()))
+
+	# Feed the trades to two indicators created by create, one by one and in
+	# batches of the given sizes, and compare the values after every trade
+	def checkBatches(self, create, value, sizes):
+		(times, prices) = trades()
+		expected_indicator = create()
+		expected = updateValues(expected_indicator, times, prices, value)
+
+		indicator = create()
+		result = []
+		start = 0
+		i = 0
+		while (start < len(times)):
+			end = min(start + sizes[i % len(sizes)], len(times))
+			if (end - start == 1):
+				# Single datapoints between the batches
+				result.append(updateValues(indicator, times[start:end], prices[start:end], value))
+			else:
+				result.append(indicator.UpdateMany(times[start:end], prices[start:end]))
+			start = end
+			i += 1
+		self.assertSeries(np.concatenate(result), expected)
+		self.assertAlmostEqual(getattr(indicator, value), getattr(expected_indicator, value), places = 9)
+		self.assertEqual(indicator.IsAccurate(), expected_indicator.IsAccurate())
+		if (expected_indicator._data != None):
+			self.assertEqual(len(indicator._data), len(expected_indicator._data))
+			self.assertEqual(list(indicator._data.Column(0)), list(expected_indicator._data.Column(0)))
+
+	# Batches much shorter than the window, one datapoint batches, and batches
+	# spanning the window several times
+	def checkIndicator(self, create, value = "Value"):
+		for sizes in ([7, 1, 13], [1], [50, 1, 3], [400, 1, 1000], [len(trades()[0])]):
+			self.checkBatches(create, value, sizes)
+
+	def testSimpleMovingAverage(self):
+		self.checkIndicator(lambda: SimpleMovingAverage(WINDOW))
+
+	def testExponentialMovingAverage(self):
+		self.checkIndicator(lambda: ExponentialMovingAverage(WINDOW))
+
+	def testTimeExponentialMovingAverage(self):
+		self.checkIndicator(lambda: TimeExponentialMovingAverage(WINDOW))
+
+	def testTimeMin(self):
+		self.checkIndicator(lambda: TimeMin(WINDOW), "Min")
+
+	def testTimeMax(self):
+		self.checkIndicator(lambda: TimeMax(WINDOW), "Max")
+
+	def testMovingVariance(self):
+		self.checkIndicator(lambda: MovingVariance(WINDOW))
+
+	# Unsorted timestamps are replayed one at a time
+	def testUnsortedBatch(self):
+		(times, prices) = trades()
+		times = times[:300].copy()
+		times[100] = times[150]
+		for create in (lambda: SimpleMovingAverage(WINDOW), lambda: ExponentialMovingAverage(WINDOW), lambda: MovingVariance(WINDOW)):
+			self.assertSeries(create().UpdateMany(times, prices[:300]), updateValues(create(), times, prices[:300], "Value"))
+
+if __name__ == "__main__":
+	unittest.main()
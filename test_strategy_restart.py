@@ -0,0 +1,173 @@
+import os
+import math
+import pickle
+import datetime
+import shutil
+import tempfile
+import unittest
+from exchange_connection import MockExchangeConnection
+from indicator.ringbuffer import TIME, VALUE
+from indicator.ma import SimpleMovingAverage, ExponentialMovingAverage
+from strategy_logic_volume_trend_follower import StrategyLogicVolumeTrendFollower
+from strategy_logic_simple_trend_follower import StrategyLogicSimpleTrendFollower
+from strategy_logic_trailing_stoploss import StrategyLogicTrailingStoploss
+
+"""
+	A live bot saves its state when it is unloaded and restores it when it
+	starts again. The restored strategy logic has to go on updating its
+	indicators with the new trades.
+
+	Usage:
+		python -m unittest test_strategy_restart
+"""
+
+# A trade every so many seconds
+TRADE_INTERVAL = 10.0
+
+# Give an indicator the layout pickled by the first versions: the window as a
+# list of {"now", "value"} dicts, the timestamps as datetime
+def toBaselineLayout(indicator):
+	state = indicator.__dict__
+	times = indicator._data.Column(TIME)
+	values = indicator._data.Column(VALUE)
+	state["_data"] = [{"now":times[i], "value":values[i]} for i in range(len(times))]
+	for name in ("_current_timestamp", "_window_start_timestamp", "_oldest_datapoint_timestamp"):
+		state[name] = datetime.datetime.fromtimestamp(state[name])
+	for name in ("_window", "_buckets", "_candidates", "_appended", "_evicted"):
+		if (name in state):
+			del state[name]
+
+# Save the state of a strategy logic the way the first versions did
+def saveBaseline(score, indicators, filename):
+	for name in indicators:
+		toBaselineLayout(getattr(score, name))
+	state = score.__dict__.copy()
+	del state["xcon"]
+	state["_debugData"] = {}
+	f = open(filename, "wb")
+	pickle.dump(state, f, 2)
+	f.close()
+
+class VolumeTrendFollowerRestartTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.filename = os.path.join(self.directory, "strategy_logic_volume_trend_follower.pickle")
+		self.now = 1383264000.0
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	# Feed a trade every TRADE_INTERVAL seconds for minutes, the way the live bot does
+	def feedTrades(self, score, minutes):
+		for i in range(int(minutes * 60 / TRADE_INTERVAL)):
+			self.now += TRADE_INTERVAL
+			score.UpdateVolume({"now":self.now, "value":1.0, "price":200.0})
+			score.UpdatePrice({"now":self.now, "value":200.0})
+
+	def testVolumeBarsAfterRestart(self):
+		score = StrategyLogicVolumeTrendFollower(MockExchangeConnection(), self.filename)
+		self.feedTrades(score, 5)
+		bars = len(score.volume_sma_slow._data)
+		self.assertTrue(bars > 0)
+		score.Save()
+
+		# strategy_volume_trend_follower.py loads the state again after the construction
+		restarted = StrategyLogicVolumeTrendFollower(MockExchangeConnection(), self.filename)
+		restarted.Load()
+		self.assertEqual(len(restarted.volume_sma_slow._data), bars)
+		self.feedTrades(restarted, 5)
+		self.assertEqual(len(restarted.volume_sma_slow._data), bars + 5)
+
+	# The live bot updates the volume before the price
+	def testVolumeBarsPrice(self):
+		score = StrategyLogicVolumeTrendFollower(MockExchangeConnection(), self.filename)
+		self.feedTrades(score, 1)
+		self.now += TRADE_INTERVAL
+		score.UpdateVolume({"now":self.now, "value":1.0, "price":210.0})
+		score.UpdatePrice({"now":self.now, "value":210.0})
+		bar = score.volume_candles.Current(score.Volume_TimeSum_Time * 60)
+		self.assertEqual(bar["close"], 210.0)
+		self.assertEqual(bar["high"], 210.0)
+
+# The state saved by the first versions is restored by the current ones
+class BaselinePickleTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.filename = os.path.join(self.directory, "strategy.pickle")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	# Feed a price every TRADE_INTERVAL seconds from the trade number start on
+	def feedPrices(self, score, start, count):
+		for i in range(start, start + count):
+			score.UpdatePrice({"now":1383264000.0 + i * TRADE_INTERVAL, "value":200.0 + 10.0 * math.sin(i / 7.0)})
+
+	# Restore the state saved after half of the prices, feed the other half and
+	# compare the indicators with the ones of a strategy logic fed all the prices.
+	# indicators maps the name of every indicator to the name of its value
+	def checkRestored(self, create, indicators):
+		score = create(self.filename)
+		reference = create(os.path.join(self.directory, "reference.pickle"))
+		self.feedPrices(score, 0, 360)
+		self.feedPrices(reference, 0, 720)
+		saveBaseline(score, indicators, self.filename)
+
+		restored = create(self.filename)
+		self.feedPrices(restored, 360, 360)
+		for name, value in indicators.items():
+			self.assertAlmostEqual(getattr(getattr(restored, name), value), getattr(getattr(reference, name), value), places = 9)
+			self.assertEqual(getattr(restored, name).IsAccurate(), getattr(reference, name).IsAccurate())
+			self.assertEqual(len(getattr(restored, name)._data), len(getattr(reference, name)._data))
+
+	def testSimpleTrendFollower(self):
+		def create(filename):
+			score = StrategyLogicSimpleTrendFollower(MockExchangeConnection(), filename)
+			if (len(score.price_ema_fast._data) == 0):
+				# Windows shorter than the prices fed, for the datapoints to be evicted
+				(score.Price_Fast_EMA_Time, score.Price_Slow_EMA_Time, score.Price_LongTerm_EMA_Time) = (5, 10, 20)
+				score.CreateIndicators()
+			return score
+		self.checkRestored(create, {"price_ema_fast":"Value", "price_ema_slow":"Value", "price_ema_longterm":"Value"})
+
+	def testTrailingStoploss(self):
+		scores = []
+		def create(filename):
+			score = StrategyLogicTrailingStoploss(MockExchangeConnection(), filename)
+			if (len(score.price_trailing_max._data) == 0):
+				score.Price_Max_Time = 20
+				score.CreateIndicators()
+			scores.append(score)
+			return score
+		self.checkRestored(create, {"price_ema_fast":"Value", "price_trailing_max":"Max"})
+		# The strategy logic saves its state when it is deleted
+		del scores[:]
+
+	# The first versions kept standalone price averages instead of an IndicatorBank
+	def testVolumeTrendFollower(self):
+		score = StrategyLogicVolumeTrendFollower(MockExchangeConnection(), self.filename)
+		score.price_sma_slow = SimpleMovingAverage(datetime.timedelta(minutes = score.Price_Slow_SMA_Time))
+		score.price_ema_fast = ExponentialMovingAverage(datetime.timedelta(minutes = score.Price_Fast_EMA_Time))
+		score.price_ema_longterm = ExponentialMovingAverage(datetime.timedelta(minutes = score.Price_LongTerm_EMA_Time))
+		del score.price_bank
+		del score.volume_candles
+		score.current_volume_timesum = None
+		for i in range(360):
+			data = {"now":1383264000.0 + i * TRADE_INTERVAL, "value":200.0 + 10.0 * math.sin(i / 7.0)}
+			for indicator in (score.price_sma_slow, score.price_ema_fast, score.price_ema_longterm):
+				indicator.Update(data)
+		saveBaseline(score, ["price_sma_slow", "price_ema_fast", "price_ema_longterm", "volume_sma_slow", "volume_ema_fast"], self.filename)
+
+		restored = StrategyLogicVolumeTrendFollower(MockExchangeConnection(), self.filename)
+		reference = StrategyLogicVolumeTrendFollower(MockExchangeConnection(), os.path.join(self.directory, "reference.pickle"))
+		self.feedPrices(restored, 360, 360)
+		self.feedPrices(reference, 0, 720)
+		# The long term window holds all the prices, the rebuilt bank lost none of them
+		for name in ("price_sma_slow", "price_ema_fast", "price_ema_longterm"):
+			self.assertAlmostEqual(getattr(restored, name).Value, getattr(reference, name).Value, places = 9)
+			self.assertEqual(getattr(restored, name).IsAccurate(), getattr(reference, name).IsAccurate())
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import numpy as np
+from indicator.timeminmax import TimeMin, TimeMax
+
+"""
+	TimeMin and TimeMax keep the candidates for the extreme of their window
+	in a monotonic deque. They have to give the minimum and the maximum of
+	all the datapoints in the window, searched one by one.
+
+	Usage:
+		python -m unittest test_timeminmax
+"""
+
+# Window of the indicators, in seconds
+WINDOW = 10.0
+
+# Length of the buckets of the bucketed mode, in seconds
+BUCKET = 3.0
+
+# Datapoints kept by the window of a MovingAverage after every update: the
+# oldest one is removed when it is older than the window start, at most one per update
+def datapointWindows(times, values, window):
+	stored = []
+	for i in range(len(times)):
+		outdated = ( len(stored) > 0 and stored[0][0] < times[i] - window )
+		stored.append((times[i], values[i]))
+		if (outdated):
+			stored.pop(0)
+		yield [value for (now, value) in stored]
+
+# Datapoints kept by a bucketed window after every update: the ones of the
+# buckets that did not end before the window start
+def bucketWindows(times, values, window, bucket):
+	for i in range(len(times)):
+		start = times[i] - window
+		yield [values[j] for j in range(i + 1) if times[j] - times[j] % bucket + bucket > start]
+
+# Trades with many equal prices, at whole seconds so that datapoints are
+# often exactly at the window start
+def trades(seed = 1, count = 2000):
+	random = np.random.RandomState(seed)
+	times = 1383264000.0 + np.cumsum(random.randint(0, 4, count)).astype(float)
+	values = random.randint(0, 6, count).astype(float)
+	return (times.tolist(), values.tolist())
+
+class TimeMinMaxTest(unittest.TestCase):
+
+	# Compare Min and Max after every update with the extremes of the windows
+	def checkExtremes(self, times, values, windows, bucket = None):
+		minimum = TimeMin(WINDOW, bucket)
+		maximum = TimeMax(WINDOW, bucket)
+		for (i, window) in enumerate(windows):
+			minimum.UpdateValue(times[i], values[i])
+			maximum.UpdateValue(times[i], values[i])
+			self.assertEqual(minimum.Min, min(window))
+			self.assertEqual(maximum.Max, max(window))
+
+	def testRandomTrades(self):
+		for seed in range(5):
+			(times, values) = trades(seed)
+			self.checkExtremes(times, values, datapointWindows(times, values, WINDOW))
+
+	# The longest deques: every new datapoint is a candidate, none is dropped
+	def testMonotonicTrades(self):
+		times = [1383264000.0 + i for i in range(100)]
+		for values in (range(100), range(100, 0, -1)):
+			values = [float(value) for value in values]
+			self.checkExtremes(times, values, datapointWindows(times, values, WINDOW))
+
+	# A datapoint exactly at the window start stays, it is evicted once it is older
+	def testWindowEdge(self):
+		minimum = TimeMin(WINDOW)
+		maximum = TimeMax(WINDOW)
+		for (now, value, low, high) in [(0.0, 1.0, 1.0, 1.0), (10.0, 5.0, 1.0, 5.0), (20.0, 3.0, 3.0, 5.0), (30.0, 4.0, 3.0, 4.0)]:
+			minimum.UpdateValue(1383264000.0 + now, value)
+			maximum.UpdateValue(1383264000.0 + now, value)
+			self.assertEqual(minimum.Min, low)
+			self.assertEqual(maximum.Max, high)
+
+	# Evicting one of several equal extremes keeps the extreme
+	def testEqualValues(self):
+		minimum = TimeMin(WINDOW)
+		maximum = TimeMax(WINDOW)
+		for (now, value, low, high) in [(0.0, 2.0, 2.0, 2.0), (5.0, 2.0, 2.0, 2.0), (11.0, 3.0, 2.0, 3.0), (16.0, 3.0, 3.0, 3.0), (17.0, 1.0, 1.0, 3.0)]:
+			minimum.UpdateValue(1383264000.0 + now, value)
+			maximum.UpdateValue(1383264000.0 + now, value)
+			self.assertEqual(minimum.Min, low)
+			self.assertEqual(maximum.Max, high)
+
+	def testBucketedTrades(self):
+		for seed in range(5):
+			(times, values) = trades(seed)
+			self.checkExtremes(times, values, bucketWindows(times, values, WINDOW, BUCKET), BUCKET)
+
+if __name__ == "__main__":
+	unittest.main()
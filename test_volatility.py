@@ -0,0 +1,100 @@
+import math
+import unittest
+import numpy as np
+from indicator.volatility import MovingVariance, BollingerBands
+
+"""
+	MovingVariance updates the sum of squared differences from the mean
+	Welford style when a datapoint is added or replaces the outdated one,
+	and UpdateMany computes it from shifted sums of squares. Both have to
+	give the variance of the datapoints in the window, as numpy.var, and
+	never a negative one.
+
+	Usage:
+		python -m unittest test_volatility
+"""
+
+# Window of the indicators, in seconds
+WINDOW = 60.0
+
+# Difference allowed from numpy, relative to the variance of the window
+TOLERANCE = 1e-9
+
+# Difference allowed from the variance of count prices given by numpy, which
+# rounds their mean too: a constant price gets a variance up to (count * epsilon * price)^2
+def allowed(variance, mean, count, tolerance):
+	return tolerance * variance + ( count * np.finfo(float).eps * mean ) ** 2
+
+# Datapoints kept by the window of a MovingAverage after every update: the
+# oldest one is removed when it is older than the window start, at most one per update
+def datapointWindows(times, values, window):
+	stored = []
+	for i in range(len(times)):
+		outdated = ( len(stored) > 0 and stored[0][0] < times[i] - window )
+		stored.append((times[i], values[i]))
+		if (outdated):
+			stored.pop(0)
+		yield [value for (now, value) in stored]
+
+# Trades every few seconds, the prices a random walk around level
+def trades(seed = 1, count = 3000, level = 200.0, step = 0.5):
+	random = np.random.RandomState(seed)
+	times = 1383264000.0 + np.cumsum(random.uniform(0.0, 3.0, count))
+	prices = level + np.cumsum(random.normal(0.0, step, count))
+	return (times.tolist(), prices.tolist())
+
+class MovingVarianceTest(unittest.TestCase):
+
+	# Compare the statistics after every update, one by one and in a batch, with numpy
+	def checkVariance(self, times, prices, tolerance = TOLERANCE):
+		single = MovingVariance(WINDOW)
+		bands = BollingerBands(WINDOW, 2.5)
+		variances = []
+		means = []
+		counts = []
+		for (i, window) in enumerate(datapointWindows(times, prices, WINDOW)):
+			single.UpdateValue(times[i], prices[i])
+			bands.UpdateValue(times[i], prices[i])
+			variances.append(np.var(window))
+			means.append(np.mean(window))
+			counts.append(len(window))
+			self.assertTrue(single.Variance >= 0.0)
+			self.assertTrue(abs(single.Variance - variances[-1]) <= allowed(variances[-1], means[-1], counts[-1], tolerance), "variance " + str(single.Variance) + " instead of " + str(variances[-1]))
+			self.assertTrue(abs(single.Mean - means[-1]) <= TOLERANCE * abs(means[-1]))
+			self.assertAlmostEqual(single.StandardDeviation, math.sqrt(single.Variance))
+			self.assertEqual(bands.Middle, single.Mean)
+			self.assertAlmostEqual(bands.Upper, single.Mean + 2.5 * single.StandardDeviation)
+			self.assertAlmostEqual(bands.Lower, single.Mean - 2.5 * single.StandardDeviation)
+
+		variances = np.array(variances)
+		batch = MovingVariance(WINDOW).UpdateMany(times, prices)
+		self.assertTrue(np.all(batch >= 0.0))
+		self.assertTrue(np.all(np.abs(batch - variances) <= allowed(variances, np.array(means), np.array(counts), tolerance)))
+		rows = BollingerBands(WINDOW, 2.5).UpdateMany(times, prices)
+		self.assertTrue(np.all(rows[:, 0] <= rows[:, 1]) and np.all(rows[:, 1] <= rows[:, 2]))
+
+	def testRandomWalk(self):
+		for seed in range(3):
+			self.checkVariance(*trades(seed))
+
+	# Small moves of a large price, where the sums of squares lose the most digits.
+	# The rounding errors of the updates must not add up over a long run.
+	def testLargePrices(self):
+		(times, prices) = trades(1, 20000, level = 1000000.0, step = 0.01)
+		self.checkVariance(times, prices, 1e-6)
+
+	# The rounding errors of a constant price must not make the variance negative
+	def testConstantPrice(self):
+		for price in (0.1, 200.0, 812.3456789):
+			(times, prices) = trades(2, 1000)
+			prices = [price] * len(times)
+			self.checkVariance(times, prices)
+			indicator = MovingVariance(WINDOW)
+			for i in range(len(times)):
+				indicator.UpdateValue(times[i], prices[i])
+				self.assertTrue(indicator.Variance >= 0.0)
+				self.assertTrue(indicator.Variance < 1e-20)
+			self.assertEqual(indicator.Mean, price)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import numpy as np
+
+"""
+	Columnar cache of the recorded MtGox trades.
+	The trades table of mtgox.sqlite3 is exported once per currency into
+	one .npy file per column, sorted by date:
+		mtgox.cache/USD/date.npy
+		mtgox.cache/USD/price.npy
+		mtgox.cache/USD/amount.npy
+		mtgox.cache/USD/tid.npy
+		mtgox.cache/USD/info.json
+	Readers memory-map the files and find a date range with a binary search
+	over the sorted dates, so loading a range does not touch sqlite nor
+	convert any rows. Processes reading the same cache share the pages
+	through the operating system file cache.
+
+	Usage:
+		python trade_cache.py mtgoxdata/mtgox.sqlite3
+"""
+
+# Name and type of the cached columns, in the order they are selected
+COLUMNS = (("date", "float64"), ("price", "float64"), ("amount", "float64"), ("tid", "int64"))
+
+# Rows fetched from sqlite, and trades yielded by TradeCache.Trades(), at once
+BATCH_SIZE = 100000
+
+# Default location of the cache of a database: mtgox.sqlite3 -> mtgox.cache
+def cacheDirectory(sqliteDataFile):
+	return os.path.splitext(sqliteDataFile)[0] + ".cache"
+
+# Size and modification time of the database and of its write ahead log.
+# The cache is up to date as long as they did not change.
+def sourceFingerprint(sqliteDataFile):
+	fingerprint = []
+	for filename in (sqliteDataFile, sqliteDataFile + "-wal"):
+		if (os.path.exists(filename)):
+			stat = os.stat(filename)
+			fingerprint.append([os.path.basename(filename), stat.st_size, stat.st_mtime])
+	return fingerprint
+
+# Export the trades of the given currencies (all of them by default) into the cache.
+# Currencies with an up to date cache are skipped unless force is set.
+# Returns the list of the exported currencies.
+def buildCache(sqliteDataFile, directory = None, currencies = None, force = False):
+	if (directory == None):
+		directory = cacheDirectory(sqliteDataFile)
+	fingerprint = sourceFingerprint(sqliteDataFile)
+
+	db = sqlite3.connect(sqliteDataFile)
+	try:
+		if (currencies == None):
+			currencies = [row[0] for row in db.execute("select distinct currency from trades")]
+
+		built = []
+		for currency in currencies:
+			target = os.path.join(directory, currency)
+			if ( (not force) and _isFresh(target, fingerprint) ):
+				continue
+			_exportCurrency(db, currency, target, fingerprint)
+			built.append(currency)
+		return built
+	finally:
+		db.close()
+
+def _isFresh(target, fingerprint):
+	try:
+		f = open(os.path.join(target, "info.json"), "r")
+		info = json.load(f)
+		f.close()
+	except (IOError, ValueError):
+		return False
+	return info["source"] == fingerprint
+
+def _exportCurrency(db, currency, target, fingerprint):
+	from numpy.lib.format import open_memmap
+
+	(count,) = db.execute("select count(*) from trades where currency=?", (currency,)).fetchone()
+
+	# Write next to the old cache and swap at the end, readers never see a partial cache
+	temporary = target + ".tmp"
+	if (os.path.exists(temporary)):
+		shutil.rmtree(temporary)
+	os.makedirs(temporary)
+
+	columns = []
+	for (name, dtype) in COLUMNS:
+		filename = os.path.join(temporary, name + ".npy")
+		if (count == 0):
+			np.save(filename, np.empty(0, dtype = dtype))
+			columns.append(None)
+		else:
+			columns.append(open_memmap(filename, mode = "w+", dtype = dtype, shape = (count,)))
+
+	position = 0
+	max_tid = 0
+	if (count > 0):
+		cursor = db.cursor()
+		cursor.execute("select date,price,amount,tid from trades where currency=? order by date,tid", (currency,))
+		while True:
+			rows = cursor.fetchmany(BATCH_SIZE)
+			if (not rows):
+				break
+			# tids are microsecond timestamps, exact in a float64
+			batch = np.array(rows, dtype = "float64")
+			end = position + len(batch)
+			for i in range(len(columns)):
+				columns[i][position:end] = batch[:, i]
+			position = end
+		cursor.close()
+		for column in columns:
+			column.flush()
+		max_tid = int(columns[3].max())
+	del columns
+
+	info = {}
+	info["currency"] = currency
+	info["rows"] = position
+	info["max_tid"] = max_tid
+	info["source"] = fingerprint
+	info["built"] = time.time()
+	f = open(os.path.join(temporary, "info.json"), "w")
+	json.dump(info, f)
+	f.close()
+
+	if (os.path.exists(target)):
+		shutil.rmtree(target)
+	os.rename(temporary, target)
+
+# The cached trades of one currency, memory-mapped read only
+class TradeCache:
+
+	def __init__(self, directory, currency = "USD"):
+		path = os.path.join(directory, currency)
+		f = open(os.path.join(path, "info.json"), "r")
+		self.Info = json.load(f)
+		f.close()
+		self.Currency = currency
+		self.Dates = self._load(path, "date")
+		self.Prices = self._load(path, "price")
+		self.Amounts = self._load(path, "amount")
+		self.Tids = self._load(path, "tid")
+
+	def __len__(self):
+		return len(self.Dates)
+
+	# True if the database did not change since the cache was built
+	def IsFresh(self, sqliteDataFile):
+		return self.Info["source"] == sourceFingerprint(sqliteDataFile)
+
+	# Index range [first, last) of the trades with date_from <= date < date_to,
+	# the same trades as selected from sqlite by the backtests
+	def Range(self, date_from, date_to):
+		first = int(np.searchsorted(self.Dates, date_from, side = "left"))
+		last = int(np.searchsorted(self.Dates, date_to, side = "left"))
+		return (first, max(first, last))
+
+	# Memory-mapped (dates, prices, amounts) of the trades between date_from and date_to
+	def Slice(self, date_from, date_to):
+		(first, last) = self.Range(date_from, date_to)
+		return (self.Dates[first:last], self.Prices[first:last], self.Amounts[first:last])
+
+	# Bars of seconds of the trades between date_from and date_to, see compressArrays()
+	def Bars(self, date_from, date_to, seconds):
+		(dates, prices, amounts) = self.Slice(date_from, date_to)
+		return compressArrays(dates, prices, amounts, seconds)
+
+	# Yields (date, price, amount) of the trades between date_from and date_to, ordered by date
+	def Trades(self, date_from, date_to, batch_size = BATCH_SIZE):
+		(first, last) = self.Range(date_from, date_to)
+		for start in xrange(first, last, batch_size):
+			end = min(start + batch_size, last)
+			for row in zip(self.Dates[start:end].tolist(), self.Prices[start:end].tolist(), self.Amounts[start:end].tolist()):
+				yield row
+
+	def _load(self, path, name):
+		if (self.Info["rows"] == 0):
+			# An empty file can not be memory-mapped
+			return np.load(os.path.join(path, name + ".npy"))
+		return np.load(os.path.join(path, name + ".npy"), mmap_mode = "r")
+
+# Bars of the trades sorted by date, cut at multiples of seconds (UTC):
+# (dates, closes, volumes), the date and the price of the last trade of a bar and the sum of its amounts
+def compressArrays(dates, prices, amounts, seconds):
+	if (len(dates) == 0):
+		return (np.array(dates), np.array(prices), np.array(amounts))
+	bars = np.floor(np.asarray(dates) / seconds)
+	lasts = np.flatnonzero(np.diff(bars))
+	ends = np.append(lasts, len(dates) - 1)
+	starts = np.concatenate(([0], lasts + 1))
+	return (np.asarray(dates)[ends], np.asarray(prices)[ends], np.add.reduceat(np.asarray(amounts), starts))
+
+# The cache of a currency next to the database, None if it was not built or is out of date
+def openCache(sqliteDataFile, currency = "USD"):
+	directory = cacheDirectory(sqliteDataFile)
+	if (not os.path.exists(os.path.join(directory, currency, "info.json"))):
+		return None
+	cache = TradeCache(directory, currency)
+	if (not cache.IsFresh(sqliteDataFile)):
+		return None
+	return cache
+
+def main():
+	parser = argparse.ArgumentParser(description = "Export the recorded MtGox trades into a memory-mapped columnar cache")
+	parser.add_argument('database', nargs = "?", default = "mtgoxdata/mtgox.sqlite3")
+	parser.add_argument('-o', '--output', default = None, help = "cache directory, next to the database by default")
+	parser.add_argument('-c', '--currency', action = "append", default = None, help = "currency to export, all of them by default")
+	parser.add_argument('-f', '--force', action = "store_true", help = "rebuild even if the cache is up to date")
+	args = parser.parse_args()
+
+	started = time.time()
+	built = buildCache(args.database, args.output, args.currency, args.force)
+	if (len(built) == 0):
+		print "The cache is up to date"
+	else:
+		print "Exported " + ", ".join(built) + " in " + ("%.1f" % (time.time() - started)) + "s"
+
+if __name__ == "__main__":
+	main()
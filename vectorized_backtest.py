@@ -0,0 +1,260 @@
+import time
+import argparse
+import numpy as np
+import backtest
+import metrics
+from exchange_connection import MockExchangeConnection
+
+"""
+	Vectorized backtest of the moving average crossover strategy logics.
+	StrategyLogicSimpleTrendFollower and StrategyLogicSimpleMeanReversion
+	decide on three moving averages of the price and on whether they hold
+	BTC or USD. So the moving averages are computed over the whole price
+	array at once, the buy and sell signals are array comparisons, and only
+	the orders are simulated one by one, with the fee arithmetic of
+	MockExchangeConnection. The moving averages are cached by indicator type
+	and window, scoring many thresholds costs little more than scoring one.
+	With --features, they are read from the feature store (feature_store.py).
+
+	The orders are the same as with the event driven replay of backtest.py,
+	up to the rounding of the vectorized moving averages.
+
+	Usage:
+		python vectorized_backtest.py simple_mean_reversion -p MinimumSpreadBuy=0.04 --check
+"""
+
+# Signals of a strategy logic, given its moving averages after every trade:
+# returns the (buy, sell) boolean arrays
+def trendFollowerSignals(score, fast, slow, longterm):
+	# IsDownTrend
+	sell = (fast <= slow) & (fast <= longterm) & (slow <= longterm)
+	# IsUpTrend
+	ma_diff_min = fast * score.MinimumSpread
+	buy = ((fast - slow) >= ma_diff_min) & ((fast - longterm) >= ma_diff_min) & ((slow - longterm) >= ma_diff_min)
+	return (buy, sell)
+
+def meanReversionSignals(score, fast, slow, longterm):
+	# ShouldBuy
+	ma_diff_min = longterm * score.MinimumSpreadBuy
+	buy = ((slow - fast) >= ma_diff_min) & ((longterm - slow) >= ma_diff_min)
+	# ShouldSell
+	ma_diff_min = fast * score.MinimumSpreadSell
+	sell = ((fast - slow) >= ma_diff_min) & ((slow - longterm) >= ma_diff_min)
+	return (buy, sell)
+
+# Strategy logic class name: signals
+SIGNALS = {
+	"StrategyLogicSimpleTrendFollower": trendFollowerSignals,
+	"StrategyLogicSimpleMeanReversion": meanReversionSignals,
+}
+
+# Trades between two orders are searched for the next signal in chunks of growing size
+FIRST_CHUNK = 4096
+
+# The prices of a date range, and the moving averages computed over them
+class VectorizedBacktest:
+
+	# With features (a feature_store.FeatureStore), the moving averages it holds
+	# are read from it, the dates and prices have to be consecutive trades of it
+	def __init__(self, dates, prices, features = None):
+		self.Dates = np.asarray(dates, dtype = float)
+		self.Prices = np.asarray(prices, dtype = float)
+		self.Features = features
+		# (indicator class, window in seconds): (values, accurate)
+		self._series = {}
+
+	# Values and IsAccurate() of an indicator after every trade.
+	# Only the type and the window of the indicator matter, it is not updated.
+	def Series(self, indicator):
+		key = (indicator.__class__, indicator._window)
+		if (key not in self._series and self.Features != None):
+			stored = self.Features.Series(indicator, self.Dates)
+			if (stored != None):
+				self._series[key] = stored
+		if (key not in self._series):
+			fresh = indicator.__class__(indicator.TimeWindow)
+			accurate = fresh.AccuracyMany(self.Dates)
+			values = fresh.UpdateMany(self.Dates, self.Prices)
+			self._series[key] = (values, accurate)
+		return self._series[key]
+
+	# Score a strategy logic, with its constants and the types and windows of its indicators.
+	# Returns the same results as backtest.runBacktest(), plus the list of orders and the metrics.
+	def Run(self, score, xcon = None):
+		name = score.__class__.__name__
+		if (name not in SIGNALS):
+			raise ValueError(name + " can not be backtested vectorized")
+		if (xcon == None):
+			xcon = MockExchangeConnection()
+
+		started = time.time()
+		(fast, fast_accurate) = self.Series(score.price_ema_fast)
+		(slow, slow_accurate) = self.Series(score.price_ema_slow)
+		(longterm, longterm_accurate) = self.Series(score.price_ema_longterm)
+		(buy, sell) = SIGNALS[name](score, fast, slow, longterm)
+		ready = slow_accurate & longterm_accurate
+		buy &= ready
+		sell &= ready
+
+		orders = simulateOrders(self.Dates, self.Prices, buy, sell, xcon)
+		elapsed = time.time() - started
+
+		result = {}
+		result["trades"] = len(self.Prices)
+		result["seconds"] = elapsed
+		result["trades_per_second"] = len(self.Prices) / elapsed if elapsed > 0 else 0.0
+		result["date_from"] = float(self.Dates[0]) if len(self.Dates) > 0 else 9999999999999
+		result["date_to"] = float(self.Dates[-1]) if len(self.Dates) > 0 else 0
+		result["btc"] = xcon.AvailableBTC()
+		result["usd"] = xcon.AvailableUSD()
+		result["equity"] = xcon.Equity()
+		result["orders"] = xcon.orders
+		result["max_drawdown"] = xcon.maxDrawdown
+		result["order_list"] = orders
+		result.update(metrics.backtestMetrics(xcon, self.Dates, self.Prices))
+		return result
+
+# Execute the orders of the signals on xcon, exactly as the strategy logics do
+# in Act(): sell everything on a sell signal while holding BTC, buy for all the
+# USD on a buy signal while holding USD. Between two orders the wallet does not
+# change, so the next order is found with array operations. The peak equity and
+# the drawdown of xcon are updated as if SetBTCPrice was called for every trade.
+# Returns the list of orders, a dict per order.
+def simulateOrders(dates, prices, buy, sell, xcon):
+	orders = []
+	count = len(prices)
+	position = 0
+	while (position < count):
+		btc = xcon.AvailableBTC()
+		usd = xcon.AvailableUSD()
+
+		# Find the next trade with an order, looking further every time
+		chunk = FIRST_CHUNK
+		found = -1
+		start = position
+		while (start < count):
+			end = min(start + chunk, count)
+			value = btc * prices[start:end]
+			orders_mask = ( (value > usd) & sell[start:end] ) | ( (value < usd) & buy[start:end] )
+			hits = np.flatnonzero(orders_mask)
+			if (len(hits) > 0):
+				found = start + int(hits[0])
+				break
+			start = end
+			chunk *= 2
+
+		end = count if found < 0 else found + 1
+		_trackEquity(xcon, btc, usd, dates[position:end], prices[position:end])
+		if (found < 0):
+			break
+
+		price = float(prices[found])
+		if (btc * price > usd):
+			xcon.SellBTC(btc)
+			side = "sell"
+		else:
+			xcon.BuyBTC(usd / price)
+			side = "buy"
+		orders.append({"now":float(dates[found]), "side":side, "price":price, "btc":xcon.AvailableBTC(), "usd":xcon.AvailableUSD()})
+		position = found + 1
+	return orders
+
+# Same bookkeeping as MockExchangeConnection.SetBTCPrice() over a range of prices,
+# with a wallet that does not change
+def _trackEquity(xcon, btc, usd, dates, prices):
+	if (len(prices) == 0):
+		return
+	equity = usd + btc * prices
+	peak = np.maximum.accumulate(np.concatenate(([xcon.peakEquity], equity)))[1:]
+	if (peak[-1] > 0.0):
+		drawdown = (peak - equity) / np.where(peak > 0.0, peak, 1.0)
+		xcon.maxDrawdown = max(xcon.maxDrawdown, float(drawdown.max()))
+	xcon.peakEquity = float(peak[-1])
+	xcon.SetBTCPrice(float(prices[-1]), float(dates[-1]))
+
+# The orders made by the event driven replay
+class RecordingExchangeConnection(MockExchangeConnection):
+	def __init__(self):
+		MockExchangeConnection.__init__(self)
+		self.order_list = []
+	def SellBTC(self, amount):
+		orders = self.orders
+		MockExchangeConnection.SellBTC(self, amount)
+		self._record(orders, "sell")
+	def BuyBTC(self, amount):
+		orders = self.orders
+		MockExchangeConnection.BuyBTC(self, amount)
+		self._record(orders, "buy")
+	def _record(self, orders, side):
+		if (self.orders > orders):
+			self.order_list.append({"side":side, "price":self.currentPrice, "btc":self.availableBTC, "usd":self.availableUSD})
+
+# Load the prices of a date range, from the trade cache when it is up to date
+def loadPrices(sqliteDataFile, date_from, date_to, currency = "USD"):
+	try:
+		import trade_cache
+		cache = trade_cache.openCache(sqliteDataFile, currency)
+	except ImportError:
+		cache = None
+	if (cache != None):
+		(dates, prices, amounts) = cache.Slice(date_from, date_to)
+		return (np.array(dates), np.array(prices))
+	dates = []
+	prices = []
+	for (date, price, volume) in backtest.streamTrades(sqliteDataFile, date_from, date_to, currency):
+		dates.append(date)
+		prices.append(price)
+	return (np.array(dates, dtype = float), np.array(prices, dtype = float))
+
+# Compare two lists of orders, returns the index of the first difference or None
+def compareOrders(orders, expected, tolerance = 1e-9):
+	for i in range(max(len(orders), len(expected))):
+		if (i >= len(orders) or i >= len(expected)):
+			return i
+		if (orders[i]["side"] != expected[i]["side"]):
+			return i
+		for key in ("price", "btc", "usd"):
+			if (abs(orders[i][key] - expected[i][key]) > tolerance * max(1.0, abs(expected[i][key]))):
+				return i
+	return None
+
+def main():
+	parser = argparse.ArgumentParser(description = "Vectorized backtest of the moving average crossover strategy logics")
+	parser.add_argument('strategy', choices = ["simple_trend_follower", "simple_mean_reversion"])
+	parser.add_argument('-f', '--from', dest = "date_from", default = "2013 Nov 1 00:00", help = "start date, e.g. \"2013 Nov 1 00:00\" (UTC)")
+	parser.add_argument('-t', '--to', dest = "date_to", default = "2013 Nov 30 00:00", help = "end date (UTC)")
+	parser.add_argument('-p', '--param', action = "append", type = backtest.parseParam, default = [], help = "override a constant of the strategy logic, Name=value")
+	parser.add_argument('-d', '--database', default = "mtgoxdata/mtgox.sqlite3")
+	parser.add_argument('-c', '--currency', default = "USD")
+	parser.add_argument('--check', action = "store_true", help = "also run the event driven replay and compare the orders")
+	parser.add_argument('--features', action = "store_true", help = "read the moving averages from the feature store (feature_store.py)")
+	args = parser.parse_args()
+
+	features = None
+	if (args.features):
+		import feature_store
+		features = feature_store.openFeatures(args.database, args.currency)
+		if (features == None):
+			parser.error("the feature store is missing or out of date, run: python feature_store.py " + args.database)
+
+	date_from = backtest.parseDate(args.date_from)
+	date_to = backtest.parseDate(args.date_to)
+	(dates, prices) = loadPrices(args.database, date_from, date_to, args.currency)
+	score = backtest.createStrategy(args.strategy, MockExchangeConnection(), dict(args.param))
+	result = VectorizedBacktest(dates, prices, features).Run(score)
+	backtest.printResult(result)
+
+	if (args.check):
+		xcon = RecordingExchangeConnection()
+		score = backtest.createStrategy(args.strategy, xcon, dict(args.param))
+		expected = backtest.runBacktest(score, args.database, date_from, date_to, args.currency, features = features)
+		print "Event driven replay:"
+		backtest.printResult(expected)
+		difference = compareOrders(result["order_list"], xcon.order_list)
+		if (difference == None):
+			print "Same " + str(len(xcon.order_list)) + " orders"
+		else:
+			print "Orders differ from order " + str(difference)
+
+if __name__ == "__main__":
+	main()
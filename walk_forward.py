@@ -0,0 +1,237 @@
+import os
+import sys
+import math
+import time
+import datetime
+import argparse
+import multiprocessing
+import backtest
+from checkpoint import warmState
+from indicator.base import toSeconds
+from exchange_connection import MockExchangeConnection
+
+"""
+	Walk-forward backtest of a strategy logic over a process pool.
+	The date range is cut at midnights (UTC) into segments, and every
+	segment is backtested by its own process. Before its first trade, the
+	indicators of a segment are warmed up with the trades before it, during
+	the longest time window of the indicators plus WARMUP_MARGIN, so they
+	are accurate from the start like in a continuous run (exactly for the
+	windowed indicators, the exponential moving averages only converge:
+	warm up over several windows with --warmup-windows).
+
+	A continuous run enters every segment holding BTC or USD, with the
+	state (last order prices, ...) the strategy logic got from its orders
+	before. So after the warm-up of the indicators, every segment but the
+	first replays the --carry hours of trades before it with Act(), on a
+	shadow MockExchangeConnection, and starts with the funds of a new
+	MockExchangeConnection held in BTC and USD in the same proportions as
+	the shadow ones. The state matches the one of a continuous run if the
+	continuous run made an order during those hours, or was flat.
+	The segments are stitched together by chaining their returns: the
+	equity curve of a segment is scaled so that it starts where the
+	previous one ended. --check runs the continuous backtest too, with the
+	same warm-up, and compares the orders and the equity. The constants of
+	the strategy logic can be given per segment, refitted on the trades
+	before it (walk-forward optimization).
+
+	Usage:
+		python walk_forward.py simple_trend_follower -f "2013 Oct 1 00:00" -t "2013 Dec 1 00:00" -k 8
+"""
+
+# Warm-up added to the longest time window, so the indicators are accurate from the first trade
+WARMUP_MARGIN = 3600
+
+# Equity of a segment is sampled every so many seconds
+EQUITY_SAMPLE_INTERVAL = 3600
+
+# Hours of trades replayed with Act() before a segment to carry the state of the strategy logic
+DEFAULT_CARRY = 48
+
+# Longest time window of the indicators of a strategy logic, in seconds
+def longestWindow(score):
+	longest = 0.0
+	for indicator in warmState(score).values():
+		if (hasattr(indicator, "TimeWindow")):
+			longest = max(longest, toSeconds(indicator.TimeWindow))
+	return longest
+
+# Seconds of trades to warm up the indicators of a strategy logic with
+def warmupFor(score, windows = 1.0):
+	return windows * longestWindow(score) + WARMUP_MARGIN
+
+# Cut the date range into about segments (date_from, date_to) ranges, at multiples of interval.
+# Like all the date ranges of the trades, a segment includes date_from but not date_to,
+# so every trade belongs to exactly one segment.
+def splitRange(date_from, date_to, segments, interval = backtest.WARMUP_INTERVAL):
+	edges = [date_from]
+	for i in range(1, segments):
+		edge = math.floor((date_from + i * (date_to - date_from) / segments) / interval) * interval
+		if (edge > edges[-1] and edge < date_to):
+			edges.append(edge)
+	edges.append(date_to)
+	return [(edges[i], edges[i + 1]) for i in range(len(edges) - 1)]
+
+# Yields the trades, appending (date, equity) to curve after a trade every interval seconds and after the last one
+def sampleEquity(trades, xcon, curve, interval = EQUITY_SAMPLE_INTERVAL):
+	next_sample = None
+	last = None
+	for trade in trades:
+		yield trade
+		last = trade[0]
+		if (next_sample == None or last >= next_sample):
+			curve.append((last, xcon.Equity()))
+			next_sample = last + interval
+	if (last != None and curve[-1][0] != last):
+		curve.append((last, xcon.Equity()))
+
+# Feed the trades to the strategy logic, acting on a shadow exchange connection,
+# so that it gets the state of a continuous run. Returns a new MockExchangeConnection,
+# now used by the strategy logic, with the funds of a new one held in BTC and USD
+# in the same proportions as the shadow ones after the last trade.
+def carryState(score, trades):
+	shadow = MockExchangeConnection()
+	initial = shadow.Equity()
+	score.xcon = shadow
+	backtest.replayTrades(score, trades)
+	price = shadow.currentPrice
+	equity = shadow.Equity()
+	held = shadow.AvailableBTC() * price / equity if equity > 0.0 else 0.0
+	xcon = MockExchangeConnection(initial * held / price, initial * (1.0 - held), price)
+	xcon.currentTime = shadow.currentTime
+	score.xcon = xcon
+	return xcon
+
+def _initWorker():
+	# The strategy logics print every order in debug mode
+	sys.stdout = open(os.devnull, "w")
+
+# Backtest one segment, runs in a worker process
+def evaluateSegment(task):
+	(strategy, params, database, date_from, date_to, currency, warmup_windows, checkpoints, carry) = task
+	xcon = MockExchangeConnection()
+	score = backtest.createStrategy(strategy, xcon, params)
+	warmup = warmupFor(score, warmup_windows)
+	checkpoints = backtest.createCheckpoints(database, checkpoints, checkpoints != None)
+
+	started = time.time()
+	# The warm-up ends where the carried trades start, and those end where the segment starts
+	backtest.warmUp(score, database, date_from - carry, warmup, currency, checkpoints = checkpoints)
+	if (carry > 0):
+		xcon = carryState(score, backtest.loadTrades(database, date_from - carry, date_from, currency))
+	initial = xcon.Equity()
+	curve = []
+	(count, actual_date_from, actual_date_to) = backtest.replayTrades(score, sampleEquity(backtest.loadTrades(database, date_from, date_to, currency), xcon, curve))
+	result = backtest.backtestResult(score, count, actual_date_from, actual_date_to, time.time() - started)
+	result["segment"] = (date_from, date_to)
+	result["params"] = params
+	result["warmup"] = warmup
+	result["carry"] = carry
+	result["initial_equity"] = initial
+	result["equity_curve"] = curve
+	return result
+
+# Chain the returns of the segments, returns the stitched result
+def stitchSegments(results, initial_equity):
+	equity = initial_equity
+	peak = initial_equity
+	max_drawdown = 0.0
+	curve = []
+	for result in results:
+		scale = equity / result["initial_equity"]
+		for (date, value) in result["equity_curve"]:
+			value *= scale
+			curve.append((date, value))
+			peak = max(peak, value)
+			if (peak > 0.0):
+				max_drawdown = max(max_drawdown, (peak - value) / peak)
+		equity = result["equity"] * scale
+		# The drawdown inside a segment is known between the samples too
+		max_drawdown = max(max_drawdown, result["max_drawdown"])
+
+	stitched = {}
+	stitched["segments"] = len(results)
+	stitched["trades"] = sum([result["trades"] for result in results])
+	stitched["orders"] = sum([result["orders"] for result in results])
+	stitched["initial_equity"] = initial_equity
+	stitched["equity"] = equity
+	stitched["max_drawdown"] = max_drawdown
+	stitched["equity_curve"] = curve
+	return stitched
+
+# Backtest the segments of the date range in parallel and stitch them together.
+# params is a dict of constants for all the segments, or a list of one dict per segment.
+# Every segment but the first carries the state of the strategy logic over the carry
+# seconds before it, see carryState(). Returns (stitched result, list of the results of the segments)
+def runWalkForward(strategy, database, date_from, date_to, segments, params = None, currency = "USD", processes = None, warmup_windows = 1.0, checkpoints = None, carry = DEFAULT_CARRY * 3600):
+	ranges = splitRange(date_from, date_to, segments)
+	if (not isinstance(params, list)):
+		params = [params or {}] * len(ranges)
+	if (len(params) != len(ranges)):
+		raise ValueError("expected the constants of " + str(len(ranges)) + " segments, got " + str(len(params)))
+	tasks = [(strategy, params[i], database, ranges[i][0], ranges[i][1], currency, warmup_windows, checkpoints, carry if i > 0 else 0) for i in range(len(ranges))]
+
+	if (processes == None):
+		processes = multiprocessing.cpu_count()
+	pool = multiprocessing.Pool(min(processes, len(tasks)), _initWorker)
+	try:
+		results = pool.map(evaluateSegment, tasks)
+		pool.close()
+	except KeyboardInterrupt:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+
+	initial_equity = MockExchangeConnection().Equity()
+	return (stitchSegments(results, initial_equity), results)
+
+# The continuous backtest of the date range, with the warm-up of the first segment
+def runContinuous(strategy, database, date_from, date_to, params = None, currency = "USD", warmup_windows = 1.0, checkpoints = None):
+	score = backtest.createStrategy(strategy, MockExchangeConnection(), params)
+	checkpoints = backtest.createCheckpoints(database, checkpoints, checkpoints != None)
+	stdout = sys.stdout
+	sys.stdout = open(os.devnull, "w")
+	try:
+		return backtest.runBacktest(score, database, date_from, date_to, currency, warmup = warmupFor(score, warmup_windows), checkpoints = checkpoints)
+	finally:
+		sys.stdout.close()
+		sys.stdout = stdout
+
+def printWalkForward(stitched, results):
+	print "%-18s %-18s %10s %8s %13s %14s %10s" % ("From", "To", "Trades", "Orders", "Max drawdown", "Return", "Seconds")
+	for result in results:
+		(date_from, date_to) = result["segment"]
+		print "%-18s %-18s %10d %8d %12.2f%% %13.2f%% %10.1f" % (datetime.datetime.utcfromtimestamp(date_from).strftime(backtest.DATE_FORMAT), datetime.datetime.utcfromtimestamp(date_to).strftime(backtest.DATE_FORMAT), result["trades"], result["orders"], result["max_drawdown"] * 100, (result["equity"] / result["initial_equity"] - 1.0) * 100, result["seconds"])
+	print "Segments: " + str(stitched["segments"]) + " trades: " + str(stitched["trades"]) + " orders: " + str(stitched["orders"]) + " max drawdown: " + ("%.2f" % (stitched["max_drawdown"] * 100)) + "%"
+	print "Stitched equity. From: " + str(stitched["initial_equity"]) + " USD to: " + str(stitched["equity"]) + " USD"
+
+def main():
+	parser = argparse.ArgumentParser(description = "Walk-forward backtest of a strategy logic over a process pool")
+	parser.add_argument('strategy', choices = sorted(backtest.STRATEGIES.keys()))
+	parser.add_argument('-f', '--from', dest = "date_from", default = "2013 Nov 1 00:00", help = "start date, e.g. \"2013 Nov 1 00:00\" (UTC)")
+	parser.add_argument('-t', '--to', dest = "date_to", default = "2013 Nov 30 00:00", help = "end date (UTC)")
+	parser.add_argument('-k', '--segments', type = int, default = multiprocessing.cpu_count(), help = "number of segments, the number of cores by default")
+	parser.add_argument('-p', '--param', action = "append", type = backtest.parseParam, default = [], help = "override a constant of the strategy logic, Name=value")
+	parser.add_argument('-d', '--database', default = "mtgoxdata/mtgox.sqlite3")
+	parser.add_argument('-c', '--currency', default = "USD")
+	parser.add_argument('-j', '--processes', type = int, default = None, help = "size of the pool, the number of cores by default")
+	parser.add_argument('--warmup-windows', type = float, default = 1.0, help = "warm up over this many times the longest indicator window")
+	parser.add_argument('--checkpoints', default = None, help = "directory of the warm-up checkpoints, none by default")
+	parser.add_argument('--carry', type = float, default = DEFAULT_CARRY, help = "hours of trades replayed with orders before a segment to carry the state of the strategy logic")
+	parser.add_argument('--check', action = "store_true", help = "also run the continuous backtest of the range and compare")
+	args = parser.parse_args()
+
+	date_from = backtest.parseDate(args.date_from)
+	date_to = backtest.parseDate(args.date_to)
+	(stitched, results) = runWalkForward(args.strategy, args.database, date_from, date_to, args.segments, dict(args.param), args.currency, args.processes, args.warmup_windows, args.checkpoints, args.carry * 3600)
+	printWalkForward(stitched, results)
+
+	if (args.check):
+		expected = runContinuous(args.strategy, args.database, date_from, date_to, dict(args.param), args.currency, args.warmup_windows, args.checkpoints)
+		print "Continuous backtest. orders: " + str(expected["orders"]) + " max drawdown: " + ("%.2f" % (expected["max_drawdown"] * 100)) + "% equity: " + str(expected["equity"]) + " USD"
+		error = (stitched["equity"] - expected["equity"]) / expected["equity"] if expected["equity"] > 0.0 else 0.0
+		print "Stitched equity error: " + ("%.2f" % (error * 100)) + "%, orders difference: " + str(stitched["orders"] - expected["orders"])
+
+if __name__ == "__main__":
+	main()